@@ -70,8 +70,10 @@ def getlogger(name=__name__):
     import types
 
     logger_instance = logging.getLogger(name)
-    # Add nullhandler to prevent exceptions in python 2.6
-    logger_instance.addHandler(logging.NullHandler())
+    # Add nullhandler to prevent exceptions in python 2.6.  Loggers are shared,
+    # so only add it the first time, or every new device would add another.
+    if not any(isinstance(x, logging.NullHandler) for x in logger_instance.handlers):
+        logger_instance.addHandler(logging.NullHandler())
     # Add convenience methods for logging
     logger_instance.debug1 = types.MethodType(
         lambda inst, msg, *args, **kwargs: inst.log(DEBUG1, msg, *args, **kwargs),
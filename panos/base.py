@@ -22,13 +22,16 @@ import collections
 import copy
 import datetime
 import hashlib
+import importlib
 import inspect
 import itertools
+import mmap
 import re
 import sys
 import time
 import xml.dom.minidom as minidom
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from xml.sax.saxutils import escape as xml_escape
 
 import pan.commit
@@ -77,6 +80,105 @@ Root = panos.enum("DEVICE", "VSYS", "MGTCONFIG", "PANORAMA", "PANORAMA_VSYS")
 
 
 # PanObject type
+def _childtype_class(child_type_string):
+    """Return the class of a ``CHILDTYPES`` entry, such as "objects.Tag"."""
+    module_name, class_name = child_type_string.split(".")
+    module = importlib.import_module("panos." + module_name)
+    return getattr(module, class_name)
+
+
+def _clone(prototype):
+    """A new object of the prototype's class, with the default param values
+
+    Building the params, xpaths, and stubs of a versioned object is most of
+    the cost of creating it.  These are the same for every object of a class,
+    so they are shared with the prototype, except for the param values.
+
+    """
+    obj = object.__new__(type(prototype))
+    attrs = obj.__dict__
+    # _xpaths and _stubs are shared with the prototype, not copied: they are
+    # only written to by _setup(), which the clone doesn't run.
+    attrs.update(prototype.__dict__)
+    params = []
+    for param in getattr(prototype, "_params", ()):
+        param_copy = object.__new__(VersionedParamPath)
+        param_copy.__dict__.update(param.__dict__)
+        params.append(param_copy)
+    attrs["_params"] = tuple(params)
+    attrs["parent"] = None
+    attrs["children"] = []
+    obj._setup_opstate()
+    return obj
+
+
+def _device_job_result(device):
+    """Return the result of one device of a commit-all job as a dict.
+
+    Args:
+        device (dict): A ``devices/entry`` of ``show jobs id`` as returned
+            by :meth:`pan.config.PanConfig.python`
+
+    """
+    result = {
+        "success": True if device["result"] == "OK" else False,
+        "serial": device["serial-no"],
+        "name": device.get("devicename"),
+        "result": device["result"],
+        "starttime": device.get("tstart"),
+        "endtime": device.get("tfin"),
+    }
+    # Errors and warnings might not have a full structure.  If it is just a string, then
+    # a TypeError will be produced, so in that case, just grab the string.
+    try:
+        result["warnings"] = device["details"]["msg"]["warnings"]["line"]
+    except (TypeError, KeyError):
+        try:
+            result["warnings"] = device["details"]["msg"]["warnings"]
+        except (TypeError, KeyError):
+            result["warnings"] = ""
+    try:
+        result["messages"] = device["details"]["msg"]["errors"]["line"]
+    except (TypeError, KeyError):
+        result["messages"] = device.get("details")
+
+    return result
+
+
+def _job_value(job, tag):
+    """Return a field of a job as :meth:`pan.config.PanConfig.python` would."""
+    elm = job.find(tag)
+    if elm is None:
+        return None
+    if len(elm) or elm.attrib:
+        return PanConfig(elm).python()[tag]
+    return elm.text
+
+
+def _read_config_file(path, chunk_size=1 << 20):
+    """Parse a configuration file and return its ``config`` element."""
+    parser = ET.XMLParser()
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be memory mapped.
+            raise ValueError("Empty configuration file: {0}".format(path))
+        try:
+            for offset in range(0, len(data), chunk_size):
+                parser.feed(data[offset : offset + chunk_size])
+        finally:
+            data.close()
+    root = parser.close()
+
+    if root.tag != "config":
+        root = root.find(".//config")
+        if root is None:
+            raise ValueError("No config element in {0}".format(path))
+
+    return root
+
+
 class PanObject(object):
     """Base class for all package objects
 
@@ -1034,24 +1136,7 @@ class PanObject(object):
 
         # Check for children in the remaining XML
         for child_type_string in self.CHILDTYPES:
-            module_name, class_name = child_type_string.split(".")
-            if module_name == "device":
-                import panos.device
-            elif module_name == "firewall":
-                import panos.firewall
-            elif module_name == "ha":
-                import panos.ha
-            elif module_name == "network":
-                import panos.network
-            elif module_name == "objects":
-                import panos.objects
-            elif module_name == "panorama":
-                import panos.panorama
-            elif module_name == "policies":
-                import panos.policies
-            elif module_name == "plugins":
-                import panos.plugins
-            child = getattr(getattr(panos, module_name), class_name)()
+            child = _childtype_class(child_type_string)()
 
             # Versioned objects need a PanDevice to get the version from, so
             # set the child's parent before accessing XPATH.
@@ -1064,6 +1149,117 @@ class PanObject(object):
 
         return self.children
 
+    def _route_config(self, xml, xpath, config, max_workers=1, sections=None):
+        """Build the children of this object from a full configuration.
+
+        The XML of each type in ``CHILDTYPES`` is found at the xpath of that
+        type: relative to this object's own XML when the xpath is inside of
+        it, and from the root of the configuration otherwise.  Children of
+        the new objects are built the same way.
+
+        A child whose subtree also holds the XML of one of this object's own
+        types is left without children, so that each object is only built
+        once.  This happens with the vsys of a firewall, whose objects are
+        children of the firewall itself.
+
+        Args:
+            xml (xml.etree.ElementTree): The XML of this object.
+            xpath (str): The xpath of this object.
+            config (xml.etree.ElementTree): The ``config`` element.
+            max_workers (int): Number of child types to parse concurrently.
+            sections (dict): If given, the children of a type are reused
+                from it when the XML of the type has not changed, and the
+                digest of the XML and the children of each type are saved
+                in it.
+
+        Returns:
+            list: The new children, not yet added to this object.
+
+        """
+        probes = []
+        for child_type_string in self.CHILDTYPES:
+            child = _childtype_class(child_type_string)()
+            # Versioned objects need a PanDevice to get the version from, so
+            # set the child's parent before accessing XPATH.
+            child.parent = self
+            probes.append((child, child.xpath_nosuffix()))
+        paths = [x[1] for x in probes]
+
+        def route(probe):
+            child, path = probe
+            if path.startswith(xpath + "/"):
+                elm = xml.find(path[len(xpath) + 1 :])
+            elif path.startswith("/config/"):
+                elm = config.find(path[len("/config/") :])
+            else:
+                elm = None
+            if elm is None:
+                return None, []
+
+            imports = self._config_imports(child, config)
+            digest = None
+            if sections is not None:
+                digest = hashlib.sha1(ET.tostring(elm))
+                if imports is not None:
+                    digest.update(" ".join(sorted(imports)).encode("utf-8"))
+                digest = digest.hexdigest()
+                saved = sections.get((type(child), path))
+                if saved is not None and saved[0] == digest:
+                    return digest, saved[1]
+
+            instances = child.refreshall_from_xml(elm, refresh_children=False)
+            if isinstance(child, PanDevice):
+                return digest, instances
+            if child.SUFFIX is None:
+                pairs = list(zip(instances, [elm]))
+            else:
+                lasttag = re.match(r"^/(\w*?)\[", child.SUFFIX).group(1)
+                pairs = list(zip(instances, elm.findall(lasttag)))
+
+            if imports is not None:
+                pairs = [x for x in pairs if x[0].uid in imports]
+
+            for instance, sub in pairs:
+                if not instance.CHILDTYPES:
+                    continue
+                instance_xpath = instance.xpath()
+                if any(x.startswith(instance_xpath + "/") for x in paths):
+                    continue
+                instance.extend(instance._route_config(sub, instance_xpath, config))
+
+            return digest, [x[0] for x in pairs]
+
+        if max_workers is not None and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(route, probes))
+        else:
+            results = [route(x) for x in probes]
+
+        if sections is not None:
+            sections.clear()
+            for (child, path), (digest, instances) in zip(probes, results):
+                if digest is not None:
+                    sections[(type(child), path)] = (digest, instances)
+
+        return list(itertools.chain.from_iterable(x[1] for x in results))
+
+    def _config_imports(self, child, config):
+        """Names imported into this vsys for the child's type, or None.
+
+        Mirrors the filtering done by :meth:`VsysOperations.refreshall`.
+
+        """
+        if (
+            self.vsys == "shared"
+            or self.vsys is None
+            or getattr(child, "XPATH_IMPORT", None) is None
+        ):
+            return None
+        elm = config.find(child.xpath_import_base()[len("/config/") :])
+        if elm is None:
+            return set()
+        return set(x.text for x in elm.iter("member"))
+
     def _refresh_xml(self, running_config, exceptions, refresh_children=True):
         """Get the XML for a single PanObject."""
         # Get the root of the xml to parse
@@ -3756,6 +3952,9 @@ class PanDevice(PanObject):
         self._version_info = None
         self.content_version = None
         self.platform = None
+        # Config version and section digests of the last full refresh
+        self._config_version = None
+        self._config_sections = None
 
         # HA Pair Firewall or Panorama
         self._ha_peer = None
@@ -4373,6 +4572,180 @@ class PanDevice(PanObject):
         self.version = system_info[0]
         return self.version
 
+    @classmethod
+    def from_config_file(cls, path, version=None, max_workers=1, **kwargs):
+        """Build a device and its whole configuration tree from a saved file
+
+        The file is a configuration exported from a firewall or Panorama,
+        or the response of a config API call that has the ``config`` element
+        in it.  The file is memory mapped and fed to the XML parser a chunk
+        at a time, so it's never held in memory as one string, then the tree
+        is built as in :meth:`refresh_full_config`.  No API calls are made.
+
+        Example::
+
+            fw = Firewall.from_config_file("running-config.xml", "10.1.0")
+            rules = fw.findall(Rulebase)[0].children
+
+        Args:
+            path (str): Path of the configuration file
+            version (str): The PAN-OS version to parse the configuration for,
+                such as "10.1.0" (Default: the ``version`` attribute of the
+                ``config`` element)
+            max_workers (int): Number of top level sections of the
+                configuration to parse concurrently
+            **kwargs: Passed to the constructor.  If there is no ``hostname``,
+                the hostname in the configuration is used.
+
+        Returns:
+            The new device
+
+        """
+        config = _read_config_file(path)
+        if version is None:
+            version = config.get("version")
+        if not version:
+            raise ValueError("No PAN-OS version given or found in {0}".format(path))
+        if "hostname" not in kwargs:
+            kwargs["hostname"] = config.findtext(
+                "devices/entry/deviceconfig/system/hostname"
+            )
+
+        device = cls(**kwargs)
+        device._set_version_and_version_info(version)
+        device.refresh_full_config(xml=config, max_workers=max_workers)
+
+        return device
+
+    def refresh_full_config(self, running_config=False, xml=None, max_workers=1):
+        """Refresh the whole configuration tree with a single API call
+
+        The complete configuration is retrieved at once, then each part of
+        it is given to the class in ``CHILDTYPES`` whose xpath it is at, and
+        so on down the tree.  The result is the same tree that calling
+        ``refreshall`` for every class, vsys, and device group would build,
+        but with one API call instead of hundreds.
+
+        NOTE: This removes all current children of this device.
+
+        Args:
+            running_config (bool): Set to True to refresh from the running
+                configuration (Default: False)
+            xml (xml.etree.ElementTree): The ``config`` element of a
+                configuration to use instead of refreshing from the live
+                device
+            max_workers (int): Number of top level sections of the
+                configuration to parse concurrently
+
+        Returns:
+            list: The new children of this device
+
+        """
+        if xml is None:
+            xml = self._full_config(running_config)
+        elif xml.tag != "config":
+            raise ValueError("xml must be the config element")
+
+        sections = {}
+        children = self._route_config(xml, "/config", xml, max_workers, sections)
+        self.removeall()
+        self.extend(children)
+        self._config_version = None
+        self._config_sections = sections
+
+        return children
+
+    def refresh_incremental(self, running_config=False, max_workers=1):
+        """Refresh the configuration tree, rebuilding only what changed
+
+        Without an earlier full refresh, this does the same as
+        :meth:`refresh_full_config`.  Otherwise it first compares the config
+        audit info of the device with that of the last incremental refresh,
+        and when nothing was committed since, returns without any more API
+        calls.  Otherwise the configuration is retrieved, and only the types
+        of objects whose XML changed are built again; the objects of the
+        other types are kept as they are.
+
+        When refreshing the candidate configuration while it has uncommitted
+        changes, the configuration is always retrieved.
+
+        NOTE: Changes made to the objects of a type that did not change on
+        the device are kept, since those objects are not built again.
+
+        Args:
+            running_config (bool): Set to True to refresh from the running
+                configuration (Default: False)
+            max_workers (int): Number of top level sections of the
+                configuration to parse concurrently
+
+        Returns:
+            list: The children of this device that were built again
+
+        """
+        version = self._config_version_token(running_config)
+        if self._config_sections is None:
+            children = self.refresh_full_config(running_config, max_workers=max_workers)
+            self._config_version = version
+            return children
+
+        if version is not None and version == self._config_version:
+            self._logger.debug("Config version unchanged, nothing to refresh")
+            return []
+
+        xml = self._full_config(running_config)
+        previous = set(
+            id(x) for _, instances in self._config_sections.values() for x in instances
+        )
+        children = self._route_config(
+            xml, "/config", xml, max_workers, self._config_sections
+        )
+        self.removeall()
+        self.extend(children)
+        self._config_version = version
+
+        rebuilt = [x for x in children if id(x) not in previous]
+        self._logger.debug(
+            "Rebuilt {0} of {1} children".format(len(rebuilt), len(children))
+        )
+        return rebuilt
+
+    def _full_config(self, running_config):
+        """Return the ``config`` element of the live device."""
+        api_action = self.xapi.show if running_config else self.xapi.get
+        root = api_action("/config", retry_on_peer=self.HA_SYNC)
+        xml = root.find("./result/config")
+        if xml is None:
+            raise err.PanDeviceError("No config in returned XML", pan_device=self)
+        return xml
+
+    def _config_version_token(self, running_config):
+        """Return a token that changes with every commit, or None if unknown.
+
+        The token is a digest of ``show config audit info``, which lists the
+        saved configuration versions.  The candidate configuration has no
+        version while it has uncommitted changes, so None is returned then.
+
+        """
+        try:
+            if not running_config:
+                root = self.xapi.op(
+                    cmd="check pending-changes",
+                    cmd_xml=True,
+                    retry_on_peer=self.HA_SYNC,
+                )
+                if root.findtext("./result") != "no":
+                    return None
+            root = self.xapi.op(
+                cmd="show config audit info", cmd_xml=True, retry_on_peer=self.HA_SYNC
+            )
+        except (pan.xapi.PanXapiError, err.PanDeviceXapiError) as e:
+            self._logger.debug("Can't get config version: {0}".format(e))
+            return None
+        result = root.find("./result")
+        if result is None:
+            return None
+        return hashlib.sha1(ET.tostring(result)).hexdigest()
+
     def set_hostname(self, hostname):
         """Set the device hostname
 
@@ -5030,13 +5403,15 @@ class PanDevice(PanObject):
                     )
                 return result
 
-    def syncjob(self, job_id, sync_all=False, interval=0.5):
+    def syncjob(self, job_id, sync_all=False, interval=0.5, keep_xml=True):
         """Block until job completes and return result
 
         Args:
             job_id (int): job ID, or response XML from job creation
             sync_all (bool): Wait for all devices to complete if commit all operation
             interval (float): Interval in seconds to check if job is complete
+            keep_xml (bool): Include the last ``show jobs id`` response as
+                "xml" in the result
 
         Returns:
             dict: Job result
@@ -5106,12 +5481,18 @@ class PanDevice(PanObject):
                         device_commits_finished = False
                         break  # One device isn't finished, so stop checking others
                 if device_results and device_commits_finished:
-                    return self._parse_job_results(job_xml, get_devices=True)
+                    return self._parse_job_results(
+                        job_xml, get_devices=True, keep_xml=keep_xml
+                    )
                 elif not device_results:
-                    return self._parse_job_results(job_xml, get_devices=False)
+                    return self._parse_job_results(
+                        job_xml, get_devices=False, keep_xml=keep_xml
+                    )
             elif status.text == "FIN":
                 # Job completed, parse the results
-                return self._parse_job_results(job_xml, get_devices=False)
+                return self._parse_job_results(
+                    job_xml, get_devices=False, keep_xml=keep_xml
+                )
 
             logger.debug("Job %s status %s" % (job, status.text))
 
@@ -5205,61 +5586,43 @@ class PanDevice(PanObject):
             self._logger.debug("Sleep %.2f seconds" % interval)
             time.sleep(interval)
 
-    def _parse_job_results(self, show_job_xml, get_devices=True):
-        # Parse the final results
-        pconf = PanConfig(show_job_xml)
-        job_response = pconf.python()
-        try:
-            job = job_response["response"]["result"]["job"]
-        except KeyError:
+    def _parse_job_results(self, show_job_xml, get_devices=True, keep_xml=True):
+        """Return the results of a finished job as a dict.
+
+        Only the parts of the XML that are in the results are read, and the
+        entry of each device of a commit-all job is converted on its own
+        instead of as part of the whole response.
+
+        Args:
+            show_job_xml (xml.etree.ElementTree): The response to
+                ``show jobs id``
+            get_devices (bool): Include the result of each device
+            keep_xml (bool): Include the response as "xml" in the results;
+                set to False to not keep large responses in memory
+
+        """
+        job = show_job_xml.find("./result/job")
+        if job is None:
             raise err.PanDeviceError("Can't get job results, error parsing results xml")
+
         devices_results = {}
         devices_success = True
         # Determine if this was a commit all job
         devices = show_job_xml.findall("./result/job/devices/entry")
         if devices and get_devices:
-            devices = job["devices"]["entry"]
             for device in devices:
-                dev_success = True if device["result"] == "OK" else False
-                if not dev_success:
+                entry = _device_job_result(PanConfig(device).python()["entry"])
+                if not entry["success"]:
                     devices_success = False
-                devices_results[device["serial-no"]] = {
-                    "success": dev_success,
-                    "serial": device["serial-no"],
-                    "name": device["devicename"],
-                    "result": device["result"],
-                    "starttime": device["tstart"],
-                    "endtime": device.get("tfin"),
-                }
-                # Errors and warnings might not have a full structure.  If it is just a string, then
-                # a TypeError will be produced, so in that case, just grab the string.
-                try:
-                    devices_results[device["serial-no"]]["warnings"] = device[
-                        "details"
-                    ]["msg"]["warnings"]["line"]
-                except (TypeError, KeyError) as e:
-                    try:
-                        devices_results[device["serial-no"]]["warnings"] = device[
-                            "details"
-                        ]["msg"]["warnings"]
-                    except (TypeError, KeyError) as e:
-                        devices_results[device["serial-no"]]["warnings"] = ""
-                except (TypeError, KeyError) as e:
-                    devices_results[device["serial-no"]]["warnings"] = ""
-                try:
-                    devices_results[device["serial-no"]]["messages"] = device[
-                        "details"
-                    ]["msg"]["errors"]["line"]
-                except (TypeError, KeyError) as e:
-                    devices_results[device["serial-no"]]["messages"] = device["details"]
+                devices_results[entry["serial"]] = entry
 
-        success = True if job["result"] == "OK" and devices_success else False
+        result = _job_value(job, "result")
+        success = True if result == "OK" and devices_success else False
 
-        if get_devices:
-            messages = []
-        else:
+        messages = []
+        if not get_devices:
             try:
-                messages = job["details"]["line"]
+                messages = _job_value(job, "details")["line"]
             except (TypeError, KeyError):
                 messages = []
         if isstring(messages):
@@ -5267,15 +5630,15 @@ class PanDevice(PanObject):
         # Create the results dict
         result = {
             "success": success,
-            "result": job["result"],
-            "jobid": job["id"],
-            "user": job["user"],
-            "warnings": job["warnings"] if "warnings" in job else None,
-            "starttime": job["tenq"],
-            "endtime": job["tfin"],
+            "result": result,
+            "jobid": _job_value(job, "id"),
+            "user": _job_value(job, "user"),
+            "warnings": _job_value(job, "warnings"),
+            "starttime": _job_value(job, "tenq"),
+            "endtime": _job_value(job, "tfin"),
             "messages": messages,
             "devices": devices_results,
-            "xml": show_job_xml,
+            "xml": show_job_xml if keep_xml else None,
         }
         return result
 
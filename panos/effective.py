@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Effective configuration of Panorama device groups and template stacks"""
+
+from panos import getlogger, panorama
+from panos.base import VersionedPanObject, _clone
+from panos.refgraph import kind_of
+
+logger = getlogger(__name__)
+
+
+class HierarchyCache(object):
+    """Cached device group hierarchy of a Panorama
+
+    Device groups are given by name.  The parent of a top level device group
+    is ``None``, which stands for shared.
+
+    Args:
+        parents (dict): Device group name to the name of its parent, as
+            returned by :meth:`PanoramaDeviceGroupHierarchy.fetch`
+
+    """
+
+    def __init__(self, parents=None):
+        self.parents = {}
+        self._children = {}
+        self._ancestors = {}
+        for name, parent in (parents or {}).items():
+            self.set_parent(name, parent)
+
+    @classmethod
+    def fetch(cls, pano):
+        """Build the hierarchy from the live Panorama with one op command
+
+        Args:
+            pano (Panorama): The Panorama
+
+        Returns:
+            HierarchyCache
+
+        """
+        return cls(pano.opstate.dg_hierarchy.fetch())
+
+    @classmethod
+    def from_tree(cls, pano):
+        """Build the hierarchy from the device groups in the config tree
+
+        The parents are taken from ``opstate.dg_hierarchy.parent`` of each
+        :class:`panos.panorama.DeviceGroup`.
+
+        """
+        return cls(
+            dict(
+                (x.uid, x.opstate.dg_hierarchy.parent)
+                for x in pano.children
+                if isinstance(x, panorama.DeviceGroup)
+            )
+        )
+
+    def apply(self, pano):
+        """Set ``opstate.dg_hierarchy.parent`` of the device groups in the tree"""
+        for x in pano.children:
+            if isinstance(x, panorama.DeviceGroup):
+                x.opstate.dg_hierarchy.parent = self.parents.get(x.uid)
+
+    def parent(self, name):
+        """Return the name of the parent of a device group, or None"""
+        return self.parents.get(name)
+
+    def children(self, name):
+        """Return the names of the direct children of a device group
+
+        Use ``None`` for the top level device groups.
+
+        """
+        return list(self._children.get(name, ()))
+
+    def ancestors(self, name):
+        """Return the names of the ancestors of a device group, nearest first
+
+        Returns:
+            tuple
+
+        """
+        ans = self._ancestors.get(name)
+        if ans is None:
+            ans = []
+            seen = set([name])
+            parent = self.parents.get(name)
+            while parent is not None and parent not in seen:
+                seen.add(parent)
+                ans.append(parent)
+                parent = self.parents.get(parent)
+            ans = self._ancestors[name] = tuple(ans)
+        return ans
+
+    def descendants(self, name):
+        """Return the names of all the descendants of a device group"""
+        ans = []
+        seen = set([name])
+        nodes = [name]
+        while nodes:
+            for child in self._children.get(nodes.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    ans.append(child)
+                    nodes.append(child)
+        return ans
+
+    def set_parent(self, name, parent):
+        """Add a device group, or move it under another parent
+
+        Args:
+            name (str): The device group
+            parent (str): The new parent, or None for the top level
+
+        """
+        if name in self.parents:
+            self._children.get(self.parents[name], set()).discard(name)
+        # The device group may already have children even if it wasn't known
+        # itself, such as when it is added after them.
+        for x in [name] + self.descendants(name):
+            self._ancestors.pop(x, None)
+        self.parents[name] = parent
+        self._children.setdefault(parent, set()).add(name)
+
+    def remove(self, name):
+        """Remove a device group; its children move up to its parent"""
+        if name not in self.parents:
+            return
+        parent = self.parents[name]
+        for child in self.children(name):
+            self.set_parent(child, parent)
+        self.set_parent(name, None)
+        self._children[None].discard(name)
+        del self.parents[name]
+        self._ancestors.pop(name, None)
+
+
+class EffectiveObjects(object):
+    """Effective object namespaces of the device groups of a Panorama
+
+    Each device group sees its own objects, those of its ancestors, and the
+    shared objects of the Panorama.  When names clash, the object nearest to
+    the device group is used, unless ``ancestor_precedence`` is set, which is
+    the Panorama setting where ancestor objects take precedence.
+
+    Names are in namespaces such as "address" (address objects and address
+    groups) or "service", see :data:`panos.refgraph.KINDS`.  The effective
+    namespace of a device group is built on first use and cached, so lookups
+    after that are a dict lookup.  A device group with no objects of its own
+    shares the namespace of its parent.
+
+    After changing the objects of a device group in the tree, call
+    :meth:`update` with that device group; only it and its descendants are
+    rebuilt.
+
+    Example::
+
+        objects = EffectiveObjects(pano, HierarchyCache.fetch(pano))
+        web = objects.lookup("branch-1", "address", "web-servers")
+
+    Args:
+        pano (Panorama): The Panorama, with device groups and shared objects
+        hierarchy (HierarchyCache): The hierarchy of the device groups
+            (Default: built from the device groups in the tree)
+        ancestor_precedence (bool): Objects of ancestors override those of
+            descendants
+
+    """
+
+    def __init__(self, pano, hierarchy=None, ancestor_precedence=False):
+        self.pano = pano
+        if hierarchy is None:
+            hierarchy = HierarchyCache.from_tree(pano)
+        self.hierarchy = hierarchy
+        self.ancestor_precedence = ancestor_precedence
+        # Device group name (None for shared) => kind => {name: obj}
+        self._own = {}
+        self._effective = {}
+        self._index(None, pano)
+        for x in pano.children:
+            if isinstance(x, panorama.DeviceGroup):
+                self._index(x.uid, x)
+
+    def lookup(self, device_group, kind, name):
+        """Return the object a device group sees for a name, or None
+
+        Args:
+            device_group: The device group, its name, or None for shared
+            kind (str): The namespace, such as "address"
+            name (str): The name of the object
+
+        """
+        return self.namespace(device_group, kind).get(name)
+
+    def resolve(self, obj, kind, name):
+        """Return the object a name refers to, as seen from an object
+
+        Args:
+            obj (PanObject): The referring object, such as a security rule
+            kind (str): The namespace, such as "address"
+            name (str): The name
+
+        """
+        return self.lookup(obj.devicegroup(), kind, name)
+
+    def namespace(self, device_group, kind):
+        """Return the effective namespace of a device group
+
+        The returned dict is shared and must not be changed.
+
+        Args:
+            device_group: The device group, its name, or None for shared
+            kind (str): The namespace, such as "address"
+
+        Returns:
+            dict: Name to object
+
+        """
+        name = _name(device_group)
+        ans = self._effective.get(name, {}).get(kind)
+        if ans is not None:
+            return ans
+
+        # Build from the top down the namespaces not built yet.
+        chain = [name] + list(self.hierarchy.ancestors(name)) if name else []
+        inherited = self._effective.get(None, {}).get(kind)
+        if inherited is None:
+            inherited = self._own.get(None, {}).get(kind, {})
+            self._effective.setdefault(None, {})[kind] = inherited
+        for dg in reversed(chain):
+            ans = self._effective.get(dg, {}).get(kind)
+            if ans is None:
+                own = self._own.get(dg, {}).get(kind)
+                if not own:
+                    ans = inherited
+                elif self.ancestor_precedence:
+                    ans = dict(own)
+                    ans.update(inherited)
+                else:
+                    ans = dict(inherited)
+                    ans.update(own)
+                self._effective.setdefault(dg, {})[kind] = ans
+            inherited = ans
+
+        return inherited
+
+    def update(self, device_group):
+        """Reindex the objects of one device group after they changed
+
+        Adding or removing a device group from the tree is also handled;
+        to change its parent, use :meth:`move`.
+
+        Args:
+            device_group: The device group, its name, or None for shared
+
+        """
+        name = _name(device_group)
+        if name is None:
+            self._index(None, self.pano)
+            self._effective.clear()
+            return
+        found = None
+        for x in self.pano.children:
+            if isinstance(x, panorama.DeviceGroup) and x.uid == name:
+                found = x
+                break
+        if found is None:
+            self._own.pop(name, None)
+        else:
+            self._index(name, found)
+            if name not in self.hierarchy.parents:
+                self.hierarchy.set_parent(name, found.opstate.dg_hierarchy.parent)
+        self._invalidate(name)
+
+    def move(self, device_group, parent):
+        """Change the parent of a device group
+
+        Args:
+            device_group: The device group or its name
+            parent: The new parent or its name, or None for the top level
+
+        """
+        name = _name(device_group)
+        self.hierarchy.set_parent(name, _name(parent))
+        self._invalidate(name)
+
+    def _invalidate(self, name):
+        for x in [name] + self.hierarchy.descendants(name):
+            self._effective.pop(x, None)
+
+    def _index(self, name, container):
+        own = {}
+        for child in container.children:
+            kind = kind_of(child)
+            if kind is not None:
+                own.setdefault(kind, {})[child.uid] = child
+        self._own[name] = own
+
+
+class EffectiveTemplates(object):
+    """Effective configuration of the template stacks of a Panorama
+
+    The configuration a firewall gets from a template stack is the merge of
+    the configuration of the stack itself and of its templates.  The stack
+    comes first, then the templates in the order they are listed in the
+    stack, and the first one that sets a param wins.  Template variables are
+    merged the same way, and params that are set to a variable, such as
+    ``$mgmt-ip``, get its value.  Only values that are exactly a variable
+    name are replaced; a variable inside a longer value, such as
+    ``$mgmt-ip/24``, is left as is.
+
+    The merged configuration of a stack is built on first use and cached,
+    without any API calls.  After changing a template or a stack in the tree,
+    call :meth:`update` with it; only the stacks it is part of are rebuilt.
+
+    Example::
+
+        templates = EffectiveTemplates(pano)
+        for stack in pano.findall(TemplateStack):
+            if templates.missing_variables(stack):
+                print("{0} has undefined variables".format(stack.name))
+
+    Args:
+        pano (Panorama): The Panorama, with its templates and template stacks
+
+    """
+
+    def __init__(self, pano):
+        self.pano = pano
+        self._templates = {}
+        # Stack name => (stack, names of its templates)
+        self._stacks = {}
+        # Template name => names of the stacks that use it.
+        self._members = {}
+        # Stack name => (config, variables, missing variables)
+        self._cache = {}
+        self._prototypes = {}
+        for x in pano.children:
+            if isinstance(x, panorama.Template):
+                self._templates[x.uid] = x
+            elif isinstance(x, panorama.TemplateStack):
+                self._add_stack(x)
+
+    def config(self, stack, variables=None):
+        """Return the effective configuration of a template stack
+
+        The configuration is a new :class:`panos.panorama.TemplateStack`,
+        not part of the tree, whose children are the merged objects.  Unless
+        ``variables`` is given it is cached and shared, so it must not be
+        changed.
+
+        Args:
+            stack: The template stack or its name
+            variables (dict): Variable values that override those of the
+                stack and its templates, such as the values for one firewall
+
+        Returns:
+            TemplateStack
+
+        """
+        return self._resolve(stack, variables)[0]
+
+    def variables(self, stack):
+        """Return the effective variables of a template stack
+
+        Args:
+            stack: The template stack or its name
+
+        Returns:
+            dict: Variable name, such as "$mgmt-ip", to value
+
+        """
+        return self._resolve(stack)[1]
+
+    def missing_variables(self, stack, variables=None):
+        """Return the variables used in a template stack that have no value
+
+        Args:
+            stack: The template stack or its name
+            variables (dict): Variable values that override those of the
+                stack and its templates
+
+        Returns:
+            set
+
+        """
+        return self._resolve(stack, variables)[2]
+
+    def update(self, obj):
+        """Drop the cached configuration that depends on a template or stack
+
+        Adding or removing a template or stack from the tree is also handled.
+
+        Args:
+            obj: The template or template stack, or its name
+
+        """
+        name = _name(obj)
+        found = None
+        for x in self.pano.children:
+            if (
+                isinstance(x, (panorama.Template, panorama.TemplateStack))
+                and x.uid == name
+            ):
+                found = x
+                break
+
+        if name in self._stacks:
+            self._remove_stack(name)
+        self._templates.pop(name, None)
+        if isinstance(found, panorama.TemplateStack):
+            self._add_stack(found)
+        elif found is not None:
+            self._templates[name] = found
+        for stack in self._members.get(name, ()):
+            self._cache.pop(stack, None)
+
+    def _add_stack(self, stack):
+        members = _members(stack)
+        self._stacks[stack.uid] = (stack, members)
+        for template in members:
+            self._members.setdefault(template, set()).add(stack.uid)
+
+    def _remove_stack(self, name):
+        self._cache.pop(name, None)
+        stack, members = self._stacks.pop(name, (None, ()))
+        for template in members:
+            self._members.get(template, set()).discard(name)
+
+    def _resolve(self, stack, overrides=None):
+        name = _name(stack)
+        if not overrides:
+            ans = self._cache.get(name)
+            if ans is not None:
+                return ans
+
+        stack, members = self._stacks[name]
+        sources = [stack]
+        for template in members:
+            if template in self._templates:
+                sources.append(self._templates[template])
+            else:
+                logger.debug(
+                    "Template {0} of stack {1} not found".format(template, name)
+                )
+
+        variables = {}
+        for source in reversed(sources):
+            for x in source.children:
+                if isinstance(x, panorama.TemplateVariable):
+                    variables[x.uid] = x.value
+        variables.update(overrides or {})
+
+        missing = set()
+        config = self._copy([stack], variables, missing)
+        config.extend(self._merge(sources, variables, missing))
+
+        ans = (config, variables, missing)
+        if not overrides:
+            self._cache[name] = ans
+        return ans
+
+    def _merge(self, sources, variables, missing):
+        """Merged copies of the children of sources, highest priority first"""
+        groups = {}
+        order = []
+        for source in sources:
+            for child in source.children:
+                if isinstance(child, panorama.TemplateVariable):
+                    continue
+                key = (type(child), child.uid)
+                if key not in groups:
+                    groups[key] = []
+                    order.append(key)
+                groups[key].append(child)
+
+        ans = []
+        for key in order:
+            objs = groups[key]
+            obj = self._copy(objs, variables, missing)
+            obj.extend(self._merge(objs, variables, missing))
+            ans.append(obj)
+
+        return ans
+
+    def _copy(self, objs, variables, missing):
+        """A new object with the first value each param is set to in objs"""
+        first = objs[0]
+        cls = type(first)
+        if isinstance(first, VersionedPanObject):
+            # Cloning is much quicker than creating versioned objects.
+            prototype = self._prototypes.get(cls)
+            if prototype is None:
+                prototype = self._prototypes[cls] = cls()
+            obj = _clone(prototype)
+            if cls.NAME is not None:
+                obj.__dict__[cls.NAME] = getattr(first, cls.NAME)
+            params = [x._params for x in objs if hasattr(x, "_params")]
+            for pos, param in enumerate(getattr(obj, "_params", ())):
+                for x in params:
+                    if x[pos].value is not None:
+                        param.value = _substitute(x[pos].value, variables, missing)
+                        break
+            return obj
+
+        obj = cls()
+        if cls.NAME is not None:
+            setattr(obj, cls.NAME, getattr(first, cls.NAME))
+        for field in [x.variable for x in first.variables()]:
+            for x in objs:
+                value = getattr(x, field, None)
+                if value is not None:
+                    setattr(obj, field, _substitute(value, variables, missing))
+                    break
+
+        return obj
+
+
+def _members(stack):
+    templates = stack.templates or []
+    if not isinstance(templates, list):
+        templates = [templates]
+    return templates
+
+
+def _substitute(value, variables, missing):
+    if isinstance(value, list):
+        return [_substitute(x, variables, missing) for x in value]
+    elif isinstance(value, str) and value.startswith("$"):
+        if value in variables:
+            return variables[value]
+        missing.add(value)
+    return value
+
+
+def _name(obj):
+    if obj is None:
+        return None
+    return obj.uid if hasattr(obj, "uid") else obj
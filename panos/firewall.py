@@ -391,9 +391,9 @@ class Firewall(PanDevice):
             firewall_instances = super(Firewall, self).refreshall_from_xml(
                 xml, refresh_children=False, variables=op_vars
             )
-            # Add system settings to firewall instances
-            for fw in firewall_instances:
-                entry = xml.find("entry[@name=%s]" % _xpath_safe(fw.serial))
+            # Add system settings to firewall instances.  There is an
+            # instance for each entry, in the same order.
+            for fw, entry in zip(firewall_instances, xml.findall("entry")):
                 system = fw.find_or_create(None, device.SystemSettings)
                 system.hostname = entry.findtext("hostname")
                 system.ip_address = entry.findtext("ip-address")
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Persistent inventory of the system info of devices
+
+Creating a device with :meth:`panos.base.PanDevice.create_from_device`, or
+using a device whose version is not known yet, runs ``show system info`` on
+the device.  The inventory saves the version, platform, and serial number of
+each device in a file, so that scripts working on many devices can create
+them with this information without asking each device again.
+
+Example::
+
+    inventory = Inventory("inventory.json", ttl=24 * 3600)
+    devices = [inventory.create(x, api_key=key) for x in hostnames]
+    inventory.save()
+
+"""
+
+import json
+import os
+import threading
+import time
+
+from panos import getlogger
+
+logger = getlogger(__name__)
+
+FORMAT = 1
+"""The version of the inventory file format"""
+
+
+class Inventory(object):
+    """Inventory of devices, saved in a JSON file
+
+    Each device is saved by hostname and by serial number.  Entries older
+    than ``ttl`` seconds are ignored, so that they are refreshed from the
+    device.
+
+    Args:
+        path (str): The file to load the inventory from and save it to
+        ttl (float): Maximum age of an entry in seconds, or None to never
+            expire entries
+
+    """
+
+    def __init__(self, path=None, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self, path=None):
+        """Load the inventory from a file, replacing the current entries
+
+        Args:
+            path (str): The file (Default: the path of this inventory)
+
+        """
+        with open(path or self.path) as f:
+            data = json.load(f)
+        if data.get("format") != FORMAT:
+            raise ValueError(
+                "Unsupported inventory format: {0}".format(data.get("format"))
+            )
+        with self._lock:
+            self._entries = {}
+            for entry in data["devices"]:
+                self._index(entry)
+        logger.debug("Loaded {0} devices from inventory".format(len(data["devices"])))
+
+    def save(self, path=None):
+        """Save the inventory to a file
+
+        The file is replaced at once, so an interrupted save doesn't leave
+        a partial file behind.
+
+        Args:
+            path (str): The file (Default: the path of this inventory)
+
+        """
+        path = path or self.path
+        with self._lock:
+            entries = self._unique()
+        tmp = "{0}.tmp".format(path)
+        with open(tmp, "w") as f:
+            json.dump({"format": FORMAT, "devices": entries}, f, indent=1)
+        os.replace(tmp, path)
+
+    def get(self, hostname=None, serial=None):
+        """Return the entry of a device, or None if unknown or expired
+
+        When both are given, the entries for the hostname and the serial
+        number must be the same one, else the device is considered unknown,
+        such as when a firewall was replaced.
+
+        Args:
+            hostname (str): The hostname of the device
+            serial (str): The serial number of the device
+
+        Returns:
+            dict: The type ("firewall" or "panorama"), hostname, serial,
+            version, platform, content_version, multi_vsys, and time of
+            the update of the device
+
+        """
+        with self._lock:
+            by_hostname = self._entries.get(("hostname", hostname))
+            by_serial = self._entries.get(("serial", serial))
+        if hostname is not None and serial is not None:
+            if by_hostname is not by_serial:
+                return None
+        entry = by_hostname if hostname is not None else by_serial
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry["updated"] > self.ttl:
+            return None
+        return dict(entry)
+
+    def update(self, device):
+        """Save the system info of a device in the inventory
+
+        The device must know its version, such as after
+        :meth:`panos.base.PanDevice.refresh_system_info`.
+
+        Args:
+            device (PanDevice): The device
+
+        Returns:
+            dict: The new entry
+
+        """
+        from panos import panorama
+
+        entry = {
+            "type": "panorama" if isinstance(device, panorama.Panorama) else "firewall",
+            "hostname": device.hostname,
+            "serial": device.serial,
+            "version": device.version,
+            "platform": device.platform,
+            "content_version": device.content_version,
+            "multi_vsys": getattr(device, "multi_vsys", None),
+            "updated": time.time(),
+        }
+        with self._lock:
+            for key in (("hostname", device.hostname), ("serial", device.serial)):
+                old = self._entries.get(key)
+                if old is not None:
+                    self._drop(old)
+            self._index(entry)
+        return dict(entry)
+
+    def remove(self, hostname=None, serial=None):
+        """Remove the entries of a device"""
+        with self._lock:
+            for key in (("hostname", hostname), ("serial", serial)):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._drop(entry)
+
+    def apply(self, device):
+        """Set the system info of a device from the inventory
+
+        Args:
+            device (PanDevice): The device
+
+        Returns:
+            bool: True if the device was found, False if it is unknown,
+            expired, or doesn't match the inventory
+
+        """
+        entry = self.get(device.hostname, device.serial)
+        if entry is None and device.hostname is None:
+            entry = self.get(serial=device.serial)
+        if entry is None or not entry["version"]:
+            return False
+        device._set_version_and_version_info(entry["version"])
+        device.platform = entry["platform"]
+        device.serial = entry["serial"]
+        device.content_version = entry["content_version"]
+        if entry["multi_vsys"] is not None and hasattr(device, "multi_vsys"):
+            device.multi_vsys = entry["multi_vsys"]
+        return True
+
+    def refresh(self, device):
+        """Refresh the system info of a device from the device itself
+
+        Use this when the device doesn't match the inventory, such as after
+        a failed call because of the wrong version.
+
+        Args:
+            device (PanDevice): The device
+
+        Returns:
+            dict: The new entry
+
+        """
+        device.refresh_system_info()
+        return self.update(device)
+
+    def sync(self, device):
+        """Set the system info of a device, from the inventory if possible
+
+        If the device is unknown, expired, or doesn't match the inventory,
+        the system info is refreshed from the device and saved in the
+        inventory instead.
+
+        Args:
+            device (PanDevice): The device
+
+        Returns:
+            bool: True if the inventory was used, False if the device was
+            asked
+
+        """
+        if self.apply(device):
+            return True
+        self.refresh(device)
+        return False
+
+    def create(
+        self, hostname, api_username=None, api_password=None, api_key=None, port=443
+    ):
+        """Create a Firewall or Panorama, using the inventory when possible
+
+        If the device is in the inventory, it is created without any API
+        call.  Otherwise :meth:`panos.base.PanDevice.create_from_device` is
+        used, and the device is added to the inventory.
+
+        Args:
+            hostname: Hostname or IP of device for API connections
+            api_username: Username of administrator to access API
+            api_password: Password of administrator to access API
+            api_key: The API Key for connecting to the device's API
+            port: Port of device for API connections
+
+        Returns:
+            PanDevice: New subclass instance (Firewall or Panorama instance)
+
+        """
+        from panos import base
+
+        entry = self.get(hostname)
+        if entry is not None and entry["version"]:
+            device = self._new_device(
+                entry["type"] == "panorama",
+                hostname,
+                api_username,
+                api_password,
+                api_key,
+                port,
+                entry["serial"],
+            )
+            self.apply(device)
+            return device
+
+        # Same as PanDevice.create_from_device, with a single call to the
+        # device for all the system info.
+        generic = base.PanDevice(hostname, api_username, api_password, api_key, port)
+        system_info = generic.show_system_info()
+        model = system_info["system"]["model"]
+        device = self._new_device(
+            model == "Panorama" or model.startswith("M-"),
+            hostname,
+            api_username,
+            api_password,
+            generic.api_key,
+            port,
+            system_info["system"]["serial"],
+        )
+        device._save_system_info(system_info)
+        self.update(device)
+        return device
+
+    def _new_device(
+        self, is_panorama, hostname, api_username, api_password, api_key, port, serial
+    ):
+        from panos import firewall, panorama
+
+        if is_panorama:
+            return panorama.Panorama(
+                hostname, api_username, api_password, api_key, port
+            )
+        return firewall.Firewall(
+            hostname, api_username, api_password, api_key, serial, port
+        )
+
+    def _index(self, entry):
+        if entry["hostname"] is not None:
+            self._entries[("hostname", entry["hostname"])] = entry
+        if entry["serial"] is not None:
+            self._entries[("serial", entry["serial"])] = entry
+
+    def _drop(self, entry):
+        for key in (("hostname", entry["hostname"]), ("serial", entry["serial"])):
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def _unique(self):
+        seen = set()
+        ans = []
+        for entry in self._entries.values():
+            if id(entry) not in seen:
+                seen.add(id(entry))
+                ans.append(entry)
+        return ans
@@ -657,7 +657,11 @@ class Interface(VsysOperations):
         return self.state
 
     def full_delete(
-        self, refresh=False, delete_referencing_objects=False, include_vsys=False
+        self,
+        refresh=False,
+        delete_referencing_objects=False,
+        include_vsys=False,
+        graph=None,
     ):
         """Delete the interface and all references to the interface
 
@@ -671,8 +675,17 @@ class Interface(VsysOperations):
                 taking action
             delete_referencing_objects (bool): Delete the entire object that
                 references this interface
+            graph (panos.refgraph.ReferenceGraph): Reference graph of the
+                tree.  If given, only the objects referencing this interface
+                are checked instead of every object of the device, and the
+                graph is kept up to date.  Can't be used with ``refresh``,
+                which replaces objects of the tree that the graph knows.
 
         """
+        if graph is not None:
+            if refresh:
+                raise ValueError("Can't use a reference graph with refresh=True")
+            candidates = graph.referrers(self)
         self.set_zone(None, refresh=refresh, update=True)
         if self.ALLOW_SET_VLAN:
             self.set_vlan(None, refresh=refresh, update=True)
@@ -681,7 +694,9 @@ class Interface(VsysOperations):
         # Remove any references to the interface across all known
         # children of this pan_device. This does not use 'refresh'.
         # Only pre-refreshed objects are scanned for references.
-        for obj in self.nearest_pandevice().findall(PanObject, recursive=True):
+        if graph is None:
+            candidates = self.nearest_pandevice().findall(PanObject, recursive=True)
+        for obj in candidates:
             if isinstance(obj, device.Vsys):
                 if not include_vsys:
                     continue
@@ -707,6 +722,13 @@ class Interface(VsysOperations):
             except AttributeError:
                 pass
         self.delete()
+        if graph is not None:
+            for obj in candidates:
+                if obj.parent is None:
+                    graph.remove(obj)
+                else:
+                    graph.update(obj)
+            graph.remove(self)
 
 
 class Arp(VersionedPanObject):
@@ -17,11 +17,17 @@
 
 """Panorama and all Panorama related objects"""
 
+import collections
 import logging
+import threading
+import time
 import xml.etree.ElementTree as ET
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy, deepcopy
 
 import pan.commit
+import pan.xapi
+from pan.config import PanConfig
 
 import panos
 import panos.errors as err
@@ -576,6 +582,295 @@ class Panorama(base.PanDevice):
         )
         return result
 
+    def commit_all_batches(
+        self,
+        cmd,
+        devices=None,
+        batch_size=25,
+        waves=None,
+        max_jobs=4,
+        retries=1,
+        interval=2.0,
+        halt_on_failure=False,
+    ):
+        """Push to devices with several commit-all jobs, yielding each result
+
+        The devices are split into batches of ``batch_size``, and one
+        commit-all job is started per batch, with up to ``max_jobs`` jobs
+        running at the same time.  The result of each device is yielded as
+        soon as ``show jobs id`` reports it, so one slow device does not hold
+        back the others.  Devices that fail are pushed to again, in a new
+        job, up to ``retries`` times.
+
+        With ``waves``, the waves are pushed one after the other, such as a
+        few canary firewalls first and then the rest.
+
+        The results are dicts like the ``devices`` of :meth:`syncjob`, with
+        these extra keys:
+
+        * jobid: The commit-all job of the push
+        * attempt: 1 for the first push to the device, 2 for the first retry
+        * retry: True if the device failed and will be pushed to again
+
+        When Panorama reports that a batch has nothing to push, no job is
+        started and each device of the batch is yielded as a success with a
+        ``result`` and ``jobid`` of None.
+
+        Example::
+
+            cmd = PanoramaCommitAll("device group", "branches")
+            for result in pano.commit_all_batches(cmd, serials, max_jobs=8):
+                print(result["serial"], result["result"])
+
+        Args:
+            cmd (PanoramaCommitAll): The commit-all to perform, of the
+                device group, template, or template stack style
+            devices (list): Serial numbers to push to (Default: the devices
+                of ``cmd``)
+            batch_size (int): Maximum number of devices per job
+            waves (list): Lists of serial numbers to push to one after the
+                other, instead of ``devices``
+            max_jobs (int): Maximum number of jobs running at the same time
+            retries (int): How many times to push again to a failed device
+            interval (float): Seconds between polls of the running jobs
+            halt_on_failure (bool): Don't start the next wave if a device of
+                this wave failed
+
+        Yields:
+            dict: The result of one device
+
+        """
+        if cmd.style not in (
+            PanoramaCommitAll.STYLE_DEVICE_GROUP,
+            PanoramaCommitAll.STYLE_TEMPLATE,
+            PanoramaCommitAll.STYLE_TEMPLATE_STACK,
+        ):
+            raise ValueError("Can't push to devices with style {0}".format(cmd.style))
+        if waves is None:
+            waves = [list(devices or cmd.devices or [])]
+        if not any(waves):
+            raise ValueError("No devices to push to")
+
+        for number, wave in enumerate(waves, 1):
+            failed = False
+            for result in self._commit_all_wave(
+                cmd, list(wave), batch_size, max_jobs, retries, interval
+            ):
+                if not result["success"] and not result["retry"]:
+                    failed = True
+                yield result
+            if failed and halt_on_failure and number < len(waves):
+                self._logger.debug(
+                    "Push failed in wave {0}, not starting the next".format(number)
+                )
+                return
+
+    def _commit_all_wave(self, cmd, serials, batch_size, max_jobs, retries, interval):
+        pending = collections.deque(
+            (serials[x : x + batch_size], 1) for x in range(0, len(serials), batch_size)
+        )
+        # Each job: [job id, serials, attempt, serials reported, start time]
+        active = []
+
+        while pending or active:
+            while pending and len(active) < max_jobs:
+                batch, attempt = pending.popleft()
+                batch_cmd = copy(cmd)
+                batch_cmd.devices = batch
+                jobid = self._commit(cmd=batch_cmd)
+                if jobid is None:
+                    self._logger.debug("Commit-all not needed: {0}".format(batch))
+                    for serial in batch:
+                        yield {
+                            "success": True,
+                            "serial": serial,
+                            "name": None,
+                            "result": None,
+                            "starttime": None,
+                            "endtime": None,
+                            "warnings": "",
+                            "messages": ["Commit-all not needed"],
+                            "jobid": None,
+                            "attempt": attempt,
+                            "retry": False,
+                        }
+                    continue
+                self._logger.debug(
+                    "Commit-all job {0} started for {1} devices".format(
+                        jobid, len(batch)
+                    )
+                )
+                active.append([jobid, batch, attempt, set(), time.time()])
+
+            if not active:
+                break
+            time.sleep(interval)
+
+            for job in list(active):
+                jobid, batch, attempt, reported, start_time = job
+                job_xml = self.xapi.op(
+                    cmd='show jobs id "{0}"'.format(jobid),
+                    cmd_xml=True,
+                    retry_on_peer=True,
+                )
+                status = job_xml.find("./result/job/status")
+                if status is None:
+                    raise pan.xapi.PanXapiError(
+                        "No status element in show jobs id {0} response".format(jobid)
+                    )
+
+                results = []
+                pending_devices = False
+                for entry in job_xml.findall("./result/job/devices/entry"):
+                    serial = entry.findtext("serial-no")
+                    if entry.findtext("result") in (None, "PEND"):
+                        pending_devices = True
+                    elif serial not in reported:
+                        results.append(
+                            base._device_job_result(PanConfig(entry).python()["entry"])
+                        )
+
+                finished = status.text == "FIN" and not pending_devices
+                if finished:
+                    # Devices the job did not get to, such as when it failed
+                    # before pushing.
+                    reported_now = set(x["serial"] for x in results)
+                    messages = [
+                        x.text for x in job_xml.findall("./result/job/details/line")
+                    ]
+                    for serial in batch:
+                        if serial not in reported and serial not in reported_now:
+                            results.append(
+                                {
+                                    "success": False,
+                                    "serial": serial,
+                                    "name": None,
+                                    "result": job_xml.findtext("./result/job/result"),
+                                    "starttime": None,
+                                    "endtime": None,
+                                    "warnings": "",
+                                    "messages": messages,
+                                }
+                            )
+
+                failed = []
+                for result in results:
+                    reported.add(result["serial"])
+                    result["jobid"] = jobid
+                    result["attempt"] = attempt
+                    result["retry"] = not result["success"] and attempt <= retries
+                    if result["retry"]:
+                        failed.append(result["serial"])
+                    yield result
+                if failed:
+                    pending.append((failed, attempt + 1))
+
+                if finished:
+                    active.remove(job)
+                elif (
+                    self.timeout is not None
+                    and self.timeout != 0
+                    and time.time() > start_time + self.timeout
+                ):
+                    raise pan.xapi.PanXapiError(
+                        "Timeout waiting for job {0} completion".format(jobid)
+                    )
+
+    def op_devices(
+        self, cmd, serials=None, vsys=None, cmd_xml=True, max_workers=10, quote='"'
+    ):
+        """Run an operational command on managed firewalls through Panorama
+
+        The command is sent to each firewall through this Panorama, with up
+        to ``max_workers`` requests in flight at the same time, which limits
+        the load on Panorama.  A firewall that fails doesn't stop the others;
+        its exception is returned instead of its result.
+
+        Example::
+
+            results = pano.op_devices("show system info")
+            for serial, result in results.items():
+                if isinstance(result, Exception):
+                    print(serial, "failed:", result)
+
+        Args:
+            cmd (str): The operational command, see :meth:`op`
+            serials (list): Serial numbers or Firewall objects (Default: every
+                firewall with a serial number in this Panorama's tree)
+            vsys (str): Vsys id.
+            cmd_xml (bool): True: cmd is not XML, False: cmd is XML
+            max_workers (int): Maximum number of requests in flight
+            quote (str): The quote character when ``cmd_xml`` is True
+
+        Returns:
+            dict: Serial number to the result XML, or to an exception
+
+        """
+        if cmd_xml:
+            cmd = panos.string_to_xml(cmd, quote)
+
+        def call(xapi):
+            return xapi.op(cmd, vsys, False, retry_on_peer=False)
+
+        return self._proxy(call, serials, max_workers)
+
+    def config_devices(self, action, xpath, serials=None, element=None, max_workers=10):
+        """Run a configuration API call on managed firewalls through Panorama
+
+        Like :meth:`op_devices`, but for the "get", "show", "set", "edit",
+        and "delete" actions of the configuration API.
+
+        Args:
+            action (str): The API action, such as "get"
+            xpath (str): The xpath of the call
+            serials (list): Serial numbers or Firewall objects (Default: every
+                firewall with a serial number in this Panorama's tree)
+            element (str): The XML element for "set" and "edit"
+            max_workers (int): Maximum number of requests in flight
+
+        Returns:
+            dict: Serial number to the result XML, or to an exception
+
+        """
+        if action not in ("get", "show", "set", "edit", "delete"):
+            raise ValueError("Invalid action: {0}".format(action))
+
+        def call(xapi):
+            kwargs = {"xpath": xpath, "retry_on_peer": False}
+            if action in ("set", "edit"):
+                kwargs["element"] = element
+            return getattr(xapi, action)(**kwargs)
+
+        return self._proxy(call, serials, max_workers)
+
+    def _proxy(self, call, serials, max_workers):
+        if serials is None:
+            serials = self.findall(firewall.Firewall, recursive=True)
+        serials = [getattr(x, "serial", x) for x in serials]
+        serials = [x for x in collections.OrderedDict.fromkeys(serials) if x]
+
+        # Each worker thread gets its own xapi, as xapi objects keep the
+        # state of the last request and cannot be shared between threads.
+        # The target firewall is just a param of each request, so the same
+        # xapi is used for every firewall.
+        local = threading.local()
+
+        def run(serial):
+            xapi = getattr(local, "xapi", None)
+            if xapi is None:
+                xapi = local.xapi = self.generate_xapi()
+            xapi.serial = serial
+            try:
+                return call(xapi)
+            except Exception as e:
+                self._logger.debug("Call to {0} failed: {1}".format(serial, e))
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(run, serials))
+
+        return collections.OrderedDict(zip(serials, results))
+
     def refresh_devices(
         self,
         devices=(),
@@ -636,14 +931,20 @@ class Panorama(base.PanDevice):
         devices_xml = self.op(cmd)
         devices_xml = devices_xml.find("result/devices")
 
+        # Index the device entries by serial, keeping the first of duplicates.
+        entries = {}
+        for entry in devices_xml.iterfind("entry"):
+            entries.setdefault(entry.get("name"), entry)
+
         # Filter to only requested devices
         if devices:
             filtered_devices_xml = ET.Element("devices")
+            filtered_vsys = {}
             for device in devices:
                 serial = str(device)
                 if serial is None:
                     continue
-                entry = devices_xml.find("entry[@name=%s]" % _xpath_safe(serial))
+                entry = entries.get(serial)
                 if entry is None:
                     if only_connected:
                         raise err.PanNotConnectedOnPanorama(
@@ -661,16 +962,14 @@ class Panorama(base.PanDevice):
                 except AttributeError:
                     continue
                 # Create entry if needed
-                if (
-                    filtered_devices_xml.find("entry[@name=%s]" % _xpath_safe(serial))
-                    is None
-                ):
+                if serial not in filtered_vsys:
                     entry_copy = deepcopy(entry)
                     # If looking for specific vsys, erase all vsys in filtered entry
                     if vsys != "shared" and vsys is not None:
                         entry_copy.remove(entry_copy.find("vsys"))
                         ET.SubElement(entry_copy, "vsys")
                     filtered_devices_xml.append(entry_copy)
+                    filtered_vsys[serial] = entry_copy.find("vsys")
                 # Get specific vsys
                 if vsys != "shared" and vsys is not None:
                     vsys_entry = entry.find("vsys/entry[@name=%s]" % _xpath_safe(vsys))
@@ -680,20 +979,22 @@ class Panorama(base.PanDevice):
                             " vsys %s attached to Panorama at %s"
                             % (serial, vsys, self.id)
                         )
-                    vsys_section = filtered_devices_xml.find(
-                        "entry[@name=%s]/vsys" % _xpath_safe(serial)
-                    )
-                    vsys_section.append(vsys_entry)
+                    filtered_vsys[serial].append(vsys_entry)
             devices_xml = filtered_devices_xml
 
-        # Manipulate devices_xml so each vsys is a separate device
+        # Manipulate devices_xml so each vsys is a separate device.  The
+        # entries are only read from here on, so each vsys device shares the
+        # subelements of its entry instead of copying them.
         if expand_vsys:
-            original_devices_xml = deepcopy(devices_xml)
+            original_devices_xml = devices_xml
             devices_xml = ET.Element("devices")
             for entry in original_devices_xml:
                 serial = entry.findtext("serial")
                 for vsys_entry in entry.findall("vsys/entry"):
-                    new_vsys_device = deepcopy(entry)
+                    new_vsys_device = ET.SubElement(
+                        devices_xml, entry.tag, entry.attrib
+                    )
+                    new_vsys_device.extend(entry)
                     new_vsys_device.set("name", serial)
                     ET.SubElement(new_vsys_device, "vsys_id").text = vsys_entry.get(
                         "name"
@@ -701,7 +1002,6 @@ class Panorama(base.PanDevice):
                     ET.SubElement(
                         new_vsys_device, "vsys_name"
                     ).text = vsys_entry.findtext("display-name")
-                    devices_xml.append(new_vsys_device)
 
         # Create firewall instances
         tmp_fw = self.FIREWALL_CLASS()
@@ -728,6 +1028,13 @@ class Panorama(base.PanDevice):
         devicegroup_opxml = self.op("show devicegroups")
         devicegroup_opxml = devicegroup_opxml.find("result/devicegroups")
 
+        # Index the operational state of the devices by serial, keeping the
+        # first of duplicates.
+        op_entries = {}
+        if devicegroup_opxml is not None:
+            for fw_entry_op in devicegroup_opxml.iterfind("entry/devices/entry"):
+                op_entries.setdefault(fw_entry_op.get("name"), fw_entry_op)
+
         # Combine the config XML and operational command XML to get a complete picture
         # of the device groups
         if devicegroup_configxml is not None:
@@ -735,10 +1042,7 @@ class Panorama(base.PanDevice):
                 if dg_entry.find("devices") is None:
                     continue
                 for fw_entry in dg_entry.find("devices"):
-                    fw_entry_op = devicegroup_opxml.find(
-                        "entry/devices/entry[@name=%s]"
-                        % _xpath_safe(fw_entry.get("name"))
-                    )
+                    fw_entry_op = op_entries.get(fw_entry.get("name"))
                     if fw_entry_op is not None:
                         panos.xml_combine(fw_entry, fw_entry_op)
 
@@ -748,57 +1052,55 @@ class Panorama(base.PanDevice):
             devicegroup_configxml, refresh_children=False
         )
 
-        for dg in devicegroup_instances:
-            dg_serials = [
-                entry.get("name")
-                for entry in devicegroup_configxml.findall(
-                    "entry[@name=%s]/devices/entry" % _xpath_safe(dg.name)
+        # Index the firewalls by (serial, vsys).  Firewalls moved to a
+        # device-group are taken off the front of their list.
+        available = {}
+        for fw in firewall_instances:
+            available.setdefault((fw.serial, fw.vsys), []).append(fw)
+        moved = set()
+
+        requested_serials = set(str(f) for f in devices)
+        requested_vsys = None
+        if devices:
+            try:
+                requested_vsys = [f.vsys for f in devices]
+            except AttributeError:
+                # Passed in string serials, no vsys, so get all vsys
+                pass
+            else:
+                if "shared" in requested_vsys or None in requested_vsys:
+                    requested_vsys = None
+
+        dg_entries = [] if devicegroup_configxml is None else devicegroup_configxml
+        for dg, dg_entry in zip(devicegroup_instances, dg_entries):
+            # Serial => (first device entry, vsys of all its device entries)
+            dg_devices = {}
+            for entry in dg_entry.iterfind("devices/entry"):
+                serial = entry.get("name")
+                if serial not in dg_devices:
+                    dg_devices[serial] = (entry, [])
+                dg_devices[serial][1].extend(
+                    x.get("name") for x in entry.iterfind("vsys/entry")
                 )
-            ]
             # Find firewall with each serial
-            for dg_serial in dg_serials:
+            for dg_serial in [
+                x.get("name") for x in dg_entry.iterfind("devices/entry")
+            ]:
                 # Skip devices not requested
-                if devices and dg_serial not in [str(f) for f in devices]:
+                if devices and dg_serial not in requested_serials:
                     continue
-                all_dg_vsys = [
-                    entry.get("name")
-                    for entry in devicegroup_configxml.findall(
-                        "entry[@name=%s]/devices/entry[@name=%s]/vsys/entry"
-                        % (_xpath_safe(dg.name), _xpath_safe(dg_serial))
-                    )
-                ]
                 # Collect the firewall serial entry to get current status information
-                fw_entry = devicegroup_configxml.find(
-                    "entry[@name=%s]/devices/entry[@name=%s]"
-                    % (_xpath_safe(dg.name), _xpath_safe(dg_serial))
-                )
+                fw_entry, all_dg_vsys = dg_devices[dg_serial]
                 if not all_dg_vsys:
                     # This is a single-context firewall, assume vsys1
                     all_dg_vsys = ["vsys1"]
                 for dg_vsys in all_dg_vsys:
                     # Check if this is a requested vsys in devices argument
-                    if devices:
-                        try:
-                            requested_vsys = [f.vsys for f in devices]
-                        except AttributeError:
-                            # Passed in string serials, no vsys, so get all vsys
-                            pass
-                        else:
-                            if (
-                                "shared" not in requested_vsys
-                                and None not in requested_vsys
-                                and dg_vsys not in requested_vsys
-                            ):
-                                # A specific vsys was requested, and this isn't it, skip
-                                continue
-                    fw = next(
-                        (
-                            x
-                            for x in firewall_instances
-                            if x.serial == dg_serial and x.vsys == dg_vsys
-                        ),
-                        None,
-                    )
+                    if requested_vsys is not None and dg_vsys not in requested_vsys:
+                        # A specific vsys was requested, and this isn't it, skip
+                        continue
+                    candidates = available.get((dg_serial, dg_vsys))
+                    fw = candidates.pop(0) if candidates else None
                     if fw is None:
                         # It's possible for device-groups to reference a serial/vsys that doesn't exist
                         # In this case, create the FW instance
@@ -808,7 +1110,7 @@ class Panorama(base.PanDevice):
                     else:
                         # Move the firewall to the device-group
                         dg.add(fw)
-                        firewall_instances.remove(fw)
+                        moved.add(id(fw))
                         shared_policy_status = fw_entry.findtext("shared-policy-status")
                         if shared_policy_status is None:
                             shared_policy_status = fw_entry.findtext(
@@ -817,6 +1119,8 @@ class Panorama(base.PanDevice):
                             )
                         fw.state.set_shared_policy_synced(shared_policy_status)
 
+        firewall_instances = [x for x in firewall_instances if id(x) not in moved]
+
         if add:
             for dg in devicegroup_instances:
                 found_dg = self.find(dg.name, DeviceGroup)
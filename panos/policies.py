@@ -17,6 +17,10 @@
 
 """Policies module contains policies and rules that exist in the 'Policies' tab in the firewall GUI"""
 
+import array
+import bisect
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 import panos.errors as err
@@ -77,7 +81,7 @@ class AuditCommentLog(OpState):
 class RulebaseHitCount(OpState):
     """Operational state handling for rulebase hit counts."""
 
-    def refresh(self, style, rules=None, all_rules=False):
+    def refresh(self, style, rules=None, all_rules=False, batch_size=None):
         """Retrieves hit count information for the specified rules.
 
         PAN-OS 8.1+
@@ -94,6 +98,8 @@ class RulebaseHitCount(OpState):
                 this is True, then get all rules.  Either way, any rule whose hit count
                 is retrieved and is in the object hierarchy has the hit count data
                 saved to its `opstate`.
+            batch_size (int): If given, request the hit counts of at most this
+                many rules per API call.  Ignored if `all_rules` is True.
 
         Returns:
             dict:  A dict where the key is the rule name and the value is the hit count information.
@@ -104,13 +110,45 @@ class RulebaseHitCount(OpState):
         if dev.retrieve_panos_version() < (8, 1, 0):
             raise err.PanDeviceError("Rule hit count is supported in PAN-OS 8.1+")
 
-        kids = []
+        names = None
+        if rules is not None:
+            names = set(x.uid if hasattr(x, "uid") else x for x in rules)
+        kids = {}
         for x in self.obj.children:
             if not hasattr(x, "HIT_COUNT_STYLE") or x.HIT_COUNT_STYLE != style:
                 continue
-            if rules is None or x.uid in rules:
-                kids.append(x)
+            if names is None or x.uid in names:
+                kids.setdefault(x.uid, x)
 
+        if all_rules:
+            batches = [None]
+        else:
+            # Loop over rules specified or the object hierarchy.
+            rule_list = [x.uid if hasattr(x, "uid") else x for x in rules or []]
+            rule_list = rule_list or list(kids)
+            if not rule_list:
+                return {}
+            size = batch_size or len(rule_list)
+            batches = [rule_list[i : i + size] for i in range(0, len(rule_list), size)]
+
+        ans = {}
+        for batch in batches:
+            cmd, res_path = self._command(dev, style, batch)
+            res = dev.op(ET.tostring(cmd, encoding="utf-8"), cmd_xml=False)
+            for elm in res.findall(res_path):
+                name = elm.attrib["name"]
+                x = kids.get(name)
+                if x is not None:
+                    x.opstate.hit_count.refresh(elm)
+                    ans[name] = x.opstate.hit_count
+                else:
+                    ans[name] = HitCount(None, name=name, elm=elm)
+
+        return ans
+
+    def _command(self, dev, style, names):
+        """Returns the hit count command for the names (None for all rules)
+        and the path of the rule entries in the response."""
         cmd = ET.Element("show")
         sub = ET.SubElement(cmd, "rule-hit-count")
         res_path = "./result/rule-hit-count"
@@ -136,35 +174,213 @@ class RulebaseHitCount(OpState):
         sub = ET.SubElement(sub, "rules")
         res_path += "/rule-base/entry/rules/entry"
 
-        if all_rules:
+        if names is None:
             ET.SubElement(sub, "all")
         else:
-            # Loop over rules specified or the object hierarchy.
-            rule_list = rules or kids or []
-            if not rule_list:
-                return {}
             sub = ET.SubElement(sub, "list")
-            for x in rule_list:
-                if hasattr(x, "uid"):
-                    ET.SubElement(sub, "member").text = x.uid
-                else:
-                    ET.SubElement(sub, "member").text = x
+            for name in names:
+                ET.SubElement(sub, "member").text = name
 
-        res = dev.op(ET.tostring(cmd, encoding="utf-8"), cmd_xml=False)
-        ans = {}
+        return cmd, res_path
 
-        for elm in res.findall(res_path):
-            name = elm.attrib["name"]
-            for x in kids:
-                if x.uid == name:
-                    x.opstate.hit_count.refresh(elm)
-                    ans[name] = x.opstate.hit_count
-                    break
-            else:
-                ans[name] = HitCount(None, name=name, elm=elm)
 
+class HitCountSeries(object):
+    """Append-only time series of the hit counts of one rule
+
+    Samples are stored as deltas from the previous sample in compact arrays,
+    so a long running sampler only costs a few bytes per rule per sample.
+    A hit count that goes down, or a changed last reset timestamp, is treated
+    as a counter reset.
+
+    Attributes:
+        timestamps (array.array): Sample times, in seconds since the epoch
+        deltas (array.array): Hits since the previous sample.  The first
+            delta is always 0.
+
+    """
+
+    def __init__(self):
+        self.timestamps = array.array("d")
+        self.deltas = array.array("q")
+        self.last_count = None
+        self.last_reset = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, hit_count, last_reset_timestamp=None):
+        """Add a sample
+
+        Args:
+            timestamp (float): Time of the sample
+            hit_count (int): The hit count of the rule at that time
+            last_reset_timestamp (int): The last reset timestamp of the rule
+
+        """
+        hit_count = hit_count or 0
+        if self.last_count is None:
+            delta = 0
+        elif hit_count < self.last_count or last_reset_timestamp != self.last_reset:
+            delta = hit_count
+        else:
+            delta = hit_count - self.last_count
+        self.timestamps.append(timestamp)
+        self.deltas.append(delta)
+        self.last_count = hit_count
+        self.last_reset = last_reset_timestamp
+
+    def hits(self, since=None):
+        """Total hits seen by the sampler, optionally since a timestamp"""
+        if since is None:
+            return sum(self.deltas)
+        start = bisect.bisect_right(self.timestamps, since)
+        return sum(self.deltas[start:])
+
+    def rate(self, window=None):
+        """Hits per second
+
+        Args:
+            window (float): Only use the samples of the last `window` seconds.
+                If None, use all samples.
+
+        Returns:
+            float: The rate, or None if there are not enough samples
+
+        """
+        if len(self.timestamps) < 2:
+            return None
+        end = self.timestamps[-1]
+        start = 0
+        if window is not None:
+            start = bisect.bisect_left(self.timestamps, end - window)
+            start = min(start, len(self.timestamps) - 2)
+        elapsed = end - self.timestamps[start]
+        if elapsed <= 0:
+            return None
+        return sum(self.deltas[start + 1 :]) / float(elapsed)
+
+
+class HitCountSampler(object):
+    """Poll rule hit counts on a schedule and keep per rule time series
+
+    Each rulebase is polled with its own request per style.
+
+    Example::
+
+        sampler = HitCountSampler([rulebase], interval=300)
+        sampler.start()
+        ...
+        sampler.stop()
+        rates = sampler.rates(window=3600)
+
+    Args:
+        rulebases (list): The rulebases (:class:`Rulebase`,
+            :class:`PreRulebase`, or :class:`PostRulebase`) to poll
+        styles (tuple): The rule styles to poll, such as "security" or "nat"
+        interval (float): Seconds between samples when running
+        all_rules (bool): Poll all rules of the rulebase instead of only the
+            rules attached to it in the configuration tree
+        batch_size (int): Maximum number of rules per API call
+
+    Attributes:
+        series (dict): (rulebase, style, rule name) to :class:`HitCountSeries`
+
+    """
+
+    def __init__(
+        self,
+        rulebases,
+        styles=("security",),
+        interval=300,
+        all_rules=False,
+        batch_size=None,
+    ):
+        self.rulebases = list(rulebases)
+        self.styles = tuple(styles)
+        self.interval = interval
+        self.all_rules = all_rules
+        self.batch_size = batch_size
+        self.series = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, timestamp=None):
+        """Poll the hit counts once
+
+        Args:
+            timestamp (float): Time to record for the sample.  Defaults to now.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for rulebase in self.rulebases:
+            for style in self.styles:
+                ans = rulebase.opstate.hit_count.refresh(
+                    style, all_rules=self.all_rules, batch_size=self.batch_size
+                )
+                for name, hit_count in ans.items():
+                    key = (rulebase, style, name)
+                    series = self.series.get(key)
+                    if series is None:
+                        series = self.series[key] = HitCountSeries()
+                    series.append(
+                        timestamp, hit_count.hit_count, hit_count.last_reset_timestamp
+                    )
+
+    def rates(self, window=None, style="security"):
+        """Hits per second of each rule
+
+        Args:
+            window (float): Only use the samples of the last `window` seconds
+            style (str): The rule style
+
+        Returns:
+            dict: Rule name to rate.  Rules in several rulebases are summed.
+
+        """
+        ans = {}
+        for (rulebase, rule_style, name), series in self.series.items():
+            if rule_style != style:
+                continue
+            rate = series.rate(window)
+            if rate is not None:
+                ans[name] = ans.get(name, 0) + rate
         return ans
 
+    def run(self, samples=None):
+        """Sample every `interval` seconds until stopped
+
+        Args:
+            samples (int): Stop after this many samples.  If None, run until
+                :meth:`stop` is called.
+
+        """
+        count = 0
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.sample(started)
+            except err.PanDeviceError as e:
+                logger.warning("Hit count sample failed: {0}".format(e))
+            count += 1
+            if samples is not None and count >= samples:
+                break
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
+
+    def start(self):
+        """Start sampling in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread started by :meth:`start`"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
 
 class Rulebase(VersionedPanObject):
     """Rulebase for a Firewall
@@ -191,6 +407,117 @@ class Rulebase(VersionedPanObject):
     def _setup(self):
         self._xpaths.add_profile(value="/rulebase")
 
+    def reorder(self, desired, update=True):
+        """Reorder rules of one type with as few moves as possible
+
+        **Modifies the live device**
+
+        Rules that are already in the right relative order are left where
+        they are, and only the others are moved.  All moves are sent to the
+        device in a single multi-config API call.
+
+        Args:
+            desired (list): All the rules of one type attached to this
+                rulebase (as objects or names), in the desired order
+            update (bool): If this is set to False, only reorder the rules in
+                the pan-os-python object tree
+
+        Returns:
+            list: The moves, as (rule, location, ref name) tuples
+
+        Raises:
+            ValueError
+
+        """
+        names = [x.uid if hasattr(x, "uid") else x for x in desired]
+        if not names:
+            return []
+        candidates = [x for x in desired if hasattr(x, "uid")]
+        candidates = candidates or [x for x in self.children if x.uid == names[0]]
+        if not candidates:
+            raise ValueError("Rule {0} is not in this rulebase".format(names[0]))
+        rule_type = type(candidates[0])
+        rules = dict((x.uid, x) for x in self.children if type(x) is rule_type)
+        if len(names) != len(rules) or set(names) != set(rules):
+            raise ValueError(
+                "Desired order must contain all {0} rules exactly once".format(
+                    rule_type.__name__
+                )
+            )
+
+        current = [x.uid for x in self.children if type(x) is rule_type]
+        moves = []
+        for name, location, ref in plan_moves(current, names):
+            rule = rules[name]
+            rule.move(location, ref, update=False)
+            moves.append((rule, location, ref))
+
+        if update and moves:
+            d = self.nearest_pandevice()
+            root = ET.Element("multi-config")
+            for num, (rule, location, ref) in enumerate(moves, 1):
+                attrib = {"id": str(num), "xpath": rule.xpath(), "where": location}
+                if ref is not None:
+                    attrib["dst"] = ref
+                ET.SubElement(root, "move", attrib)
+            d.set_config_changed()
+            d.xapi.multi_config(element=ET.tostring(root, encoding="utf-8"))
+
+        return moves
+
+
+def plan_moves(current, desired):
+    """Computes the moves turning one order into another
+
+    The items in a longest increasing subsequence of the current order (as
+    positions in the desired order) stay in place, so the number of moves is
+    the minimum possible.  Each other item is moved after the item preceding
+    it in the desired order, in desired order.
+
+    Args:
+        current (list): Names in the current order
+        desired (list): The same names in the desired order
+
+    Returns:
+        list: (name, location, ref) tuples, where location is "top" (and ref
+        is None) or "after"
+
+    """
+    position = dict((name, num) for num, name in enumerate(desired))
+    sequence = [position[name] for name in current]
+
+    # Patience sorting: tails[k] is the index in sequence of the smallest
+    # tail of an increasing subsequence of length k + 1.
+    tails = []
+    tail_values = []
+    previous = [None] * len(sequence)
+    for idx, value in enumerate(sequence):
+        k = bisect.bisect_left(tail_values, value)
+        if k > 0:
+            previous[idx] = tails[k - 1]
+        if k == len(tails):
+            tails.append(idx)
+            tail_values.append(value)
+        else:
+            tails[k] = idx
+            tail_values[k] = value
+
+    keep = set()
+    idx = tails[-1] if tails else None
+    while idx is not None:
+        keep.add(current[idx])
+        idx = previous[idx]
+
+    moves = []
+    for num, name in enumerate(desired):
+        if name in keep:
+            continue
+        if num == 0:
+            moves.append((name, "top", None))
+        else:
+            moves.append((name, "after", desired[num - 1]))
+    return moves
+
 
 class PreRulebase(Rulebase):
     """Pre-rulebase for a Panorama
@@ -0,0 +1,1503 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Offline policy matching against a refreshed configuration tree
+
+The classes in this module answer the same questions as operational commands
+such as ``test security-policy-match``, but locally, using the objects that
+have already been refreshed into a pan-os-python configuration tree.  This
+makes it possible to validate very large numbers of flows without loading the
+management plane of the device.
+
+Offline evaluation is limited to what the configuration tree knows: FQDN
+address objects, dynamic address groups, regions, external dynamic lists and
+user group membership cannot be resolved, and references to them are recorded
+in the ``unresolved`` attribute of the matcher.
+
+"""
+
+import bisect
+import ipaddress
+from collections import namedtuple
+
+from panos import getlogger, objects, policies, string_or_list
+
+logger = getlogger(__name__)
+
+PROTOCOLS = {"tcp": 6, "udp": 17, "sctp": 132}
+"""IP protocol numbers of the protocols usable in services"""
+
+PREDEFINED_SERVICES = {
+    "service-http": (("tcp", "80,8080"),),
+    "service-https": (("tcp", "443"),),
+}
+"""Predefined services, as (protocol, ports) tuples"""
+
+# IPv4 addresses are mapped into the IPv6 space (::ffff:0:0/96) so that all
+# addresses can be compared as integers in a single space.
+_IPV4_MAPPED = 0xFFFF << 32
+_IPV4_HOSTMASK = (1 << 32) - 1
+_IPV6_HOSTMASK = (1 << 128) - 1
+
+
+def ip_to_int(value):
+    """Convert an IPv4 or IPv6 address to an integer
+
+    IPv4 addresses are converted to their IPv4-mapped IPv6 value, so IPv4 and
+    IPv6 addresses can be compared with each other.
+
+    Args:
+        value (str): The IP address
+
+    Returns:
+        int
+
+    """
+    addr = ipaddress.ip_address("{0}".format(value))
+    if addr.version == 4:
+        return _IPV4_MAPPED | int(addr)
+    return int(addr)
+
+
+def int_to_ip(value):
+    """Convert an integer from :func:`ip_to_int` back to an IP address string"""
+    if value >> 32 == _IPV4_MAPPED >> 32:
+        return str(ipaddress.IPv4Address(value & _IPV4_HOSTMASK))
+    return str(ipaddress.IPv6Address(value))
+
+
+def parse_address(value, address_type=None):
+    """Parse an address value into integer intervals
+
+    Args:
+        value (str): The address value, such as "10.0.0.0/8",
+            "10.0.0.1-10.0.0.5", "10.0.0.1/0.0.255.0", or "10.0.0.1"
+        address_type (str): The :class:`panos.objects.AddressObject` type of
+            the value.  If None, the type is guessed from the value.
+
+    Returns:
+        AddressSet: The addresses, or None if the value cannot be resolved
+        offline (such as an FQDN).
+
+    """
+    value = "{0}".format(value).strip()
+    if address_type is None:
+        if "-" in value:
+            address_type = "ip-range"
+        elif "/" in value and "." in value.split("/", 1)[1]:
+            address_type = "ip-wildcard"
+        else:
+            address_type = "ip-netmask"
+
+    try:
+        if address_type == "ip-netmask":
+            net = ipaddress.ip_network(value, strict=False)
+            low = int(net.network_address)
+            high = int(net.broadcast_address)
+            if net.version == 4:
+                low, high = _IPV4_MAPPED | low, _IPV4_MAPPED | high
+            return AddressSet([(low, high)])
+        elif address_type == "ip-range":
+            first, last = value.split("-", 1)
+            return AddressSet([(ip_to_int(first), ip_to_int(last))])
+        elif address_type == "ip-wildcard":
+            addr, mask = value.split("/", 1)
+            addr = ipaddress.ip_address(addr)
+            mask = int(ipaddress.ip_address(mask))
+            if addr.version == 4:
+                base, hostmask = _IPV4_MAPPED | int(addr), _IPV4_HOSTMASK
+            else:
+                base, hostmask = int(addr), _IPV6_HOSTMASK
+            # Bits set in the mask are "don't care" bits.
+            care = hostmask & ~mask
+            if addr.version == 4:
+                care |= _IPV4_MAPPED
+            return AddressSet(wildcards=[(base & care, care)])
+    except ValueError:
+        return None
+
+    return None
+
+
+def parse_ports(value):
+    """Parse a port specification into merged intervals
+
+    Args:
+        value (str): Ports such as "80,443,8000-8080"
+
+    Returns:
+        list: Sorted, non-overlapping (low, high) tuples.  Ports that are
+        not numbers (such as "dynamic") are skipped.
+
+    """
+    ans = []
+    for part in "{0}".format(value).split(","):
+        low, _, high = part.strip().partition("-")
+        try:
+            ans.append((int(low), int(high or low)))
+        except ValueError:
+            continue
+    return AddressSet(ans).intervals
+
+
+class AddressSet(object):
+    """A set of integers stored as sorted, merged intervals
+
+    Used for IP addresses (see :func:`ip_to_int`) and for ports.  Membership
+    tests are O(log n) in the number of intervals.
+
+    Args:
+        intervals (list): (low, high) tuples, inclusive
+        wildcards (list): (value, care mask) tuples; an integer matches a
+            wildcard if ``x & care == value``
+
+    """
+
+    __slots__ = ("_starts", "_ends", "wildcards")
+
+    def __init__(self, intervals=(), wildcards=()):
+        starts = []
+        ends = []
+        for low, high in sorted(intervals):
+            if starts and low <= ends[-1] + 1:
+                if high > ends[-1]:
+                    ends[-1] = high
+            else:
+                starts.append(low)
+                ends.append(high)
+        self._starts = starts
+        self._ends = ends
+        self.wildcards = tuple(sorted(set(wildcards)))
+
+    @classmethod
+    def union(cls, sets):
+        """Return the union of several AddressSets"""
+        intervals = []
+        wildcards = []
+        for x in sets:
+            intervals.extend(x.intervals)
+            wildcards.extend(x.wildcards)
+        return cls(intervals, wildcards)
+
+    @property
+    def intervals(self):
+        return list(zip(self._starts, self._ends))
+
+    def __contains__(self, value):
+        idx = bisect.bisect_right(self._starts, value) - 1
+        if idx >= 0 and value <= self._ends[idx]:
+            return True
+        for base, care in self.wildcards:
+            if value & care == base:
+                return True
+        return False
+
+    def issuperset(self, other):
+        """Check if every value of the other set is in this set
+
+        Wildcards are only compared with wildcards, so a wildcard that covers
+        the other set's intervals is not taken into account.
+
+        """
+        for low, high in zip(other._starts, other._ends):
+            idx = bisect.bisect_right(self._starts, low) - 1
+            if idx < 0 or self._ends[idx] < high:
+                return False
+        for base, care in other.wildcards:
+            for self_base, self_care in self.wildcards:
+                if self_care & care == self_care and base & self_care == self_base:
+                    break
+            else:
+                return False
+        return True
+
+    def intersects(self, other):
+        """Check if the sets may share a value
+
+        If either set has wildcards, this is True unless the other is empty.
+
+        """
+        if not self or not other:
+            return False
+        if self.wildcards or other.wildcards:
+            return True
+        i = j = 0
+        while i < len(self._starts) and j < len(other._starts):
+            if self._ends[i] < other._starts[j]:
+                i += 1
+            elif other._ends[j] < self._starts[i]:
+                j += 1
+            else:
+                return True
+        return False
+
+    @property
+    def key(self):
+        """A hashable value identifying the contents of the set"""
+        return (tuple(self._starts), tuple(self._ends), self.wildcards)
+
+    def __len__(self):
+        return len(self._starts) + len(self.wildcards)
+
+    def __eq__(self, other):
+        return isinstance(other, AddressSet) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "<AddressSet {0} intervals, {1} wildcards>".format(
+            len(self._starts), len(self.wildcards)
+        )
+
+
+class ObjectScopes(object):
+    """Name lookup of objects through a chain of containers
+
+    Containers are searched in order, so the first container is the nearest
+    scope, for example ``[device_group, panorama]`` or ``[vsys, firewall]``.
+    An object in a nearer scope overrides one of the same name further away.
+
+    Args:
+        containers (list): The containers (PanObjects) to search, nearest first
+
+    """
+
+    def __init__(self, containers):
+        self.containers = [x for x in containers if x is not None]
+        self._names = {}
+
+    def find(self, name, class_type):
+        """Return the nearest object of the class with this name, or None"""
+        return self.visible(class_type).get(name)
+
+    def visible(self, class_type):
+        """Return a dict of name to the nearest object of the class"""
+        names = self._names.get(class_type)
+        if names is None:
+            names = {}
+            for container in reversed(self.containers):
+                for child in container.children:
+                    if type(child) is class_type:
+                        names[child.uid] = child
+            self._names[class_type] = names
+        return names
+
+
+class AddressResolver(object):
+    """Resolve address names to :class:`AddressSet` objects
+
+    Names are looked up as AddressObjects, then AddressGroups (expanded
+    recursively), then parsed as literal addresses.
+
+    Args:
+        scopes (ObjectScopes): Where to look up objects by name
+
+    Attributes:
+        unresolved (set): Names that could not be resolved offline
+        incomplete (set): Names that could not be resolved offline, and
+            groups that contain them
+
+    """
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+        self.unresolved = set()
+        self.incomplete = set()
+        self._cache = {}
+        self._loops = 0
+
+    def resolve(self, names):
+        """Resolve a list of names into a single AddressSet"""
+        return AddressSet.union(self.resolve_name(x) for x in names)
+
+    def resolve_name(self, name, _stack=()):
+        ans = self._cache.get(name)
+        if ans is not None:
+            return ans
+
+        loops = self._loops
+        obj = self.scopes.find(name, objects.AddressObject)
+        if obj is not None:
+            ans = parse_address(obj.value, obj.type)
+        else:
+            group = self.scopes.find(name, objects.AddressGroup)
+            if group is not None:
+                if name in _stack:
+                    logger.debug("Address group loop at {0}".format(name))
+                    self._loops += 1
+                    return AddressSet()
+                if group.dynamic_value:
+                    ans = None
+                else:
+                    members = string_or_list(group.static_value) or []
+                    ans = AddressSet.union(
+                        self.resolve_name(x, _stack + (name,)) for x in members
+                    )
+                    if self.incomplete.intersection(members):
+                        self.incomplete.add(name)
+            else:
+                ans = parse_address(name)
+
+        if ans is None:
+            self.unresolved.add(name)
+            self.incomplete.add(name)
+            ans = AddressSet()
+        # Members of a loop are only partially resolved until the resolution
+        # returns to where the loop was entered, so don't cache them.
+        if not _stack or loops == self._loops:
+            self._cache[name] = ans
+        return ans
+
+
+class AddressIndex(object):
+    """Index answering which address objects and groups contain an address
+
+    All AddressObjects and AddressGroups visible from the scopes are resolved
+    once, with groups flattened recursively, and their intervals are split
+    into sorted, disjoint segments, each holding the names covering it.
+    Containment and overlap queries are then a binary search over the
+    segments.
+
+    Example::
+
+        index = AddressIndex.from_tree(device_group)
+        index.containing("10.1.2.3")  # ["all-servers", "web-1"]
+        index.overlapping("10.1.0.0/16")
+
+    Args:
+        scopes (list): Containers of the objects, nearest scope first
+
+    Attributes:
+        unresolved (set): Names that could not be resolved offline
+
+    """
+
+    def __init__(self, scopes):
+        if not isinstance(scopes, ObjectScopes):
+            scopes = ObjectScopes(scopes)
+        self.scopes = scopes
+        self.resolver = AddressResolver(scopes)
+
+        names = set(scopes.visible(objects.AddressObject))
+        names.update(scopes.visible(objects.AddressGroup))
+        self.names = sorted(names)
+
+        events = []
+        self._wildcards = []
+        for name in self.names:
+            resolved = self.resolver.resolve_name(name)
+            for low, high in resolved.intervals:
+                events.append((low, 0, name))
+                events.append((high + 1, 1, name))
+            for wildcard in resolved.wildcards:
+                self._wildcards.append((wildcard, name))
+        events.sort()
+
+        # Sweep the interval boundaries to build disjoint segments.
+        self._starts = []
+        self._members = []
+        active = {}
+        for point, is_end, name in events:
+            if is_end:
+                active[name] -= 1
+                if not active[name]:
+                    del active[name]
+            else:
+                active[name] = active.get(name, 0) + 1
+            members = tuple(sorted(active))
+            if self._starts and self._starts[-1] == point:
+                self._members[-1] = members
+            elif not self._members or self._members[-1] != members:
+                self._starts.append(point)
+                self._members.append(members)
+
+    @classmethod
+    def from_tree(cls, node):
+        """Create an index of the objects visible from a node of the tree
+
+        Args:
+            node: A :class:`panos.firewall.Firewall`,
+                :class:`panos.device.Vsys`, :class:`panos.panorama.DeviceGroup`,
+                or :class:`panos.panorama.Panorama` with its address objects
+                and groups already refreshed
+
+        Returns:
+            AddressIndex
+
+        """
+        return cls(policy_scopes(node)[1])
+
+    @property
+    def unresolved(self):
+        return self.resolver.unresolved
+
+    def resolve(self, name):
+        """Return the :class:`AddressSet` of an object or group name"""
+        return self.resolver.resolve_name(name)
+
+    def containing(self, address):
+        """Names of the objects and groups that contain an address
+
+        Args:
+            address: IP address as a string or :func:`ip_to_int` value
+
+        Returns:
+            list: Sorted names
+
+        """
+        value = _address_value(address)
+        idx = bisect.bisect_right(self._starts, value) - 1
+        ans = self._members[idx] if idx >= 0 else ()
+        if self._wildcards:
+            extra = set(
+                name for (base, care), name in self._wildcards if value & care == base
+            )
+            if extra:
+                return sorted(extra.union(ans))
+        return list(ans)
+
+    def containing_many(self, addresses):
+        """Bulk version of :meth:`containing`
+
+        The addresses are looked up in sorted order, so lookups walk the
+        segments forward instead of doing a full binary search each.
+
+        Args:
+            addresses: Sequence of IP addresses as strings or
+                :func:`ip_to_int` values, such as a list or an array
+
+        Returns:
+            list: For each address, the sorted names containing it
+
+        """
+        values = [_address_value(x) for x in addresses]
+        order = sorted(range(len(values)), key=values.__getitem__)
+        ans = [None] * len(values)
+        starts = self._starts
+        idx = 0
+        for pos in order:
+            value = values[pos]
+            if idx < len(starts) and starts[idx] <= value:
+                idx = bisect.bisect_right(starts, value, idx)
+            members = self._members[idx - 1] if idx else ()
+            if self._wildcards:
+                extra = set(
+                    name
+                    for (base, care), name in self._wildcards
+                    if value & care == base
+                )
+                if extra:
+                    ans[pos] = sorted(extra.union(members))
+                    continue
+            ans[pos] = list(members)
+        return ans
+
+    def overlapping(self, network):
+        """Names of the objects and groups that overlap an address range
+
+        Wildcard objects are not included.
+
+        Args:
+            network (str): An address, network, or range, such as
+                "10.0.0.0/8" or "10.0.0.1-10.0.0.9"
+
+        Returns:
+            list: Sorted names
+
+        """
+        addresses = parse_address(network)
+        if addresses is None:
+            raise ValueError("Cannot parse address: {0}".format(network))
+        ans = set()
+        for low, high in addresses.intervals:
+            first = max(bisect.bisect_right(self._starts, low) - 1, 0)
+            last = bisect.bisect_right(self._starts, high)
+            for members in self._members[first:last]:
+                ans.update(members)
+        return sorted(ans)
+
+
+def _address_value(address):
+    if isinstance(address, int):
+        return address
+    try:
+        return ip_to_int(address)
+    except ValueError:
+        # Integer-like values, such as numpy integers.
+        return int(address)
+
+
+class ServiceResolver(object):
+    """Resolve service names to {protocol number: port AddressSet} dicts
+
+    Args:
+        scopes (ObjectScopes): Where to look up objects by name
+
+    Attributes:
+        unresolved (set): Names that could not be resolved offline
+        incomplete (set): Names that could not be resolved offline, and
+            groups that contain them
+
+    """
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+        self.unresolved = set()
+        self.incomplete = set()
+        self._cache = {}
+
+    def resolve(self, names, _stack=()):
+        """Resolve a list of service names into a single dict"""
+        parts = {}
+        for name in names:
+            for proto, ports in self.resolve_name(name, _stack).items():
+                parts.setdefault(proto, []).append(ports)
+        return dict((k, AddressSet.union(v)) for k, v in parts.items())
+
+    def resolve_name(self, name, _stack=()):
+        ans = self._cache.get(name)
+        if ans is not None:
+            return ans
+
+        ans = {}
+        obj = self.scopes.find(name, objects.ServiceObject)
+        if obj is not None:
+            proto = PROTOCOLS.get(obj.protocol)
+            if proto is not None and obj.destination_port:
+                ans[proto] = AddressSet(parse_ports(obj.destination_port))
+        else:
+            group = self.scopes.find(name, objects.ServiceGroup)
+            if group is not None:
+                if name in _stack:
+                    return ans
+                members = string_or_list(group.value) or []
+                ans = self.resolve(members, _stack + (name,))
+                if self.incomplete.intersection(members):
+                    self.incomplete.add(name)
+            elif name in PREDEFINED_SERVICES:
+                for proto, ports in PREDEFINED_SERVICES[name]:
+                    ans[PROTOCOLS[proto]] = AddressSet(parse_ports(ports))
+            else:
+                self.unresolved.add(name)
+                self.incomplete.add(name)
+
+        self._cache[name] = ans
+        return ans
+
+
+class ApplicationResolver(object):
+    """Resolve application names and groups, and application default ports
+
+    Args:
+        scopes (ObjectScopes): Where to look up objects by name
+        predefined (panos.predefined.Predefined): Predefined objects subsystem
+            used to find the default ports of predefined applications.  Only
+            applications that are already retrieved are used.
+
+    """
+
+    def __init__(self, scopes, predefined=None):
+        self.scopes = scopes
+        self.predefined = predefined
+        self._groups = {}
+        self._default_ports = {}
+
+    def resolve(self, names, _stack=()):
+        """Resolve application names, expanding application groups"""
+        ans = set()
+        for name in names:
+            group = self.scopes.find(name, objects.ApplicationGroup)
+            if group is None:
+                ans.add(name)
+            elif name not in _stack:
+                members = string_or_list(group.value) or []
+                ans.update(self.resolve(members, _stack + (name,)))
+        return frozenset(ans)
+
+    def default_ports(self, name):
+        """Default ports of an application as {protocol number: AddressSet}
+
+        Returns None if the default ports of the application are not known.
+
+        """
+        if name in self._default_ports:
+            return self._default_ports[name]
+
+        app = self.scopes.find(name, objects.ApplicationObject)
+        if app is None and self.predefined is not None:
+            app = self.predefined.application(
+                name, refresh_if_none=False, include_containers=False
+            )
+        ans = None
+        if app is not None and app.default_port:
+            parts = {}
+            for spec in app.default_port:
+                proto, _, ports = spec.partition("/")
+                proto = PROTOCOLS.get(proto)
+                if proto is not None:
+                    parts.setdefault(proto, []).extend(parse_ports(ports))
+            ans = dict((k, AddressSet(v)) for k, v in parts.items())
+
+        self._default_ports[name] = ans
+        return ans
+
+
+Flow = namedtuple(
+    "Flow",
+    [
+        "source",
+        "destination",
+        "protocol",
+        "application",
+        "category",
+        "port",
+        "user",
+        "from_zone",
+        "to_zone",
+    ],
+)
+"""A flow to evaluate, with source and destination as :func:`ip_to_int` values"""
+
+
+def make_flow(
+    source,
+    destination,
+    protocol,
+    application=None,
+    category=None,
+    port=None,
+    user=None,
+    from_zone=None,
+    to_zone=None,
+):
+    """Build a :class:`Flow` from the arguments of ``test_security_policy_match``"""
+    return Flow(
+        ip_to_int(source),
+        ip_to_int(destination),
+        int(protocol),
+        application,
+        category,
+        None if port is None else int(port),
+        user,
+        from_zone,
+        to_zone,
+    )
+
+
+class CompiledSecurityRule(object):
+    """A SecurityRule compiled into structures for fast matching
+
+    For every match criteria, None means "any".
+
+    Args:
+        rule (panos.policies.SecurityRule): The rule
+        index (int): Position of the rule in the evaluation order (1-based)
+        addresses (AddressResolver): Address resolver
+        services (ServiceResolver): Service resolver
+        applications (ApplicationResolver): Application resolver
+
+    """
+
+    __slots__ = (
+        "rule",
+        "name",
+        "index",
+        "action",
+        "type",
+        "from_zones",
+        "to_zones",
+        "source",
+        "negate_source",
+        "destination",
+        "negate_destination",
+        "users",
+        "applications",
+        "categories",
+        "services",
+        "application_default",
+    )
+
+    def __init__(self, rule, index, addresses, services, applications):
+        self.rule = rule
+        self.name = rule.uid
+        self.index = index
+        self.action = rule.action or ""
+        self.type = rule.type or "universal"
+        self.from_zones = _any_or_set(rule.fromzone)
+        self.to_zones = _any_or_set(rule.tozone)
+
+        source = _any_or_set(rule.source)
+        self.source = None if source is None else addresses.resolve(source)
+        self.negate_source = bool(rule.negate_source)
+        destination = _any_or_set(rule.destination)
+        self.destination = (
+            None if destination is None else addresses.resolve(destination)
+        )
+        self.negate_destination = bool(rule.negate_destination)
+
+        self.users = _any_or_set(rule.source_user)
+        apps = _any_or_set(rule.application)
+        self.applications = None if apps is None else applications.resolve(apps)
+        self.categories = _any_or_set(rule.category)
+
+        service = _any_or_set(rule.service)
+        self.application_default = bool(
+            service is not None and "application-default" in service
+        )
+        if service is None:
+            self.services = None
+        else:
+            self.services = services.resolve(
+                x for x in service if x != "application-default"
+            )
+
+    def matches(self, flow, app_default_ports=None):
+        """Check if the flow matches this rule
+
+        Args:
+            flow (Flow): The flow
+            app_default_ports: Callable returning the default ports of an
+                application, used for "application-default" services.
+
+        Returns:
+            bool
+
+        """
+        return self.matches_addresses(flow) and self.matches_criteria(
+            flow, app_default_ports
+        )
+
+    def matches_addresses(self, flow):
+        """Check if the source and destination of the flow match this rule
+
+        Args:
+            flow (Flow): The flow
+
+        Returns:
+            bool
+
+        """
+        if self.source is not None:
+            if (flow.source in self.source) == self.negate_source:
+                return False
+        if self.destination is not None:
+            if (flow.destination in self.destination) == self.negate_destination:
+                return False
+        return True
+
+    def matches_criteria(self, flow, app_default_ports=None):
+        """Check if everything but the addresses of the flow match this rule
+
+        Args:
+            flow (Flow): The flow
+            app_default_ports: Callable returning the default ports of an
+                application, used for "application-default" services.
+
+        Returns:
+            bool
+
+        """
+        if self.from_zones is not None and flow.from_zone is not None:
+            if flow.from_zone not in self.from_zones:
+                return False
+        if self.to_zones is not None and flow.to_zone is not None:
+            if flow.to_zone not in self.to_zones:
+                return False
+        if flow.from_zone is not None and flow.to_zone is not None:
+            if self.type == "intrazone" and flow.from_zone != flow.to_zone:
+                return False
+            if self.type == "interzone" and flow.from_zone == flow.to_zone:
+                return False
+        if self.users is not None:
+            if flow.user is None:
+                if "unknown" not in self.users:
+                    return False
+            elif flow.user not in self.users and "known-user" not in self.users:
+                return False
+        if self.applications is not None and flow.application is not None:
+            if flow.application not in self.applications:
+                return False
+        if self.categories is not None and flow.category is not None:
+            if flow.category not in self.categories:
+                return False
+        if self.services is not None and flow.port is not None:
+            ports = self.services.get(flow.protocol)
+            if ports is None or flow.port not in ports:
+                if not self.application_default:
+                    return False
+                if flow.application is None or app_default_ports is None:
+                    return True
+                defaults = app_default_ports(flow.application)
+                if defaults is None:
+                    # Default ports not known, so they can't be ruled out.
+                    return True
+                ports = defaults.get(flow.protocol)
+                if ports is None or flow.port not in ports:
+                    return False
+        return True
+
+
+class CompiledNatRule(object):
+    """A NatRule compiled into structures for fast matching
+
+    For every match criteria, None means "any".
+
+    Args:
+        rule (panos.policies.NatRule): The rule
+        index (int): Position of the rule in the evaluation order (1-based)
+        addresses (AddressResolver): Address resolver
+        services (ServiceResolver): Service resolver
+
+    """
+
+    __slots__ = (
+        "rule",
+        "name",
+        "index",
+        "nat_type",
+        "from_zones",
+        "to_zones",
+        "to_interface",
+        "source",
+        "destination",
+        "services",
+    )
+
+    def __init__(self, rule, index, addresses, services):
+        self.rule = rule
+        self.name = rule.uid
+        self.index = index
+        self.nat_type = rule.nat_type or "ipv4"
+        self.from_zones = _any_or_set(rule.fromzone)
+        self.to_zones = _any_or_set(rule.tozone)
+        self.to_interface = (
+            None if rule.to_interface in (None, "any") else rule.to_interface
+        )
+        source = _any_or_set(rule.source)
+        self.source = None if source is None else addresses.resolve(source)
+        destination = _any_or_set(rule.destination)
+        self.destination = (
+            None if destination is None else addresses.resolve(destination)
+        )
+        service = _any_or_set(rule.service)
+        self.services = None if service is None else services.resolve(service)
+
+    def matches(self, flow, to_interface=None):
+        """Check if the flow matches this rule
+
+        Args:
+            flow (Flow): The flow; only addresses, protocol, port and zones
+                are used
+            to_interface (str): The egress interface of the flow, if known
+
+        Returns:
+            bool
+
+        """
+        if self.from_zones is not None and flow.from_zone is not None:
+            if flow.from_zone not in self.from_zones:
+                return False
+        if self.to_zones is not None and flow.to_zone is not None:
+            if flow.to_zone not in self.to_zones:
+                return False
+        if self.to_interface is not None and to_interface is not None:
+            if self.to_interface != to_interface:
+                return False
+        if self.source is not None and flow.source not in self.source:
+            return False
+        if self.destination is not None and flow.destination not in self.destination:
+            return False
+        if self.services is not None and flow.port is not None:
+            ports = self.services.get(flow.protocol)
+            if ports is None or flow.port not in ports:
+                return False
+        return True
+
+
+def _any_or_set(value):
+    """Returns None if "any" is in the value, otherwise a frozenset"""
+    value = string_or_list(value)
+    if not value or "any" in value:
+        return None
+    return frozenset(value)
+
+
+class _MaskIndex(object):
+    """Index of rules by the values of one criteria, as bit masks
+
+    Bit N of a mask is set if the rule at position N can match the value.
+
+    """
+
+    def __init__(self, all_mask):
+        self.all_mask = all_mask
+        self.any_mask = 0
+        self.values = {}
+
+    def add(self, bit, values):
+        if values is None:
+            self.any_mask |= bit
+        else:
+            for x in values:
+                self.values[x] = self.values.get(x, 0) | bit
+
+    def lookup(self, value):
+        if value is None:
+            return self.all_mask
+        return self.any_mask | self.values.get(value, 0)
+
+
+class SecurityPolicyMatcher(object):
+    """Offline security policy match over a list of security rules
+
+    This answers the same question as
+    :meth:`panos.base.PanDevice.test_security_policy_match` without
+    contacting the device.  Criteria that are not given in a query match any
+    rule, except for ``user``, which is then considered "unknown".
+
+    Rules are compiled once, when the matcher is created, so the matcher
+    must be recreated if the rules or the objects they reference change.
+    Use :meth:`from_tree` to build a matcher from a refreshed configuration
+    tree.
+
+    Example::
+
+        fw = Firewall(...)
+        Rulebase.refreshall(fw)
+        ...  # refresh SecurityRule, AddressObject, AddressGroup, etc.
+        matcher = SecurityPolicyMatcher.from_tree(fw)
+        matcher.test_security_policy_match("10.1.1.1", "8.8.8.8", 17, port=53)
+
+    Args:
+        rules (list): SecurityRules in evaluation order
+        scopes (list): Containers of the objects referenced by the rules,
+            nearest scope first
+        predefined (panos.predefined.Predefined): Predefined objects used for
+            the default ports of applications
+
+    Attributes:
+        rules (list): The :class:`CompiledSecurityRule` of enabled rules
+        unresolved (set): Names of objects that could not be resolved offline
+
+    """
+
+    def __init__(self, rules, scopes=(), predefined=None):
+        self.scopes = ObjectScopes(scopes)
+        self.addresses = AddressResolver(self.scopes)
+        self.services = ServiceResolver(self.scopes)
+        self.applications = ApplicationResolver(self.scopes, predefined)
+
+        self.rules = []
+        self.rule_count = 0
+        for index, rule in enumerate(rules, 1):
+            self.rule_count = index
+            if rule.disabled:
+                continue
+            self.rules.append(
+                CompiledSecurityRule(
+                    rule, index, self.addresses, self.services, self.applications
+                )
+            )
+
+        all_mask = (1 << len(self.rules)) - 1
+        self._indexes = {}
+        for field, attr in (
+            ("from_zone", "from_zones"),
+            ("to_zone", "to_zones"),
+            ("application", "applications"),
+            ("category", "categories"),
+        ):
+            index = _MaskIndex(all_mask)
+            for bit, rule in enumerate(self.rules):
+                index.add(1 << bit, getattr(rule, attr))
+            self._indexes[field] = index
+        self._all_mask = all_mask
+
+    @property
+    def unresolved(self):
+        return self.addresses.unresolved | self.services.unresolved
+
+    @classmethod
+    def from_tree(cls, node, predefined=None):
+        """Create a matcher from the objects in a configuration tree
+
+        Args:
+            node: A :class:`panos.firewall.Firewall`,
+                :class:`panos.device.Vsys`, :class:`panos.panorama.DeviceGroup`,
+                or :class:`panos.panorama.Panorama` with its rules and objects
+                already refreshed
+            predefined (panos.predefined.Predefined): Predefined objects used
+                for the default ports of applications.  Defaults to the one of
+                the nearest device, if any.
+
+        Returns:
+            SecurityPolicyMatcher
+
+        """
+        if predefined is None:
+            try:
+                predefined = node.nearest_pandevice().predefined
+            except Exception:
+                predefined = None
+        rulebases, scopes = policy_scopes(node)
+        rules = []
+        for rulebase in rulebases:
+            rules.extend(rulebase.findall(policies.SecurityRule))
+        return cls(rules, scopes, predefined)
+
+    def test_security_policy_match(
+        self,
+        source,
+        destination,
+        protocol,
+        application=None,
+        category=None,
+        port=None,
+        user=None,
+        from_zone=None,
+        to_zone=None,
+        show_all=False,
+    ):
+        """Test security policy match using the given criteria.
+
+        The arguments and return value are the same as
+        :meth:`panos.base.PanDevice.test_security_policy_match`.  The
+        ``index`` of a rule is its 1-based position in evaluation order.
+
+        Returns:
+            List of dicts
+
+        """
+        flow = make_flow(
+            source,
+            destination,
+            protocol,
+            application,
+            category,
+            port,
+            user,
+            from_zone,
+            to_zone,
+        )
+        return self._match(flow, show_all)
+
+    def match_many(self, flows, show_all=False):
+        """Evaluate many flows at once
+
+        Flows that only differ by their addresses are evaluated together:
+        the rules matching everything but the addresses are found once for
+        the whole group, then the flows of the group are checked against
+        the addresses of those rules only, in address order so that flows
+        with the same addresses are checked once.
+
+        Args:
+            flows (list): Flows as dicts with the keyword arguments of
+                :meth:`test_security_policy_match`, or as :class:`Flow` tuples
+            show_all (bool): Show all potential match rules until first allow.
+
+        Returns:
+            list: For each flow, the list of dicts that
+            :meth:`test_security_policy_match` would return
+
+        """
+        flows = [x if isinstance(x, Flow) else make_flow(**x) for x in flows]
+        groups = {}
+        for position, flow in enumerate(flows):
+            groups.setdefault(flow[2:], []).append(position)
+
+        ans = [None] * len(flows)
+        for positions in groups.values():
+            rules = list(self._criteria_matches(flows[positions[0]]))
+            positions.sort(key=lambda x: flows[x][:2])
+            addresses = result = None
+            for position in positions:
+                flow = flows[position]
+                if flow[:2] != addresses:
+                    addresses = flow[:2]
+                    result = self._resolve(flow, rules, show_all)
+                ans[position] = [dict(x) for x in result]
+        return ans
+
+    def _candidates(self, flow):
+        mask = self._all_mask
+        for field, index in self._indexes.items():
+            mask &= index.lookup(getattr(flow, field))
+            if not mask:
+                break
+        return mask
+
+    def _criteria_matches(self, flow):
+        """Yield the rules matching everything but the addresses of the flow"""
+        mask = self._candidates(flow)
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            rule = self.rules[low.bit_length() - 1]
+            if rule.matches_criteria(flow, self.applications.default_ports):
+                yield rule
+
+    def _match(self, flow, show_all):
+        return self._resolve(flow, self._criteria_matches(flow), show_all)
+
+    def _resolve(self, flow, rules, show_all):
+        ans = []
+        allowed = False
+        for rule in rules:
+            if not rule.matches_addresses(flow):
+                continue
+            ans.append({"name": rule.name, "index": rule.index, "action": rule.action})
+            if not show_all:
+                return ans
+            if rule.action == "allow":
+                allowed = True
+                break
+
+        if not allowed and flow.from_zone is not None and flow.to_zone is not None:
+            if flow.from_zone == flow.to_zone:
+                ans.append(
+                    {
+                        "name": "intrazone-default",
+                        "index": self.rule_count + 1,
+                        "action": "allow",
+                    }
+                )
+            else:
+                ans.append(
+                    {
+                        "name": "interzone-default",
+                        "index": self.rule_count + 2,
+                        "action": "deny",
+                    }
+                )
+
+        return ans
+
+
+class NatPolicyMatcher(object):
+    """Offline NAT policy match and translation lookup over NAT rules
+
+    This answers the question of ``test nat-policy-match`` and reports what
+    the matching rule translates the packet to, without contacting the
+    device.  The zones (and optionally the egress interface) of the packet
+    are given by the caller, just as for the operational command.
+
+    Dynamic IP and dynamic IP and port translations report the translation
+    pool rather than a single address, since the device picks the address
+    from the pool at session setup.
+
+    Example::
+
+        matcher = NatPolicyMatcher.from_tree(fw)
+        ans = matcher.test_nat_policy_match(
+            "10.1.1.1", "8.8.8.8", 6, port=443, from_zone="trust", to_zone="untrust"
+        )
+        ans["source_translation"]["pool"]
+
+    Args:
+        rules (list): NatRules in evaluation order
+        scopes (list): Containers of the objects referenced by the rules,
+            nearest scope first
+
+    Attributes:
+        rules (list): The :class:`CompiledNatRule` of enabled rules
+        unresolved (set): Names of objects that could not be resolved offline
+
+    """
+
+    def __init__(self, rules, scopes=()):
+        self.scopes = ObjectScopes(scopes)
+        self.addresses = AddressResolver(self.scopes)
+        self.services = ServiceResolver(self.scopes)
+
+        self.rules = []
+        for index, rule in enumerate(rules, 1):
+            if rule.disabled:
+                continue
+            self.rules.append(
+                CompiledNatRule(rule, index, self.addresses, self.services)
+            )
+
+        all_mask = (1 << len(self.rules)) - 1
+        self._indexes = {}
+        for field, attr in (("from_zone", "from_zones"), ("to_zone", "to_zones")):
+            index = _MaskIndex(all_mask)
+            for bit, rule in enumerate(self.rules):
+                index.add(1 << bit, getattr(rule, attr))
+            self._indexes[field] = index
+        self._all_mask = all_mask
+        self._translations = {}
+
+    @property
+    def unresolved(self):
+        return self.addresses.unresolved | self.services.unresolved
+
+    @classmethod
+    def from_tree(cls, node):
+        """Create a matcher from the NAT rules and objects of a tree
+
+        Args:
+            node: A :class:`panos.firewall.Firewall`,
+                :class:`panos.device.Vsys`, :class:`panos.panorama.DeviceGroup`,
+                or :class:`panos.panorama.Panorama` with its rules and objects
+                already refreshed
+
+        Returns:
+            NatPolicyMatcher
+
+        """
+        rulebases, scopes = policy_scopes(node)
+        rules = []
+        for rulebase in rulebases:
+            rules.extend(rulebase.findall(policies.NatRule))
+        return cls(rules, scopes)
+
+    def test_nat_policy_match(
+        self,
+        source,
+        destination,
+        protocol,
+        port=None,
+        from_zone=None,
+        to_zone=None,
+        to_interface=None,
+    ):
+        """Find the NAT rule matching a packet and its translation
+
+        Args:
+            source (str): Source IP address
+            destination (str): Destination IP address
+            protocol (int): IP protocol value
+            port (int): The destination port
+            from_zone (str): The from zone
+            to_zone (str): The to zone
+            to_interface (str): The egress interface
+
+        Returns:
+            dict: None if no rule matches, otherwise a dict with the "name"
+            and "index" (1-based position in evaluation order) of the rule,
+            and the "source_translation" and "destination_translation" dicts
+            (None if the rule does not translate that side)
+
+        """
+        flow = make_flow(
+            source,
+            destination,
+            protocol,
+            port=port,
+            from_zone=from_zone,
+            to_zone=to_zone,
+        )
+        return self._match(flow, to_interface)
+
+    def match_many(self, flows):
+        """Evaluate many packets at once
+
+        Args:
+            flows (list): Dicts with the keyword arguments of
+                :meth:`test_nat_policy_match`
+
+        Returns:
+            list: For each flow, what :meth:`test_nat_policy_match` returns
+
+        """
+        ans = []
+        for kwargs in flows:
+            kwargs = dict(kwargs)
+            to_interface = kwargs.pop("to_interface", None)
+            ans.append(self._match(make_flow(**kwargs), to_interface))
+        return ans
+
+    def _match(self, flow, to_interface):
+        mask = self._all_mask
+        for field, index in self._indexes.items():
+            mask &= index.lookup(getattr(flow, field))
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            rule = self.rules[low.bit_length() - 1]
+            if rule.matches(flow, to_interface):
+                return {
+                    "name": rule.name,
+                    "index": rule.index,
+                    "source_translation": self._source_translation(rule, flow),
+                    "destination_translation": self._destination_translation(
+                        rule, flow
+                    ),
+                }
+        return None
+
+    def _pool(self, names):
+        """Describe a translation pool: its names, ranges, and size"""
+        names = string_or_list(names) or []
+        addresses = self.addresses.resolve(names)
+        ranges = []
+        size = 0
+        for low, high in addresses.intervals:
+            size += high - low + 1
+            if low == high:
+                ranges.append(int_to_ip(low))
+            else:
+                ranges.append("{0}-{1}".format(int_to_ip(low), int_to_ip(high)))
+        return {"translated_addresses": names, "pool": ranges, "pool_size": size}
+
+    def _source_translation(self, rule, flow):
+        r = rule.rule
+        kind = r.source_translation_type
+        if kind is None:
+            return None
+
+        if kind == "static-ip":
+            ans = self._pool(r.source_translation_static_translated_address)
+            ans["type"] = kind
+            ans["bi_directional"] = bool(r.source_translation_static_bi_directional)
+            ans["address"] = self._static_address(
+                rule.source, flow.source, ans["translated_addresses"]
+            )
+            return ans
+
+        key = (id(rule), "source")
+        ans = self._translations.get(key)
+        if ans is None:
+            if r.source_translation_address_type == "interface-address":
+                ans = {"translated_addresses": [], "pool": [], "pool_size": None}
+                ans["interface"] = r.source_translation_interface
+                ans["interface_ip"] = r.source_translation_ip_address
+            else:
+                ans = self._pool(r.source_translation_translated_addresses)
+            ans["type"] = kind
+            ans["address_type"] = r.source_translation_address_type
+            if kind == "dynamic-ip" and r.source_translation_fallback_type:
+                if r.source_translation_fallback_type == "translated-address":
+                    fallback = self._pool(
+                        r.source_translation_fallback_translated_addresses
+                    )
+                else:
+                    fallback = {
+                        "interface": r.source_translation_fallback_interface,
+                        "interface_ip": r.source_translation_fallback_ip_address,
+                    }
+                fallback["type"] = r.source_translation_fallback_type
+                ans["fallback"] = fallback
+            if ans["pool_size"] == 1:
+                ans["address"] = ans["pool"][0]
+            self._translations[key] = ans
+        return dict(ans)
+
+    def _static_address(self, original, value, names):
+        """Static translation maps the original range onto the translated
+        range, offset for offset."""
+        translated = self.addresses.resolve(names).intervals
+        if not translated:
+            return None
+        start, end = translated[0]
+        offset = 0
+        if original is not None:
+            for low, high in original.intervals:
+                if low <= value <= high:
+                    offset = value - low
+                    break
+        if start + offset > end:
+            offset = 0
+        return int_to_ip(start + offset)
+
+    def _destination_translation(self, rule, flow):
+        r = rule.rule
+        if r.destination_translated_address:
+            ans = self._pool(r.destination_translated_address)
+            ans["type"] = "static"
+            ans["address"] = self._static_address(
+                rule.destination, flow.destination, ans["translated_addresses"]
+            )
+            ans["port"] = r.destination_translated_port or flow.port
+            return ans
+        if r.destination_dynamic_translated_address:
+            ans = self._pool(r.destination_dynamic_translated_address)
+            ans["type"] = "dynamic"
+            ans["distribution"] = r.destination_dynamic_translated_distribution
+            ans["port"] = r.destination_dynamic_translated_port or flow.port
+            if ans["pool_size"] == 1:
+                ans["address"] = ans["pool"][0]
+            return ans
+        return None
+
+
+def policy_scopes(node):
+    """Rulebases and object scopes that apply to a node of the tree
+
+    For a Panorama device group, the rulebases are ordered as Panorama
+    evaluates them: shared pre-rules, the pre-rules of ancestor device groups
+    from the top down, the device group's own pre and post rules, the
+    post-rules of the ancestors from the bottom up, then shared post-rules.
+    Ancestors are found through ``opstate.dg_hierarchy.parent`` of each device
+    group.
+
+    Args:
+        node: A Firewall, Vsys, DeviceGroup or Panorama
+
+    Returns:
+        tuple: (list of rulebases in evaluation order, list of containers
+        nearest scope first)
+
+    """
+    from panos import device, firewall, panorama
+
+    if isinstance(node, panorama.Panorama):
+        pre = [x for x in node.children if type(x) is policies.PreRulebase]
+        post = [x for x in node.children if type(x) is policies.PostRulebase]
+        return pre + post, [node]
+
+    if isinstance(node, panorama.DeviceGroup):
+        pano = node.parent
+        chain = [node]
+        if pano is not None:
+            groups = dict(
+                (x.uid, x) for x in pano.children if isinstance(x, panorama.DeviceGroup)
+            )
+            current = node
+            while True:
+                parent = current.opstate.dg_hierarchy.parent
+                if parent is None or parent not in groups or groups[parent] in chain:
+                    break
+                current = groups[parent]
+                chain.append(current)
+        containers = chain + ([pano] if pano is not None else [])
+
+        def rulebases(container, cls):
+            return [x for x in container.children if type(x) is cls]
+
+        pre = []
+        post = []
+        for container in reversed(containers):
+            pre.extend(rulebases(container, policies.PreRulebase))
+        for container in containers:
+            post.extend(rulebases(container, policies.PostRulebase))
+        return pre + post, containers
+
+    if isinstance(node, device.Vsys):
+        rulebases = [x for x in node.children if type(x) is policies.Rulebase]
+        return rulebases, [node, node.parent]
+
+    if isinstance(node, firewall.Firewall):
+        rulebases = [x for x in node.children if type(x) is policies.Rulebase]
+        return rulebases, [node]
+
+    rulebases = [x for x in node.children if isinstance(x, policies.Rulebase)]
+    return rulebases, [node]
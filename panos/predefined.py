@@ -17,10 +17,15 @@
 
 """Retrieving and parsing predefined objects from the firewall"""
 
+import json
+import operator
+import os
+import threading
+
 from pan.xapi import PanXapiError
 
 import panos.errors as err
-from panos import getlogger, objects
+from panos import getlogger, isstring, objects
 from panos.base import _xpath_safe
 from panos.updater import PanOSVersion
 
@@ -37,8 +42,16 @@ class Predefined(object):
     base.PanDevice class itself. There is an instance of this Predefined class
     inside every instantiated base.PanDevice class.
 
+    The full predefined catalog is large, but only changes when the content
+    version of the device changes.  If ``cache_dir`` is set, :meth:`refreshall`
+    saves the parsed catalog there, keyed by platform, PAN-OS version and
+    content version, and later loads it from there instead of retrieving it
+    from the device.  Devices in the same process with the same key also
+    share a single copy of the catalog objects.
+
     Args:
         device (base.PanDevice): The firewall or Panorama this Predefined subsystem leverages
+        cache_dir (str): Directory to store the predefined catalog cache in
 
     """
 
@@ -46,6 +59,8 @@ class Predefined(object):
     XPATH = "/config/predefined"
     SINGLE_ENTRY_XPATH = "/entry[@name={0}]"
     ALL_ENTRIES_XPATH = "/entry"
+    # Maximum number of objects retrieved per request by bulk refreshes
+    BULK_REFRESH_SIZE = 100
     CHILDTYPES = (
         "objects.ApplicationContainer",
         "objects.ApplicationObject",
@@ -53,11 +68,54 @@ class Predefined(object):
         "objects.Tag",
     )
 
-    def __init__(self, device=None, *args, **kwargs):
+    # Version of the on disk cache format
+    CACHE_FORMAT = 1
+    # Parameters holding the catalog, and the classes stored in them
+    CATALOG_PARAMS = (
+        ("application_container_objects", objects.ApplicationContainer),
+        ("application_objects", objects.ApplicationObject),
+        ("service_objects", objects.ServiceObject),
+        ("tag_objects", objects.Tag),
+    )
+
+    # ApplicationObject params indexed for query_applications()
+    APPLICATION_INDEX_PARAMS = (
+        "category",
+        "subcategory",
+        "technology",
+        "risk",
+        "default_type",
+        "default_port",
+        "default_ip_protocol",
+        "parent_app",
+        "evasive_behavior",
+        "consume_big_bandwidth",
+        "used_by_malware",
+        "able_to_transfer_file",
+        "has_known_vulnerability",
+        "tunnel_other_application",
+        "tunnel_applications",
+        "prone_to_misuse",
+        "pervasive_use",
+        "tag",
+    )
+    _QUERY_OPERATORS = {
+        "gt": operator.gt,
+        "gte": operator.ge,
+        "lt": operator.lt,
+        "lte": operator.le,
+    }
+
+    # Catalogs shared by all instances in this process, keyed by cache key
+    _shared_catalogs = {}
+    _shared_catalogs_lock = threading.Lock()
+
+    def __init__(self, device=None, cache_dir=None, *args, **kwargs):
         # Create a class logger
         self._logger = getlogger(__name__ + "." + self.__class__.__name__)
 
         self.parent = device
+        self.cache_dir = cache_dir
         self._initialize_params()
 
     def _initialize_params(self):
@@ -65,6 +123,7 @@ class Predefined(object):
         self.application_objects = {}
         self.service_objects = {}
         self.tag_objects = {}
+        self._application_index = None
 
     def _get_xml(self, xpath):
         """use the parent to get the xml given the xpath"""
@@ -73,26 +132,49 @@ class Predefined(object):
         return root.find("result")
 
     def _refresh(self, decisions, name=None):
+        """Refresh objects of the given decisions
+
+        Args:
+            decisions (list): (class, param, mandatory xml field) tuples
+            name: Name of the object to refresh, or a list of names to refresh
+                in as few requests as possible.  If None, refresh all objects.
+
+        """
         x = decisions[0][0]()
         x.parent = self
-        xpath = x.xpath_nosuffix()
-        if name is not None:
-            xpath += self.SINGLE_ENTRY_XPATH.format(_xpath_safe(name))
+        base_xpath = x.xpath_nosuffix()
+        if name is None:
+            xpaths = [base_xpath + self.ALL_ENTRIES_XPATH]
+        elif isstring(name):
+            xpaths = [base_xpath + self.SINGLE_ENTRY_XPATH.format(_xpath_safe(name))]
         else:
-            xpath += self.ALL_ENTRIES_XPATH
-
-        xml = self._get_xml(xpath)
-
-        for elm in xml:
-            for cls, param, mandatory_xml_field in decisions:
-                if (
-                    mandatory_xml_field is None
-                    or elm.find(mandatory_xml_field) is not None
-                ):
-                    inst = cls()
-                    inst.refresh(xml=elm)
-                    getattr(self, param)[inst.uid] = inst
-                    break
+            names = sorted(set(name))
+            xpaths = []
+            for idx in range(0, len(names), self.BULK_REFRESH_SIZE):
+                xpaths.append(
+                    " | ".join(
+                        base_xpath + self.SINGLE_ENTRY_XPATH.format(_xpath_safe(n))
+                        for n in names[idx : idx + self.BULK_REFRESH_SIZE]
+                    )
+                )
+
+        for xpath in xpaths:
+            xml = self._get_xml(xpath)
+            if xml is None:
+                continue
+
+            for elm in xml:
+                for cls, param, mandatory_xml_field in decisions:
+                    if (
+                        mandatory_xml_field is None
+                        or elm.find(mandatory_xml_field) is not None
+                    ):
+                        inst = cls()
+                        inst.refresh(xml=elm)
+                        getattr(self, param)[inst.uid] = inst
+                        break
+
+        self._application_index = None
 
     @property
     def vsys(self):
@@ -161,6 +243,45 @@ class Predefined(object):
         """
         return self._refresh_tag(name)
 
+    def refresh_applications(self, names):
+        """Refresh Multiple Predefined Applications
+
+        The applications and application containers are retrieved in as few
+        requests as possible, with up to ``BULK_REFRESH_SIZE`` objects each.
+
+        Args:
+            names (list): Names of the applications to refresh
+
+        """
+        if names:
+            return self._refresh_application(list(names))
+
+    def refresh_services(self, names):
+        """Refresh Multiple Predefined Services
+
+        The services are retrieved in as few requests as possible, with up
+        to ``BULK_REFRESH_SIZE`` objects each.
+
+        Args:
+            names (list): Names of the services to refresh
+
+        """
+        if names:
+            return self._refresh_service(list(names))
+
+    def refresh_tags(self, names):
+        """Refresh Multiple Predefined Tags
+
+        The tags are retrieved in as few requests as possible, with up to
+        ``BULK_REFRESH_SIZE`` objects each.
+
+        Args:
+            names (list): Names of the tags to refresh
+
+        """
+        if names:
+            return self._refresh_tag(list(names))
+
     def refreshall_applications(self):
         """Refresh all Predefined Applications
 
@@ -200,13 +321,122 @@ class Predefined(object):
         longer than a normal api request.
 
         """
+        key = self._cache_key() if self.cache_dir is not None else None
+        if key is not None and self._load_shared_catalog(key):
+            return
+
         # first we clear all existing objects
         self._initialize_params()
 
+        if key is not None and self.load_cache(self._cache_path(key)):
+            self._store_shared_catalog(key)
+            return
+
         # now we call the refresh methods
         for x in [x for x in dir(self) if x.startswith("refreshall_")]:
             getattr(self, x)()
 
+        if key is not None:
+            self.save_cache(self._cache_path(key))
+            self._store_shared_catalog(key)
+
+    def _cache_key(self):
+        """Key identifying the catalog of the device, or None if unknown"""
+        device = self.parent
+        if device is None:
+            return None
+        if device.content_version is None:
+            try:
+                device.refresh_system_info()
+            except (err.PanDeviceError, PanXapiError) as e:
+                logger.debug("Cannot determine content version: {0}".format(e))
+                return None
+        if device.content_version is None:
+            return None
+        return (
+            device.platform or "unknown",
+            device.version or "unknown",
+            device.content_version,
+        )
+
+    def _cache_path(self, key):
+        filename = "predefined-{0}.json".format(
+            "-".join("".join(c if c.isalnum() else "_" for c in x) for x in key)
+        )
+        return os.path.join(os.path.expanduser(self.cache_dir), filename)
+
+    def _load_shared_catalog(self, key):
+        with self._shared_catalogs_lock:
+            catalog = self._shared_catalogs.get(key)
+        if catalog is None:
+            return False
+        # The objects are shared, but each instance gets its own dicts so
+        # that single object refreshes don't leak into other devices.
+        for param, objs in catalog.items():
+            setattr(self, param, dict(objs))
+        self._application_index = None
+        return True
+
+    def _store_shared_catalog(self, key):
+        catalog = dict(
+            (param, dict(getattr(self, param))) for param, _ in self.CATALOG_PARAMS
+        )
+        with self._shared_catalogs_lock:
+            self._shared_catalogs[key] = catalog
+
+    def save_cache(self, path):
+        """Save the current predefined catalog to a cache file
+
+        Only the names and parameter values of the objects are saved.
+
+        Args:
+            path (str): The file to save to
+
+        """
+        data = {"format": self.CACHE_FORMAT}
+        for param, cls in self.CATALOG_PARAMS:
+            data[param] = [x.about() for x in getattr(self, param).values()]
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write to a temp file first so a concurrent reader never sees a
+        # partially written cache.
+        tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as fd:
+            json.dump(data, fd, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load_cache(self, path):
+        """Load the predefined catalog from a cache file
+
+        Objects loaded are added to the ones already present.
+
+        Args:
+            path (str): The file to load from
+
+        Returns:
+            bool: True if the cache was loaded, False if it was missing or unusable
+
+        """
+        try:
+            with open(path) as fd:
+                data = json.load(fd)
+        except (IOError, OSError, ValueError) as e:
+            logger.debug("Not using predefined cache {0}: {1}".format(path, e))
+            return False
+        if data.get("format") != self.CACHE_FORMAT:
+            return False
+
+        for param, cls in self.CATALOG_PARAMS:
+            objs = getattr(self, param)
+            for values in data.get(param, []):
+                inst = cls(**values)
+                objs[inst.uid] = inst
+        self._application_index = None
+
+        return True
+
     def application(self, name, refresh_if_none=True, include_containers=True):
         """Get a Predefined Application
 
@@ -234,6 +464,118 @@ class Predefined(object):
 
         return obj
 
+    def query_applications(self, port=None, **criteria):
+        """Find predefined applications by their parameters
+
+        Only applications already retrieved (for example by
+        :meth:`refreshall_applications`) are searched.  Lookups use indexes
+        over the parameters in ``APPLICATION_INDEX_PARAMS``, which are built on
+        first use and rebuilt after the applications are refreshed.
+
+        Each keyword argument is a parameter name and the value to match.
+        A list, tuple or set of values matches any of them, and for list
+        parameters (such as ``tag`` or ``tunnel_applications``) an
+        application matches if any of its members match.  Comparisons are
+        done by suffixing the parameter name with ``__gt``, ``__gte``,
+        ``__lt`` or ``__lte``.  All criteria must match.
+
+        Example::
+
+            # High risk apps in the "networking" category
+            fw.predefined.query_applications(category="networking", risk__gte=4)
+
+            # Apps that tunnel "ssl" or whose parent is "ssl"
+            fw.predefined.query_applications(tunnel_applications="ssl")
+            fw.predefined.query_applications(parent_app="ssl")
+
+            # Apps with tcp/443 in their default ports
+            fw.predefined.query_applications(port="tcp/443")
+
+        Args:
+            port (str): Protocol and port, eg. "tcp/443", to match against
+                the default ports of the applications, including port ranges.
+            **criteria: Parameter names and the values to match.
+
+        Returns:
+            list: The matching ApplicationObjects, sorted by name
+
+        """
+        index, ports = self._build_application_index()
+
+        matches = []
+        for key, value in criteria.items():
+            param, _, op = key.partition("__")
+            if param not in index:
+                raise ValueError("Cannot query applications by {0}".format(param))
+            values = index[param]
+            if op:
+                try:
+                    compare = self._QUERY_OPERATORS[op]
+                except KeyError:
+                    raise ValueError("Unknown query operator: {0}".format(op))
+                keys = [x for x in values if x is not None and compare(x, value)]
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                keys = value
+            else:
+                keys = (value,)
+            found = set()
+            for x in keys:
+                found.update(values.get(x, ()))
+            matches.append(found)
+
+        if port is not None:
+            protocol, _, number = port.partition("/")
+            number = int(number)
+            singles, ranges = ports.get(protocol, ({}, []))
+            found = set(singles.get(number, ()))
+            found.update(name for lo, hi, name in ranges if lo <= number <= hi)
+            matches.append(found)
+
+        if matches:
+            matches.sort(key=len)
+            names = matches[0].intersection(*matches[1:])
+        else:
+            names = self.application_objects.keys()
+
+        return [self.application_objects[x] for x in sorted(names)]
+
+    def _build_application_index(self):
+        """Returns the (param index, port index) of the applications"""
+        if self._application_index is not None:
+            index, ports, size = self._application_index
+            if size == len(self.application_objects):
+                return index, ports
+
+        index = dict((x, {}) for x in self.APPLICATION_INDEX_PARAMS)
+        # protocol -> ({port: names}, [(low, high, name), ...])
+        ports = {}
+        for name, app in self.application_objects.items():
+            for param in self.APPLICATION_INDEX_PARAMS:
+                value = getattr(app, param)
+                if isinstance(value, list):
+                    for x in value:
+                        index[param].setdefault(x, set()).add(name)
+                else:
+                    index[param].setdefault(value, set()).add(name)
+            for spec in app.default_port or ():
+                protocol, _, numbers = spec.partition("/")
+                singles, ranges = ports.setdefault(protocol, ({}, []))
+                for number in numbers.split(","):
+                    low, _, high = number.partition("-")
+                    try:
+                        low = int(low)
+                        high = int(high) if high else None
+                    except ValueError:
+                        # eg. "tcp/dynamic"
+                        continue
+                    if high is None:
+                        singles.setdefault(low, set()).add(name)
+                    else:
+                        ranges.append((low, high, name))
+
+        self._application_index = (index, ports, len(self.application_objects))
+        return index, ports
+
     def _retrieve_predefined_object_from(
         self, name, param, refresh_if_none, refresh_func
     ):
@@ -283,6 +625,9 @@ class Predefined(object):
 
         Return a list of the instances of the applications from the given names.
 
+        Applications that need to be refreshed are retrieved together, see
+        :meth:`refresh_applications`.
+
         Args:
             names (list): Names of the applications
             refresh_if_none (bool): Refresh the application(s) if it is not found
@@ -292,12 +637,22 @@ class Predefined(object):
             A list of all found ApplicationObjects or ApplicationContainerObjects
 
         """
+        names = set(names)
+        if refresh_if_none:
+            self.refresh_applications(
+                [
+                    x
+                    for x in names
+                    if self.application(x, False, include_containers) is None
+                ]
+            )
+
         objs = []
 
-        for name in set(names):
+        for name in names:
             obj = self.application(
                 name,
-                refresh_if_none=refresh_if_none,
+                refresh_if_none=False,
                 include_containers=include_containers,
             )
             if obj:
@@ -310,6 +665,9 @@ class Predefined(object):
 
         Return a list of the instances of the services from the given names.
 
+        Services that need to be refreshed are retrieved together, see
+        :meth:`refresh_services`.
+
         Args:
             names (list): Names of the services
             refresh_if_none (bool): Refresh the service(s) if it is not found
@@ -318,10 +676,14 @@ class Predefined(object):
             A list of all found ServiceObjects
 
         """
+        names = set(names)
+        if refresh_if_none:
+            self.refresh_services([x for x in names if x not in self.service_objects])
+
         objs = []
 
-        for name in set(names):
-            obj = self.service(name, refresh_if_none=refresh_if_none)
+        for name in names:
+            obj = self.service(name, refresh_if_none=False)
             if obj:
                 objs.append(obj)
 
@@ -332,6 +694,9 @@ class Predefined(object):
 
         Return a list of the instances of the tags from the given names.
 
+        Tags that need to be refreshed are retrieved together, see
+        :meth:`refresh_tags`.
+
         Args:
             names (list): Names of the tags
             refresh_if_none (bool): Refresh the tag(s) if it is not found
@@ -340,10 +705,14 @@ class Predefined(object):
             A list of all found Tags
 
         """
+        names = set(names)
+        if refresh_if_none:
+            self.refresh_tags([x for x in names if x not in self.tag_objects])
+
         objs = []
 
-        for name in set(names):
-            obj = self.tag(name, refresh_if_none=refresh_if_none)
+        for name in names:
+            obj = self.tag(name, refresh_if_none=False)
             if obj:
                 objs.append(obj)
 
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Index of the references between objects of a configuration tree"""
+
+import panos.errors as err
+from panos import (
+    device,
+    getlogger,
+    network,
+    objects,
+    panorama,
+    policies,
+    string_or_list,
+)
+
+logger = getlogger(__name__)
+
+KINDS = (
+    (objects.AddressObject, "address"),
+    (objects.AddressGroup, "address"),
+    (objects.ServiceObject, "service"),
+    (objects.ServiceGroup, "service"),
+    (objects.ApplicationObject, "application"),
+    (objects.ApplicationGroup, "application"),
+    (objects.ApplicationFilter, "application"),
+    (objects.ApplicationContainer, "application"),
+    (objects.Tag, "tag"),
+    (objects.SecurityProfileGroup, "profile-group"),
+    (objects.ScheduleObject, "schedule"),
+    (objects.LogForwardingProfile, "log-forwarding"),
+    (network.Zone, "zone"),
+    (network.Interface, "interface"),
+    (network.VirtualRouter, "virtual-router"),
+    (network.Vlan, "vlan"),
+    (network.VirtualWire, "virtual-wire"),
+    (network.IkeGateway, "ike-gateway"),
+    (network.ManagementProfile, "management-profile"),
+)
+"""Classes that can be referenced by name, and the namespace of their names"""
+
+_RULES = (
+    policies.SecurityRule,
+    policies.NatRule,
+    policies.ApplicationOverride,
+    policies.PolicyBasedForwarding,
+    policies.DecryptionRule,
+    policies.AuthenticationRule,
+)
+
+REFERENCES = (
+    (
+        _RULES,
+        "address",
+        (
+            "source",
+            "destination",
+            "source_addresses",
+            "destination_addresses",
+            "source_translation_translated_addresses",
+            "source_translation_fallback_translated_addresses",
+        ),
+    ),
+    (_RULES, "service", ("service", "services")),
+    (_RULES, "application", ("application", "applications")),
+    (
+        _RULES,
+        "zone",
+        ("fromzone", "tozone", "source_zones", "destination_zones"),
+    ),
+    (_RULES, "tag", ("tag", "tags")),
+    (_RULES, "profile-group", ("group",)),
+    (_RULES, "schedule", ("schedule",)),
+    (_RULES, "log-forwarding", ("log_setting",)),
+    (
+        _RULES,
+        "interface",
+        (
+            "to_interface",
+            "source_translation_interface",
+            "source_translation_fallback_interface",
+            "forward_egress_interface",
+        ),
+    ),
+    (
+        (
+            objects.AddressObject,
+            objects.AddressGroup,
+            objects.ServiceObject,
+            objects.ServiceGroup,
+            objects.ApplicationGroup,
+            network.VirtualWire,
+            network.Layer3Subinterface,
+            network.Layer2Subinterface,
+        ),
+        "tag",
+        ("tag",),
+    ),
+    ((objects.AddressGroup,), "address", ("static_value",)),
+    ((objects.ServiceGroup,), "service", ("value",)),
+    ((objects.ApplicationGroup,), "application", ("value",)),
+    (
+        (network.Zone, network.VirtualRouter, network.Vlan, device.Vsys),
+        "interface",
+        ("interface",),
+    ),
+    ((network.VirtualWire,), "interface", ("interface1", "interface2")),
+    ((network.IkeGateway,), "interface", ("interface",)),
+    ((network.IpsecTunnel,), "interface", ("tunnel_interface",)),
+    ((network.IpsecTunnel,), "ike-gateway", ("ak_ike_gateway",)),
+    ((network.Interface,), "management-profile", ("management_profile",)),
+    ((network.Zone,), "log-forwarding", ("log_setting",)),
+    ((device.Vsys,), "vlan", ("vlans",)),
+    ((device.Vsys,), "virtual-wire", ("virtual_wires",)),
+    ((device.Vsys,), "virtual-router", ("virtual_routers",)),
+)
+"""(referrer classes, namespace, params) of the params holding references"""
+
+MATCH_PARAMS = frozenset(
+    (
+        "source",
+        "destination",
+        "source_addresses",
+        "destination_addresses",
+        "service",
+        "services",
+        "application",
+        "applications",
+        "fromzone",
+        "tozone",
+        "source_zones",
+        "destination_zones",
+    )
+)
+"""Params of rules that match "any" when empty"""
+
+
+def kind_of(obj):
+    """Return the namespace of the names of an object, or None"""
+    for cls, kind in KINDS:
+        if isinstance(obj, cls):
+            return kind
+    return None
+
+
+class ReferenceGraph(object):
+    """Index of which objects reference which other objects
+
+    References are found in the params listed in :data:`REFERENCES`, such as
+    the addresses of a security rule, the members of an address group, or the
+    interfaces of a zone.  Names are resolved the way PAN-OS does it: from the
+    nearest scope of the referring object outwards (vsys, then the firewall;
+    device group, then its ancestors, then shared).
+
+    The graph is not updated automatically.  After changing the params of an
+    object in the tree, call :meth:`update` with the object; after adding or
+    removing objects from the tree, call :meth:`add` or :meth:`remove`.
+
+    Example::
+
+        graph = ReferenceGraph(pano)
+        for obj in graph.unreferenced(AddressObject):
+            obj.delete()
+            graph.remove(obj)
+
+    Args:
+        root (PanObject): Add this object and all its descendants to the graph
+
+    """
+
+    def __init__(self, root=None):
+        # (kind, name) => {id(referrer): referrer}
+        self._edges = {}
+        # id(referrer) => set of (kind, name)
+        self._out = {}
+        # (id(container), kind) => {name: obj}
+        self._defined = {}
+        # id(obj) => ((id(container), kind), name) of defined objects
+        self._names = {}
+        # kind => {id(obj): obj}
+        self._objects = {}
+        # id(panorama) => {name: device group}
+        self._device_groups = {}
+        if root is not None:
+            self.add(root)
+
+    def add(self, obj, recursive=True):
+        """Add an object to the graph
+
+        Args:
+            obj (PanObject): The object
+            recursive (bool): Also add all of its descendants
+
+        """
+        nodes = [obj]
+        while nodes:
+            node = nodes.pop()
+            self._index(node)
+            if recursive:
+                nodes.extend(node.children)
+
+    def remove(self, obj, recursive=True):
+        """Remove an object, and the references it has, from the graph
+
+        Args:
+            obj (PanObject): The object
+            recursive (bool): Also remove all of its descendants
+
+        """
+        nodes = [obj]
+        while nodes:
+            node = nodes.pop()
+            self._unindex(node)
+            if recursive:
+                nodes.extend(node.children)
+
+    def update(self, obj):
+        """Update the references of an object after its params changed"""
+        self._unindex(obj)
+        self._index(obj)
+
+    def referrers(self, obj):
+        """Return the objects referencing this object
+
+        Args:
+            obj (PanObject): The referenced object
+
+        Returns:
+            list
+
+        """
+        kind = kind_of(obj)
+        if kind is None:
+            return []
+        candidates = self._edges.get((kind, obj.uid), {})
+        return [x for x in candidates.values() if self.resolve(x, kind, obj.uid) is obj]
+
+    def references(self, obj):
+        """Return the objects referenced by this object
+
+        Names that do not resolve to an object in the graph are skipped.
+
+        Returns:
+            list
+
+        """
+        ans = []
+        for kind, name in sorted(self._out.get(id(obj), ())):
+            target = self.resolve(obj, kind, name)
+            if target is not None:
+                ans.append(target)
+        return ans
+
+    def unreferenced(self, class_type):
+        """Return the objects of this class that nothing references
+
+        Args:
+            class_type (type): The class, such as
+                :class:`panos.objects.AddressObject`
+
+        Returns:
+            list
+
+        """
+        kind = None
+        for cls, x in KINDS:
+            if issubclass(class_type, cls):
+                kind = x
+                break
+        if kind is None:
+            return []
+        return [
+            x
+            for x in self._objects.get(kind, {}).values()
+            if isinstance(x, class_type) and not self.referrers(x)
+        ]
+
+    def resolve(self, referrer, kind, name):
+        """Resolve a name as seen from the referring object
+
+        Args:
+            referrer (PanObject): The object using the name
+            kind (str): The namespace of the name, such as "address"
+            name (str): The name
+
+        Returns:
+            The nearest object with this name, or None
+
+        """
+        for container in self._scopes(referrer):
+            obj = self._defined.get((id(container), kind), {}).get(name)
+            if obj is not None:
+                return obj
+        return None
+
+    def remove_references(self, obj, update=False):
+        """Remove the name of this object from all objects referencing it
+
+        A rule is never left with an empty source, destination, service,
+        application, or zone list, since that would make it match "any":
+        if removing the name would do so, nothing is changed and an error is
+        raised, so that these rules can be changed or deleted first.
+
+        Args:
+            obj (PanObject): The referenced object
+            update (bool): Apply the changes to the live device
+
+        Returns:
+            list: The objects that were changed
+
+        Raises:
+            PanObjectError: A rule only references this object in one of
+                its match params
+
+        """
+        kind = kind_of(obj)
+        name = obj.uid
+        changes = []
+        conflicts = []
+        for referrer in self.referrers(obj):
+            params = []
+            for param in self._params(referrer, kind):
+                value = getattr(referrer, param)
+                if isinstance(value, list):
+                    kept = [x for x in value if str(x) != name]
+                    if len(kept) == len(value):
+                        continue
+                    value = kept or None
+                elif value is not None and str(value) == name:
+                    value = None
+                else:
+                    continue
+                if value is None and param in MATCH_PARAMS:
+                    if isinstance(referrer, _RULES):
+                        conflicts.append("{0} ({1})".format(referrer.uid, param))
+                params.append((param, value))
+            changes.append((referrer, params))
+        if conflicts:
+            raise err.PanObjectError(
+                "Removing {0} would make these rules match any: {1}".format(
+                    name, ", ".join(conflicts)
+                )
+            )
+
+        for referrer, params in changes:
+            for param, value in params:
+                setattr(referrer, param, value)
+                if update:
+                    referrer.update(param)
+            self.update(referrer)
+        return [x[0] for x in changes]
+
+    def _params(self, obj, kind):
+        for classes, ref_kind, params in REFERENCES:
+            if ref_kind == kind and isinstance(obj, classes):
+                for param in params:
+                    if hasattr(obj, param):
+                        yield param
+
+    def _index(self, node):
+        kind = kind_of(node)
+        if kind is not None:
+            self._objects.setdefault(kind, {})[id(node)] = node
+            key = (id(_container(node)), kind)
+            self._defined.setdefault(key, {})[node.uid] = node
+            self._names[id(node)] = (key, node.uid)
+        if isinstance(node, panorama.DeviceGroup) and node.parent is not None:
+            self._device_groups.setdefault(id(node.parent), {})[node.uid] = node
+
+        out = set()
+        for classes, ref_kind, params in REFERENCES:
+            if not isinstance(node, classes):
+                continue
+            for param in params:
+                for value in string_or_list(getattr(node, param, None)) or []:
+                    name = str(value)
+                    if name != "any":
+                        out.add((ref_kind, name))
+        if out:
+            self._out[id(node)] = out
+            for key in out:
+                self._edges.setdefault(key, {})[id(node)] = node
+
+    def _unindex(self, node):
+        kind = kind_of(node)
+        if kind is not None:
+            self._objects.get(kind, {}).pop(id(node), None)
+        # Use the name the object had when it was indexed, in case it changed.
+        key, name = self._names.pop(id(node), (None, None))
+        if key is not None:
+            defined = self._defined.get(key, {})
+            if defined.get(name) is node:
+                del defined[name]
+        if isinstance(node, panorama.DeviceGroup) and node.parent is not None:
+            groups = self._device_groups.get(id(node.parent), {})
+            if groups.get(node.uid) is node:
+                del groups[node.uid]
+
+        for key in self._out.pop(id(node), ()):
+            edges = self._edges.get(key)
+            if edges is not None:
+                edges.pop(id(node), None)
+                if not edges:
+                    del self._edges[key]
+
+    def _scopes(self, referrer):
+        """Containers whose objects are visible from the referrer, nearest first"""
+        seen = set()
+        node = referrer.parent
+        while node is not None and id(node) not in seen:
+            seen.add(id(node))
+            yield node
+            if isinstance(node, panorama.DeviceGroup):
+                parent_name = node.opstate.dg_hierarchy.parent
+                groups = self._device_groups.get(id(node.parent), {})
+                if parent_name in groups:
+                    node = groups[parent_name]
+                    continue
+            node = node.parent
+
+
+def _container(node):
+    """The container defining the name of an object
+
+    Subinterfaces are children of their parent interface, but their names
+    are defined at the same level as the parent interface.
+
+    """
+    parent = node.parent
+    while isinstance(parent, network.Interface):
+        parent = parent.parent
+    return parent
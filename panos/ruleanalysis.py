@@ -0,0 +1,767 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Find shadowed, redundant, and mergeable rules in a rulebase
+
+Rules are compiled with :mod:`panos.policymatch`, so the analysis has the same
+offline limitations: objects that cannot be resolved offline (such as FQDN
+address objects) are treated as matching nothing, and are listed in the
+``unresolved`` attribute of the analyzer.
+
+"""
+
+import heapq
+from collections import namedtuple
+
+from panos import getlogger, policies, string_or_list
+from panos.policymatch import (
+    AddressResolver,
+    ApplicationResolver,
+    CompiledNatRule,
+    CompiledSecurityRule,
+    ObjectScopes,
+    ServiceResolver,
+    policy_scopes,
+)
+
+logger = getlogger(__name__)
+
+SHADOWED = "shadowed"
+"""The rule is covered by an earlier rule with a different outcome"""
+REDUNDANT = "redundant"
+"""The rule can be removed without changing the outcome of any flow"""
+MERGEABLE = "mergeable"
+"""The rules only differ in one match criteria and can be combined"""
+
+Finding = namedtuple("Finding", ["kind", "rule", "related", "dimension"])
+"""A result of the analysis
+
+Attributes:
+    kind (str): One of SHADOWED, REDUNDANT, or MERGEABLE
+    rule: The rule the finding is about
+    related (list): The rules causing the finding.  For MERGEABLE, the rules
+        that can be merged into ``rule``.
+    dimension (str): For MERGEABLE, the match criteria that differs
+
+"""
+
+SECURITY_OUTCOME_PARAMS = (
+    "action",
+    "log_start",
+    "log_end",
+    "log_setting",
+    "group",
+    "virus",
+    "spyware",
+    "vulnerability",
+    "url_filtering",
+    "file_blocking",
+    "wildfire_analysis",
+    "data_filtering",
+    "disable_server_response_inspection",
+    "icmp_unreachable",
+)
+"""SecurityRule params that are part of what happens to matching traffic"""
+
+SECURITY_OPAQUE_PARAMS = (
+    "schedule",
+    "hip_profiles",
+    "source_devices",
+    "destination_devices",
+)
+"""SecurityRule match params that are not resolved offline, only compared"""
+
+NAT_OUTCOME_PARAMS = tuple(
+    x
+    for x in policies.NatRule("x").about()
+    if x.startswith(("source_translation_", "destination_")) or x == "ha_binding"
+)
+"""NatRule params that are part of what happens to matching traffic"""
+
+_UNNAMED_USERS = ("any", "unknown", "pre-logon", "known-user")
+
+
+class _Dimension(object):
+    """One match criteria of a compiled rule
+
+    Args:
+        name (str): The name of the criteria
+        getter: Callable returning the value of the criteria of a compiled rule
+        covers: Callable(a, b) telling if a matches everything b matches
+        intersects: Callable(a, b) telling if a and b may match the same
+            traffic.  False positives are allowed, false negatives are not.
+        key: Callable returning a hashable version of the value
+        indexed (bool): Values are a frozenset or None and are indexed by
+            value, in which case ``covers`` and ``intersects`` are not used.
+        mergeable (bool): Rules differing only in this criteria can be merged
+
+    """
+
+    def __init__(
+        self, name, getter, covers, intersects, key=None, indexed=False, mergeable=True
+    ):
+        self.name = name
+        self.getter = getter
+        self.covers = covers
+        self.intersects = intersects
+        self.key = key or (lambda x: x)
+        self.indexed = indexed
+        self.mergeable = mergeable
+
+
+def _covers_equal(a, b):
+    return a is None or a == b
+
+
+def _intersects_equal(a, b):
+    return a is None or b is None or a == b
+
+
+def _always(a, b):
+    return True
+
+
+def _covers_address(a, b):
+    addresses, negate = a
+    if addresses is None:
+        return True
+    if b[0] is None or negate != b[1]:
+        return False
+    if negate:
+        return b[0].issuperset(addresses)
+    return addresses.issuperset(b[0])
+
+
+def _intersects_address(a, b):
+    if a[0] is None or b[0] is None or a[1] or b[1]:
+        return True
+    return a[0].intersects(b[0])
+
+
+def _address_key(value):
+    return (None if value[0] is None else value[0].key, value[1])
+
+
+def _covers_service(a, b):
+    services, app_default = a
+    if services is None:
+        return True
+    if b[0] is None or (b[1] and not app_default):
+        return False
+    for proto, ports in b[0].items():
+        if proto not in services or not services[proto].issuperset(ports):
+            return False
+    return True
+
+
+def _intersects_service(a, b):
+    if a[0] is None or b[0] is None or a[1] or b[1]:
+        return True
+    for proto, ports in a[0].items():
+        if proto in b[0] and ports.intersects(b[0][proto]):
+            return True
+    return False
+
+
+def _service_key(value):
+    if value[0] is None:
+        return (None, value[1])
+    return (tuple(sorted((k, v.key) for k, v in value[0].items())), value[1])
+
+
+def _covers_type(a, b):
+    return a == "universal" or a == b
+
+
+def _intersects_type(a, b):
+    return a == "universal" or b == "universal" or a == b
+
+
+def _covers_opaque(a, b):
+    return all(x is None or x == y for x, y in zip(a, b))
+
+
+def _covers_target(a, b):
+    return a[0] is None or a == b
+
+
+def _set_or_none(value):
+    value = string_or_list(value)
+    if not value or "any" in value:
+        return None
+    return frozenset(value)
+
+
+def _target(rule):
+    return (_set_or_none(rule.target), bool(rule.negate_target))
+
+
+SECURITY_DIMENSIONS = (
+    _Dimension("fromzone", lambda c: c.from_zones, None, None, indexed=True),
+    _Dimension("tozone", lambda c: c.to_zones, None, None, indexed=True),
+    _Dimension(
+        "source",
+        lambda c: (c.source, c.negate_source),
+        _covers_address,
+        _intersects_address,
+        _address_key,
+    ),
+    _Dimension(
+        "destination",
+        lambda c: (c.destination, c.negate_destination),
+        _covers_address,
+        _intersects_address,
+        _address_key,
+    ),
+    _Dimension("source_user", lambda c: c.users, None, None, indexed=True),
+    _Dimension("application", lambda c: c.applications, None, None, indexed=True),
+    _Dimension("category", lambda c: c.categories, None, None, indexed=True),
+    _Dimension(
+        "service",
+        lambda c: (c.services, c.application_default),
+        _covers_service,
+        _intersects_service,
+        _service_key,
+    ),
+    _Dimension(
+        "type", lambda c: c.type, _covers_type, _intersects_type, mergeable=False
+    ),
+    _Dimension(
+        "target",
+        lambda c: _target(c.rule),
+        _covers_target,
+        _always,
+        mergeable=False,
+    ),
+    _Dimension(
+        "other",
+        lambda c: tuple(
+            _set_or_none(getattr(c.rule, x)) for x in SECURITY_OPAQUE_PARAMS
+        ),
+        _covers_opaque,
+        _always,
+        mergeable=False,
+    ),
+)
+
+NAT_DIMENSIONS = (
+    _Dimension("fromzone", lambda c: c.from_zones, None, None, indexed=True),
+    _Dimension("tozone", lambda c: c.to_zones, None, None, indexed=True),
+    _Dimension(
+        "to_interface",
+        lambda c: c.to_interface,
+        _covers_equal,
+        _intersects_equal,
+        mergeable=False,
+    ),
+    _Dimension(
+        "nat_type",
+        lambda c: c.nat_type,
+        lambda a, b: a == b,
+        lambda a, b: a == b,
+        mergeable=False,
+    ),
+    _Dimension(
+        "source",
+        lambda c: (c.source, False),
+        _covers_address,
+        _intersects_address,
+        _address_key,
+    ),
+    _Dimension(
+        "destination",
+        lambda c: (c.destination, False),
+        _covers_address,
+        _intersects_address,
+        _address_key,
+    ),
+    _Dimension(
+        "service",
+        lambda c: (c.services, False),
+        _covers_service,
+        _intersects_service,
+        _service_key,
+        mergeable=False,
+    ),
+    _Dimension(
+        "target",
+        lambda c: _target(c.rule),
+        _covers_target,
+        _always,
+        mergeable=False,
+    ),
+)
+
+
+class _SetIndex(object):
+    """Bit masks of the rules by value for one indexed dimension"""
+
+    def __init__(self, values, all_mask, users=False):
+        self.all_mask = all_mask
+        self.any_mask = 0
+        self.masks = {}
+        for bit, value in enumerate(values):
+            if value is None:
+                self.any_mask |= 1 << bit
+            else:
+                for x in value:
+                    self.masks[x] = self.masks.get(x, 0) | (1 << bit)
+        self.users = users
+        self.named_mask = 0
+        if users:
+            for x, mask in self.masks.items():
+                if x not in _UNNAMED_USERS:
+                    self.named_mask |= mask
+
+    def _mask(self, x):
+        mask = self.masks.get(x, 0)
+        if self.users and x not in _UNNAMED_USERS:
+            mask |= self.masks.get("known-user", 0)
+        return mask
+
+    def covering(self, value):
+        """Mask of the rules matching every value of ``value``"""
+        if value is None:
+            return self.any_mask
+        mask = self.all_mask
+        for x in value:
+            mask &= self._mask(x)
+        return self.any_mask | mask
+
+    def intersecting(self, value):
+        """Mask of the rules matching at least one value of ``value``"""
+        if value is None:
+            return self.all_mask
+        mask = self.any_mask
+        for x in value:
+            mask |= self._mask(x)
+        if self.users and "known-user" in value:
+            mask |= self.named_mask
+        return mask
+
+
+class RuleAnalyzer(object):
+    """Find shadowed, redundant, and mergeable rules
+
+    The analysis works on rules in evaluation order:
+
+    * A rule is **shadowed** if an earlier rule matches everything it matches
+      but does something else with it (different action, profiles, or NAT
+      translation), so the rule never takes effect.
+    * A rule is **redundant** if an earlier rule matches everything it matches
+      and does the same thing, or if a later rule does and no rule in between
+      handles any of the same traffic differently.
+    * Rules are **mergeable** if they do the same thing and differ in only one
+      match criteria, and no rule in between handles the traffic of the rules
+      being merged differently.
+
+    Instead of comparing every pair of rules, candidates are found with a bit
+    mask index per match criteria, and only candidates have their addresses
+    and services compared.
+
+    Example::
+
+        analyzer = RuleAnalyzer.from_tree(device_group)
+        for finding in analyzer.analyze():
+            print(finding.kind, finding.rule.uid, [x.uid for x in finding.related])
+
+    Args:
+        rules (list): SecurityRules or NatRules in evaluation order
+        scopes (list): Containers of the objects referenced by the rules,
+            nearest scope first
+        predefined (panos.predefined.Predefined): Predefined objects subsystem
+
+    """
+
+    def __init__(self, rules, scopes=(), predefined=None):
+        rules = list(rules)
+        self.scopes = ObjectScopes(scopes)
+        self.addresses = AddressResolver(self.scopes)
+        self.services = ServiceResolver(self.scopes)
+        self.applications = ApplicationResolver(self.scopes, predefined)
+        self.is_nat = bool(rules) and all(
+            isinstance(x, policies.NatRule) for x in rules
+        )
+        if self.is_nat:
+            self.dimensions = NAT_DIMENSIONS
+            outcome_params = NAT_OUTCOME_PARAMS
+        else:
+            self.dimensions = SECURITY_DIMENSIONS
+            outcome_params = SECURITY_OUTCOME_PARAMS
+
+        self.all_rules = rules
+        self.rules = []
+        for index, rule in enumerate(rules, 1):
+            if rule.disabled:
+                continue
+            if self.is_nat:
+                compiled = CompiledNatRule(rule, index, self.addresses, self.services)
+            else:
+                compiled = CompiledSecurityRule(
+                    rule, index, self.addresses, self.services, self.applications
+                )
+            self.rules.append(compiled)
+
+        # Rules referencing objects that can't be resolved offline are never
+        # reported, never cover another rule, and are assumed to overlap
+        # with every other rule.
+        self._unknown = set()
+        for pos, compiled in enumerate(self.rules):
+            rule = compiled.rule
+            addresses = set(string_or_list(rule.source) or [])
+            addresses.update(string_or_list(rule.destination) or [])
+            services = string_or_list(rule.service) or []
+            if self.addresses.incomplete.intersection(
+                addresses
+            ) or self.services.incomplete.intersection(services):
+                self._unknown.add(pos)
+
+        count = len(self.rules)
+        self._all_mask = (1 << count) - 1
+        self._known_mask = self._all_mask
+        for pos in self._unknown:
+            self._known_mask &= ~(1 << pos)
+        self._values = [[d.getter(c) for d in self.dimensions] for c in self.rules]
+        self._outcomes = []
+        self._outcome_masks = {}
+        for bit, compiled in enumerate(self.rules):
+            outcome = tuple(
+                _hashable(getattr(compiled.rule, x)) for x in outcome_params
+            )
+            self._outcomes.append(outcome)
+            self._outcome_masks[outcome] = self._outcome_masks.get(outcome, 0) | (
+                1 << bit
+            )
+
+        self._indexes = {}
+        for pos, dim in enumerate(self.dimensions):
+            if dim.indexed:
+                self._indexes[pos] = _SetIndex(
+                    [x[pos] for x in self._values],
+                    self._all_mask,
+                    users=dim.name == "source_user",
+                )
+
+    @classmethod
+    def from_tree(cls, node, rule_type=policies.SecurityRule, predefined=None):
+        """Create an analyzer for the rules of a node of the tree
+
+        For a device group, the pre and post rulebases of the device group,
+        its ancestors, and shared are analyzed together, in evaluation order.
+
+        Args:
+            node: A :class:`panos.firewall.Firewall`,
+                :class:`panos.device.Vsys`, :class:`panos.panorama.DeviceGroup`,
+                or :class:`panos.panorama.Panorama` with its rules and objects
+                already refreshed
+            rule_type (type): :class:`panos.policies.SecurityRule` or
+                :class:`panos.policies.NatRule`
+            predefined (panos.predefined.Predefined): Predefined objects
+                subsystem.  Defaults to the one of the nearest device, if any.
+
+        Returns:
+            RuleAnalyzer
+
+        """
+        if predefined is None:
+            try:
+                predefined = node.nearest_pandevice().predefined
+            except Exception:
+                predefined = None
+        rulebases, scopes = policy_scopes(node)
+        rules = []
+        for rulebase in rulebases:
+            rules.extend(rulebase.findall(rule_type))
+        return cls(rules, scopes, predefined)
+
+    @property
+    def unresolved(self):
+        return self.addresses.unresolved | self.services.unresolved
+
+    def _covering(self, pos):
+        """Mask of the resolved rules whose indexed criteria cover the rule at pos"""
+        mask = self._known_mask
+        for dim_pos, index in self._indexes.items():
+            mask &= index.covering(self._values[pos][dim_pos])
+            if not mask:
+                break
+        return mask
+
+    def _intersecting(self, pos):
+        """Mask of the rules whose indexed criteria intersect the rule at pos"""
+        mask = self._all_mask
+        for dim_pos, index in self._indexes.items():
+            mask &= index.intersecting(self._values[pos][dim_pos])
+            if not mask:
+                break
+        return mask
+
+    def covers(self, a, b):
+        """Check if the rule at position a matches all that the rule at b does
+
+        A rule referencing objects that can't be resolved offline covers no
+        other rule, since what it matches isn't fully known.
+
+        """
+        if a in self._unknown:
+            return False
+        for dim_pos, dim in enumerate(self.dimensions):
+            if dim.indexed:
+                x, y = self._values[a][dim_pos], self._values[b][dim_pos]
+                if x is None:
+                    continue
+                if y is None:
+                    return False
+                if not x >= y:
+                    if dim.name != "source_user" or not _covers_users(x, y):
+                        return False
+            elif not dim.covers(self._values[a][dim_pos], self._values[b][dim_pos]):
+                return False
+        return True
+
+    def _intersects(self, a, b):
+        for dim_pos, dim in enumerate(self.dimensions):
+            if dim.indexed:
+                continue
+            if not dim.intersects(self._values[a][dim_pos], self._values[b][dim_pos]):
+                return False
+        return True
+
+    def _conflicts(self, pos, first, last):
+        """Check if rules strictly between first and last, with a different
+        outcome than the rule at pos, may match some of its traffic"""
+        between = ((1 << last) - 1) & ~((1 << (first + 1)) - 1)
+        same = self._outcome_masks[self._outcomes[pos]]
+        mask = self._intersecting(pos) & between & ~same
+        for other in _bits(mask):
+            if other in self._unknown or self._intersects(pos, other):
+                return True
+        return False
+
+    def analyze(self):
+        """Run the analysis
+
+        Returns:
+            list: :class:`Finding` instances, sorted by rule position
+
+        """
+        findings = []
+        removable = set()
+        for pos in range(len(self.rules)):
+            if pos in self._unknown:
+                continue
+            covering = self._covering(pos)
+
+            earlier = covering & ((1 << pos) - 1)
+            cover = next((x for x in _bits(earlier) if self.covers(x, pos)), None)
+            if cover is not None:
+                kind = (
+                    REDUNDANT
+                    if self._outcomes[cover] == self._outcomes[pos]
+                    else SHADOWED
+                )
+                findings.append(
+                    Finding(kind, self.rules[pos].rule, [self.rules[cover].rule], None)
+                )
+                removable.add(pos)
+                continue
+
+            later = covering & ~((1 << (pos + 1)) - 1)
+            later &= self._outcome_masks[self._outcomes[pos]]
+            # A later rule that this rule also covers is equivalent to it, and
+            # is reported as redundant with this one instead, so that one of
+            # them is kept.
+            cover = next(
+                (
+                    x
+                    for x in _bits(later)
+                    if x not in removable
+                    and self.covers(x, pos)
+                    and not self.covers(pos, x)
+                ),
+                None,
+            )
+            # Rules further down have at least the same rules in between, so
+            # only the nearest covering rule needs to be checked.
+            if cover is not None and not self._conflicts(pos, pos, cover):
+                findings.append(
+                    Finding(
+                        REDUNDANT, self.rules[pos].rule, [self.rules[cover].rule], None
+                    )
+                )
+                removable.add(pos)
+
+        findings.extend(self._mergeable(removable))
+        positions = dict((id(c.rule), p) for p, c in enumerate(self.rules))
+        findings.sort(key=lambda x: positions[id(x.rule)])
+        return findings
+
+    def order_by_rate(self, rates):
+        """Compute a rule order with the most hit rules first
+
+        Rules are sorted by descending hit rate, except that a rule never
+        moves above an earlier rule of the same rulebase that may match some
+        of the same traffic with a different outcome, so the outcome of every
+        flow stays the same.  Disabled rules stay right after the rule they
+        currently follow.
+
+        Example::
+
+            sampler = HitCountSampler([rulebase])
+            ...
+            analyzer = RuleAnalyzer.from_tree(fw)
+            for rulebase, rules in analyzer.order_by_rate(sampler.rates()):
+                rulebase.reorder(rules)
+
+        Args:
+            rates (dict): Rule name to hit rate, such as the output of
+                :meth:`panos.policies.HitCountSampler.rates`.  Missing rules
+                have a rate of 0.
+
+        Returns:
+            list: (rulebase, list of rules in the desired order) tuples
+
+        """
+        positions = dict((id(c.rule), p) for p, c in enumerate(self.rules))
+        unknown_mask = 0
+        for pos in self._unknown:
+            unknown_mask |= 1 << pos
+
+        groups = []
+        by_parent = {}
+        for rule in self.all_rules:
+            key = id(rule.parent)
+            if key not in by_parent:
+                by_parent[key] = []
+                groups.append((rule.parent, by_parent[key]))
+            by_parent[key].append(rule)
+
+        ans = []
+        for parent, rules in groups:
+            # Disabled rules follow the enabled rule they are after.
+            leading = []
+            followers = {}
+            enabled = []
+            for rule in rules:
+                pos = positions.get(id(rule))
+                if pos is not None:
+                    enabled.append(pos)
+                    followers[pos] = []
+                elif enabled:
+                    followers[enabled[-1]].append(rule)
+                else:
+                    leading.append(rule)
+
+            group_mask = 0
+            for pos in enabled:
+                group_mask |= 1 << pos
+            indegree = dict((pos, 0) for pos in enabled)
+            successors = dict((pos, []) for pos in enabled)
+            for pos in enabled:
+                mask = group_mask & ((1 << pos) - 1)
+                mask &= ~self._outcome_masks[self._outcomes[pos]]
+                if pos not in self._unknown:
+                    mask &= self._intersecting(pos) | unknown_mask
+                for other in _bits(mask):
+                    if (
+                        pos in self._unknown
+                        or other in self._unknown
+                        or self._intersects(other, pos)
+                    ):
+                        successors[other].append(pos)
+                        indegree[pos] += 1
+
+            def priority(pos):
+                return (-rates.get(self.rules[pos].name, 0), pos)
+
+            heap = [priority(x) for x in enabled if not indegree[x]]
+            heapq.heapify(heap)
+            desired = list(leading)
+            while heap:
+                pos = heapq.heappop(heap)[1]
+                desired.append(self.rules[pos].rule)
+                desired.extend(followers[pos])
+                for other in successors[pos]:
+                    indegree[other] -= 1
+                    if not indegree[other]:
+                        heapq.heappush(heap, priority(other))
+            ans.append((parent, desired))
+
+        return ans
+
+    def _mergeable(self, removable):
+        findings = []
+        keys = [
+            [dim.key(value) for dim, value in zip(self.dimensions, values)]
+            for values in self._values
+        ]
+        for dim_pos, dim in enumerate(self.dimensions):
+            if not dim.mergeable:
+                continue
+            groups = {}
+            for pos in range(len(self.rules)):
+                if pos in removable or pos in self._unknown:
+                    continue
+                signature = (
+                    self._outcomes[pos],
+                    tuple(keys[pos][:dim_pos] + keys[pos][dim_pos + 1 :]),
+                )
+                groups.setdefault(signature, []).append(pos)
+
+            for members in groups.values():
+                if len(members) < 2:
+                    continue
+                head, merged = members[0], []
+                for pos in members[1:]:
+                    if not self._conflicts(pos, head, pos):
+                        merged.append(pos)
+                        continue
+                    if merged:
+                        findings.append(self._merge_finding(head, merged, dim))
+                    head, merged = pos, []
+                if merged:
+                    findings.append(self._merge_finding(head, merged, dim))
+        return findings
+
+    def _merge_finding(self, head, merged, dim):
+        return Finding(
+            MERGEABLE,
+            self.rules[head].rule,
+            [self.rules[x].rule for x in merged],
+            dim.name,
+        )
+
+
+def _covers_users(a, b):
+    for user in b:
+        if user not in a and (user in _UNNAMED_USERS or "known-user" not in a):
+            return False
+    return True
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _bits(mask):
+    """Positions of the set bits of a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        mask ^= low
+        yield low.bit_length() - 1
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2026, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+
+"""Save and load configuration trees as compact snapshots
+
+A snapshot holds the children of a node, such as a
+:class:`panos.firewall.Firewall` or :class:`panos.panorama.Panorama`, and all
+of their descendants.  For each object only its class, its name, the values
+of its params, and its children are stored, so snapshots are small and quick
+to load compared to refreshing the tree from the device again.
+
+Loading a snapshot adds the objects to a node of a tree, usually a live
+device, without making any API calls.
+
+Example::
+
+    fw = Firewall("10.0.0.1", "admin", "password")
+    try:
+        with open("fw.snapshot", "rb") as f:
+            snapshot.load(f, fw)
+    except IOError:
+        fw.refresh_full_config()
+        with open("fw.snapshot", "wb") as f:
+            snapshot.dump(fw, f)
+
+A snapshot is the pickled header, with the format and metadata, followed by
+the pickled objects, whether written with :func:`dump` or :func:`dumps`.
+Snapshots use :mod:`pickle`, so only load snapshots from a trusted source.
+
+"""
+
+import importlib
+import io
+import pickle
+
+from panos import getlogger
+from panos.base import PanDevice, VersionedPanObject, _clone
+
+logger = getlogger(__name__)
+
+FORMAT = 1
+"""The version of the snapshot format"""
+
+_DEVICE_ATTRS = (
+    "hostname",
+    "serial",
+    "vsys",
+    "multi_vsys",
+    "vsys_name",
+    "serial_ha_peer",
+    "management_ip",
+    "version",
+)
+"""Attributes saved for devices in the tree, such as firewalls in Panorama"""
+
+
+def dump(node, fp, metadata=None):
+    """Write a snapshot of the children of a node to a file
+
+    Args:
+        node (PanObject): The node, usually a firewall or Panorama
+        fp: A file object opened for writing in binary mode
+        metadata (dict): Anything else to save with the snapshot, such as
+            the version of the configuration, for :func:`load_metadata`
+
+    """
+    header, body = _encode(node, metadata)
+    pickle.dump(header, fp, pickle.HIGHEST_PROTOCOL)
+    pickle.dump(body, fp, pickle.HIGHEST_PROTOCOL)
+
+
+def dumps(node, metadata=None):
+    """Return a snapshot of the children of a node as bytes
+
+    See :func:`dump` for the args.
+
+    Returns:
+        bytes
+
+    """
+    fp = io.BytesIO()
+    dump(node, fp, metadata)
+    return fp.getvalue()
+
+
+def load(fp, node):
+    """Add the objects of a snapshot file to a node
+
+    The current children of the node are removed first.  If the nearest
+    device of the node has no PAN-OS version yet, the version the snapshot
+    was taken with is used, so no API call is needed to get it.
+
+    Args:
+        fp: A file object opened for reading in binary mode
+        node (PanObject): The node, usually a firewall or Panorama
+
+    Returns:
+        list: The new children of the node
+
+    """
+    header = pickle.load(fp)
+    body = pickle.load(fp)
+    return _decode(header, body, node)
+
+
+def loads(data, node):
+    """Add the objects of a snapshot in bytes to a node
+
+    See :func:`load` for the args.
+
+    Returns:
+        list: The new children of the node
+
+    """
+    return load(io.BytesIO(data), node)
+
+
+def load_metadata(fp):
+    """Read only the metadata of a snapshot file
+
+    This is quick even for large snapshots, so it can be used to decide
+    whether a snapshot is still current before loading it.
+
+    Args:
+        fp: A file object opened for reading in binary mode
+
+    Returns:
+        dict
+
+    """
+    header = pickle.load(fp)
+    _check_format(header)
+    return header["metadata"]
+
+
+def _encode(node, metadata):
+    classes = {}
+    class_table = []
+
+    def encode(obj):
+        cls = type(obj)
+        info = classes.get(cls)
+        if info is None:
+            info = (len(class_table), _fields(obj))
+            classes[cls] = info
+            class_table.append(
+                ("{0}.{1}".format(cls.__module__, cls.__name__), info[1])
+            )
+        idx, fields = info
+
+        if isinstance(obj, PanDevice):
+            name = None
+            values = tuple(getattr(obj, x, None) for x in fields)
+        elif isinstance(obj, VersionedPanObject):
+            name = getattr(obj, obj.NAME) if obj.NAME is not None else None
+            values = tuple(x.value for x in _params(obj))
+        else:
+            name = getattr(obj, obj.NAME) if obj.NAME is not None else None
+            values = tuple(getattr(obj, x, None) for x in fields)
+
+        return (idx, name, values, [encode(x) for x in obj.children])
+
+    body = [encode(x) for x in node.children]
+
+    device = node.nearest_pandevice() if node.parent is not None else node
+    header = {
+        "format": FORMAT,
+        "version": getattr(device, "version", None),
+        "classes": class_table,
+        "metadata": metadata or {},
+    }
+
+    return header, body
+
+
+def _fields(obj):
+    if isinstance(obj, PanDevice):
+        return _DEVICE_ATTRS
+    elif isinstance(obj, VersionedPanObject):
+        return tuple(x.name for x in _params(obj))
+    return tuple(x.variable for x in obj.variables())
+
+
+def _params(obj):
+    # Versioned objects without params have no _params at all.
+    return getattr(obj, "_params", ())
+
+
+def _check_format(header):
+    if header.get("format") != FORMAT:
+        raise ValueError(
+            "Unsupported snapshot format: {0}".format(header.get("format"))
+        )
+
+
+def _decode(header, body, node):
+    _check_format(header)
+
+    device = node
+    while device.parent is not None and not isinstance(device, PanDevice):
+        device = device.parent
+    if (
+        isinstance(device, PanDevice)
+        and device._version_info is None
+        and header["version"]
+    ):
+        device._set_version_and_version_info(header["version"])
+
+    # Per class: (class, fields, prototype, positions of the fields in the
+    # params of the prototype).
+    classes = []
+    for path, fields in header["classes"]:
+        module_name, class_name = path.rsplit(".", 1)
+        cls = getattr(importlib.import_module(module_name), class_name)
+        prototype = positions = None
+        if issubclass(cls, VersionedPanObject):
+            prototype = cls()
+            names = [x.name for x in _params(prototype)]
+            positions = [names.index(x) if x in names else None for x in fields]
+        classes.append((cls, fields, prototype, positions))
+
+    count = [0]
+
+    def decode(item):
+        count[0] += 1
+        idx, name, values, children = item
+        cls, fields, prototype, positions = classes[idx]
+
+        if issubclass(cls, PanDevice):
+            kwargs = dict(zip(fields, values))
+            version = kwargs.pop("version", None)
+            obj = cls(**kwargs)
+            if version:
+                obj._set_version_and_version_info(version)
+        elif prototype is not None:
+            obj = _clone(prototype)
+            if cls.NAME is not None:
+                obj.__dict__[cls.NAME] = name
+            params = _params(obj)
+            for pos, value in zip(positions, values):
+                if pos is not None:
+                    params[pos].value = value
+        else:
+            obj = cls()
+            if cls.NAME is not None:
+                setattr(obj, cls.NAME, name)
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+
+        obj.extend([decode(x) for x in children])
+        return obj
+
+    children = [decode(x) for x in body]
+    node.removeall()
+    node.extend(children)
+    logger.debug("Loaded {0} objects from snapshot".format(count[0]))
+
+    return children
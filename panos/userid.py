@@ -17,47 +17,44 @@
 
 """User-ID and Dynamic Address Group updates using the User-ID API"""
 
+import heapq
+import threading
+import time
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from xml.sax.saxutils import escape, quoteattr
 
 from pan.xapi import PanXapiError
 
 import panos.errors as err
-from panos import getlogger, string_or_list, string_or_list_or_none
+from panos import getlogger, isstring, string_or_list, string_or_list_or_none
 from panos.base import _xpath_safe
 from panos.updater import PanOSVersion
 
 logger = getlogger(__name__)
 
 
-class UserId(object):
-    """User-ID Subsystem of Firewall
-
-    A member of a firewall.Firewall object that has special methods for
-    interacting with the User-ID API. This includes login/logout of a user,
-    user/group mappings, and dynamic address group tags.
+class UserIdUpdates(object):
+    """User-ID API updates
 
-    This class is typically not instantiated by anything but the
-    base.PanDevice class itself. There is an instance of this UserId class
-    inside every instantiated base.PanDevice class.
-
-    **Support:** UserId API is supported on Panorama starting with Panorama 8.0
-        UserId API is supported on all firewall PAN-OS versions but with varying
-        features as noted in the documentation for each method.
+    Base class of :class:`UserId` and :class:`UserIdPublisher` with the
+    methods that build uid-messages: login and logout of users, ip tags for
+    Dynamic Address Groups, user tags, and group membership.  These can be
+    batched with batch_start() and batch_end().  Subclasses deliver the
+    uid-messages in ``send()``.
 
     Args:
-        device (base.PanDevice): The firewall or Panorama this user-id subsystem leverages
         prefix (str): Prefix to use in all IP tag operations for Dynamic Address Groups
         ignore_dup_errors (bool): Devices produce errors when a tag is registered that already
             exists. Set to true to ignore these errors. (Default: True)
 
     """
 
-    def __init__(self, device, prefix="", ignore_dup_errors=True):
+    def __init__(self, prefix="", ignore_dup_errors=True):
         # Create a class logger
         self._logger = getlogger(__name__ + "." + self.__class__.__name__)
-        self.device = device
         self.prefix = prefix
         self.ignore_dup_errors = ignore_dup_errors
 
@@ -111,33 +108,21 @@ class UserId(object):
             self.send(uid_message)
         self._batch_uidmessage = deepcopy(self._uidmessage)
 
-    def send(self, uidmessage):
-        """Send a uidmessage to the User-ID API of a firewall
-
-        Used for adhoc User-ID API calls that are not supported by other
-        methods in this class. This method cannot be batched.
-
-        Args:
-            uidmessage (str): The UID Message in XML to send to the firewall
-
-        """
-        if self._batch:
-            return
-        else:
-            cmd = ET.tostring(uidmessage)
-            try:
-                self.device.xapi.user_id(cmd=cmd, vsys=self.device.vsys)
-            except (err.PanDeviceXapiError, PanXapiError) as e:
-                # Check if this is just an error about duplicates or nonexistant tags
-                # If so, ignore the error. Most operations don't care about this.
-                message = str(e)
-                if self.ignore_dup_errors and (
-                    message.endswith("already exists, ignore")
-                    or message.endswith("does not exist, ignore unreg")
-                ):
-                    return
-                else:
-                    raise e
+    def _send_cmd(self, cmd, device, xapi=None):
+        """Send an already serialized uid-message to a device"""
+        if xapi is None:
+            xapi = device.xapi
+        try:
+            xapi.user_id(cmd=cmd, vsys=device.vsys)
+        except (err.PanDeviceXapiError, PanXapiError) as e:
+            # Check if this is just an error about duplicates or nonexistant tags
+            # If so, ignore the error. Most operations don't care about this.
+            message = str(e)
+            if not self.ignore_dup_errors or not (
+                message.endswith("already exists, ignore")
+                or message.endswith("does not exist, ignore unreg")
+            ):
+                raise e
 
     def login(self, user, ip, timeout=None):
         """Login a single user
@@ -286,7 +271,198 @@ class UserId(object):
                 member.text = tag
         self.send(root)
 
-    def get_registered_ip(self, ip=None, tags=None, prefix=None):
+    def set_group(self, group, users):
+        """
+        Set a group's membership to the specified users.
+
+        This method can be batched with batch_start() and batch_end().
+
+        Args:
+            group: The group name.
+            users (list): The users to be in this group.
+
+        """
+        root, payload = self._create_uidmessage()
+
+        # Find the groups section.
+        groups = payload.find("./groups")
+        if groups is None:
+            groups = ET.SubElement(payload, "groups")
+
+        # Find the group.
+        entries = groups.findall("./entry")
+        for entry in entries:
+            if entry.attrib["name"] == group:
+                ge = entry.find("./members")
+                break
+        else:
+            entry = ET.SubElement(groups, "entry", {"name": group})
+            ge = ET.SubElement(entry, "members")
+
+        # Now add in the users to this group.
+        for user in users:
+            ET.SubElement(ge, "entry", {"name": user})
+
+        # Done.
+        self.send(root)
+
+    def tag_user(self, user, tags, timeout=None, prefix=None):
+        """
+        Tags the user with the specified tags.
+
+        This method can be batched with batch_start() and batch_end().
+
+        Note: PAN-OS 9.1+
+
+        Args:
+            user: The user.
+            tags (list): The list of tags to apply.
+            timeout (int): (Optional) The timeout for the given tags.
+            prefix: Override class tag prefix.
+
+        """
+        if timeout is not None:
+            timeout = int(timeout)
+
+        if prefix is None:
+            prefix = self.prefix or ""
+
+        root, payload = self._create_uidmessage()
+
+        # Find the register user tags section.
+        ru = payload.find("./register-user")
+        if ru is None:
+            ru = ET.SubElement(payload, "register-user")
+
+        # Find the tags section for this specific user.
+        entries = ru.findall("./entry")
+        for entry in entries:
+            if entry.attrib["user"] == user:
+                te = entry.find("./tag")
+                break
+        else:
+            entry = ET.SubElement(
+                ru,
+                "entry",
+                {
+                    "user": user,
+                },
+            )
+            te = ET.SubElement(entry, "tag")
+
+        # Now add in the tags with the specified timeout.
+        props = {}
+        if timeout is not None:
+            props["timeout"] = "{0}".format(timeout)
+        for tag in tags:
+            ET.SubElement(te, "member", props).text = prefix + tag
+
+        # Done.
+        self.send(root)
+
+    def untag_user(self, user, tags=None, prefix=None):
+        """
+        Removes tags associated with a user.
+
+        This method can be batched with batch_start() and batch_end().
+
+        Note: PAN-OS 9.1+
+
+        Args:
+            user: The user.
+            tags (list): (Optional) Remove only these tags instead of all tags.
+            prefix: Override class tag prefix.
+
+        """
+        root, payload = self._create_uidmessage()
+
+        if prefix is None:
+            prefix = self.prefix or ""
+
+        # Find the unregister user tags section.
+        uu = payload.find("./unregister-user")
+        if uu is None:
+            uu = ET.SubElement(payload, "unregister-user")
+
+        # Find the tags section for this specific user.
+        entries = uu.findall("./entry")
+        for entry in entries:
+            if entry.attrib["user"] == user:
+                break
+        else:
+            entry = ET.SubElement(
+                uu,
+                "entry",
+                {
+                    "user": user,
+                },
+            )
+
+        # Do tag removal.
+        te = entry.find("./tag")
+        if tags is not None:
+            if te is None:
+                te = ET.SubElement(entry, "tag")
+            for tag in tags:
+                ET.SubElement(te, "member").text = prefix + tag
+        elif te is not None:
+            entry.remove(te)
+
+        # Done.
+        self.send(root)
+
+
+class UserId(UserIdUpdates):
+    """User-ID Subsystem of Firewall
+
+    A member of a firewall.Firewall object that has special methods for
+    interacting with the User-ID API. This includes login/logout of a user,
+    user/group mappings, and dynamic address group tags.
+
+    This class is typically not instantiated by anything but the
+    base.PanDevice class itself. There is an instance of this UserId class
+    inside every instantiated base.PanDevice class.
+
+    **Support:** UserId API is supported on Panorama starting with Panorama 8.0
+        UserId API is supported on all firewall PAN-OS versions but with varying
+        features as noted in the documentation for each method.
+
+    Args:
+        device (base.PanDevice): The firewall or Panorama this user-id subsystem leverages
+        prefix (str): Prefix to use in all IP tag operations for Dynamic Address Groups
+        ignore_dup_errors (bool): Devices produce errors when a tag is registered that already
+            exists. Set to true to ignore these errors. (Default: True)
+        shadow (RegisteredIpShadow): Optional local shadow of the registered-ip
+            tags on the device.  When set, the audit methods diff against the
+            shadow instead of retrieving the registered-ip table every time.
+
+    """
+
+    def __init__(self, device, prefix="", ignore_dup_errors=True, shadow=None):
+        super(UserId, self).__init__(prefix, ignore_dup_errors)
+        self.device = device
+        self.shadow = shadow
+
+    def send(self, uidmessage):
+        """Send a uidmessage to the User-ID API of a firewall
+
+        Used for adhoc User-ID API calls that are not supported by other
+        methods in this class. This method cannot be batched.
+
+        Args:
+            uidmessage (str): The UID Message in XML to send to the firewall
+
+        """
+        if self._batch:
+            return
+        else:
+            self._send_cmd(ET.tostring(uidmessage), self.device)
+            if self.shadow is not None:
+                self.shadow.update_from_uidmessage(uidmessage)
+
+    def get_registered_ip(
+        self, ip=None, tags=None, prefix=None, page_size=500, max_workers=1
+    ):
         """Return registered/tagged addresses
 
         When called without arguments, retrieves all registered addresses.
@@ -297,12 +473,17 @@ class UserId(object):
         result in retreival of the entire tag database from the firewall which is then filtered and
         returned with only the relevant entries. Therefor, using a single ip or tag is more efficient.
 
+        For very large tag databases, consider :meth:`iter_registered_ip`
+        instead, which does not hold the full result in memory.
+
         **Support:** PAN-OS 6.0 and higher
 
         Args:
             ip (:obj:`list` or :obj:`str`): IP address(es) to get tags for
             tags (:obj:`list` or :obj:`str`): Tag(s) to get
             prefix (str): Override class tag prefix
+            page_size (int): Number of entries to request per page (PAN-OS 8.0+)
+            max_workers (int): Number of pages to fetch concurrently (PAN-OS 8.0+)
 
         Returns:
             dict: ip addresses as keys with tags as values
@@ -311,6 +492,39 @@ class UserId(object):
             PanDeviceError if running PAN-OS < 8.0 and a logfile is returned
                 instead of IP/tag mapings.
 
+        """
+        return dict(self.iter_registered_ip(ip, tags, prefix, page_size, max_workers))
+
+    def iter_registered_ip(
+        self, ip=None, tags=None, prefix=None, page_size=500, max_workers=1
+    ):
+        """Iterate over registered/tagged addresses as they are retrieved
+
+        This is the generator form of :meth:`get_registered_ip`.  Each
+        ``(ip, tags)`` pair is yielded as soon as the page containing it has
+        been received from the device, so the full tag database is never
+        held in memory at once.
+
+        When ``max_workers`` is greater than 1, that many pages are requested
+        concurrently, each worker thread using its own API connection to the
+        device.  Pairs are still yielded in device order.
+
+        **Support:** PAN-OS 6.0 and higher
+
+        Args:
+            ip (:obj:`list` or :obj:`str`): IP address(es) to get tags for
+            tags (:obj:`list` or :obj:`str`): Tag(s) to get
+            prefix (str): Override class tag prefix
+            page_size (int): Number of entries to request per page (PAN-OS 8.0+)
+            max_workers (int): Number of pages to fetch concurrently (PAN-OS 8.0+)
+
+        Yields:
+            tuple: (ip address, list of tags)
+
+        Raises:
+            PanDeviceError if running PAN-OS < 8.0 and a logfile is returned
+                instead of IP/tag mapings.
+
         """
         if self.device is None:
             raise err.PanDeviceNotSet("No device set for this userid instance")
@@ -322,39 +536,34 @@ class UserId(object):
         # Build up the command.
         limit = 0
         start_elm = None
-        start_offset = 1
         root = ET.Element("show")
         cmd = ET.SubElement(root, "object")
         if version >= (6, 1, 0):
             cmd = ET.SubElement(cmd, "registered-ip")
             if version >= (8, 0, 0):
                 # PAN-OS 8.0+ supports paging.
-                limit = 500
+                limit = int(page_size)
                 ET.SubElement(cmd, "limit").text = "{0}".format(limit)
                 start_elm = ET.SubElement(cmd, "start-point")
-                start_elm.text = "{0}".format(start_offset)
         else:
             cmd = ET.SubElement(cmd, "registered-address")
 
         # Add ip/tag filter arguments to command.
-        ip = list(set(string_or_list_or_none(ip)))
-        tags = list(set(string_or_list_or_none(tags)))
-        tags = [prefix + t for t in tags]
+        ip = set(string_or_list_or_none(ip))
+        tags = set(prefix + t for t in string_or_list_or_none(tags))
         if len(tags) == 1:
             tag_element = ET.SubElement(cmd, "tag")
-            ET.SubElement(tag_element, "entry", {"name": tags[0]})
+            ET.SubElement(tag_element, "entry", {"name": next(iter(tags))})
         if len(ip) == 1:
             ip_element = ET.SubElement(cmd, "ip")
-            ip_element.text = ip[0]
+            ip_element.text = next(iter(ip))
 
-        addresses = {}
-        while True:
-            resp = self.device.op(
-                cmd=ET.tostring(root, encoding="utf-8"),
-                vsys=self.device.vsys,
-                cmd_xml=False,
-            )
+        def build_cmd(start_offset):
+            if start_elm is not None:
+                start_elm.text = "{0}".format(start_offset)
+            return ET.tostring(root, encoding="utf-8")
 
+        for resp, entries in self._iter_pages(build_cmd, limit, max_workers):
             # PAN-OS 7.1 and lower can return "outfile" instead of actual results.
             outfile = resp.find("./result/msg/line/outfile")
             if outfile is not None:
@@ -366,29 +575,107 @@ class UserId(object):
                 ]
                 raise err.PanDeviceError(", ".join(msg))
 
-            entries = resp.findall("./result/entry")
             for entry in entries:
                 c_ip = entry.get("ip")
                 if ip and c_ip not in ip:
                     continue
-                members = entry.findall("./tag/member")
                 c_tags = []
-                for member in members:
+                for member in entry.iterfind("./tag/member"):
                     tag = member.text
                     if not prefix or tag.startswith(prefix):
                         if not tags or tag in tags:
                             c_tags.append(tag)
                 if c_tags:
-                    addresses[c_ip] = c_tags
+                    yield c_ip, c_tags
 
-            if start_elm is None or limit == 0 or len(entries) < limit:
-                break
+    def _iter_pages(self, build_cmd, limit, max_workers=1):
+        """Yield the responses of a paged op command in order
 
-            start_offset += len(entries)
-            start_elm.text = "{0}".format(start_offset)
+        Args:
+            build_cmd: Callable taking a start-point and returning the
+                command XML for the page beginning there.
+            limit (int): The page size.  If this is 0 only one request is made.
+            max_workers (int): Number of pages to have in flight at once.
 
-        # Done.
-        return addresses
+        Yields:
+            tuple: (response element, list of ``./result/entry`` elements)
+
+        """
+        start_offset = 1
+        if not limit:
+            resp = self.device.op(
+                cmd=build_cmd(start_offset), vsys=self.device.vsys, cmd_xml=False
+            )
+            yield resp, resp.findall("./result/entry")
+            return
+        if max_workers is None or max_workers <= 1:
+            for page in self._iter_pages_serial(build_cmd, start_offset):
+                yield page
+            return
+
+        # Each worker thread gets its own xapi, as xapi objects keep the
+        # state of the last request and cannot be shared between threads.
+        local = threading.local()
+        vsys = self.device.vsys
+
+        def fetch(cmd):
+            xapi = getattr(local, "xapi", None)
+            if xapi is None:
+                xapi = local.xapi = self.device.generate_xapi()
+            return xapi.op(cmd=cmd, vsys=vsys, cmd_xml=False)
+
+        # Pages are requested ahead assuming that each one is full.  A short
+        # page is either the last one, or the device returns fewer entries
+        # than the limit, in which case the pages requested ahead don't line
+        # up and are dropped.
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            try:
+                for _ in range(max_workers):
+                    future = pool.submit(fetch, build_cmd(start_offset))
+                    pending.append((start_offset, future))
+                    start_offset += limit
+                while pending:
+                    start, future = pending.popleft()
+                    resp = future.result()
+                    entries = resp.findall("./result/entry")
+                    yield resp, entries
+                    if len(entries) >= limit:
+                        future = pool.submit(fetch, build_cmd(start_offset))
+                        pending.append((start_offset, future))
+                        start_offset += limit
+                        continue
+                    if not entries or not pending:
+                        return
+                    if not pending[0][1].result().findall("./result/entry"):
+                        return
+                    break
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+        # The device caps the page size, so continue one page at a time.
+        for page in self._iter_pages_serial(build_cmd, start + len(entries)):
+            yield page
+
+    def _iter_pages_serial(self, build_cmd, start_offset):
+        """Yield the pages from start_offset on, one request at a time
+
+        The device may return fewer entries than asked for even when there
+        are more, so only an empty page ends the iteration.
+
+        """
+        while True:
+            resp = self.device.op(
+                cmd=build_cmd(start_offset),
+                vsys=self.device.vsys,
+                cmd_xml=False,
+            )
+            entries = resp.findall("./result/entry")
+            yield resp, entries
+            if not entries:
+                return
+            start_offset += len(entries)
 
     def clear_registered_ip(self, ip=None, tags=None, prefix=None):
         """Unregister registered/tagged addresses
@@ -419,7 +706,39 @@ class UserId(object):
             self.unregister(ip, tags)
         self.batch_end()
 
-    def audit_registered_ip_for_tag(self, tag, ip_addresses, timeout=None):
+    def reconcile_shadow(self):
+        """Reconcile the local registered-ip shadow against the device
+
+        Retrieves the full registered-ip table from the device and makes the
+        shadow match it.  Timeouts already known to the shadow are kept.
+
+        This is done automatically by the audit methods whenever the
+        shadow's ``reconcile_interval`` has elapsed.
+
+        """
+        if self.shadow is None:
+            raise err.PanDeviceError("No shadow set for this userid instance")
+        registered = self.get_registered_ip()
+        self.shadow.reconcile(registered)
+
+    def _registered_ip_for_audit(self, tag=None):
+        """Current registered-ip state, from the shadow if one is in use"""
+        if self.shadow is None:
+            return self.get_registered_ip(tags=tag, prefix=self.prefix)
+        now = time.time()
+        if tag is None:
+            if self.shadow.needs_reconcile(now):
+                self.reconcile_shadow()
+        elif self.shadow.needs_reconcile(now, self.prefix + tag):
+            # Only the tag being audited is known to be current after this,
+            # so the shadow as a whole stays due for reconciling.
+            registered = self.get_registered_ip(tags=tag, prefix=self.prefix)
+            self.shadow.reconcile(registered, tag=self.prefix + tag)
+        return self.shadow.registered_ip(tags=tag, prefix=self.prefix, now=now)
+
+    def audit_registered_ip_for_tag(
+        self, tag, ip_addresses, timeout=None, chunk_size=1000
+    ):
         """Synchronize the current registered-ip tag to tag only the specificied IP addresses.
 
         Sets the registered-ip list for a single tag on the device. Regardless
@@ -430,6 +749,11 @@ class UserId(object):
         the list for this tag is currently in the requested state, no API call
         is made after retrieving the list.
 
+        If a :class:`RegisteredIpShadow` is set on this instance, the current
+        state is taken from the shadow instead of the device, except when
+        neither the shadow nor this tag has been reconciled within the
+        shadow's ``reconcile_interval``.  Then only this tag is retrieved.
+
         **Support:** PAN-OS 6.0 and higher
 
         Warning: This will clear any batch without it being sent, and can't be
@@ -439,23 +763,22 @@ class UserId(object):
             tag (string): Tag to audit
             ip_addresses(list): List of IP addresses that should have the tag
             timeout (string): The optional timeout value in seconds.
+            chunk_size (int): Maximum number of tag members per uid-message
 
-        """
-        device_list = self.get_registered_ip(tags=tag, prefix=self.prefix)
-        self.batch_start()
-        registered_ips = device_list.keys()
-        tag = self.prefix + tag
-        for ip in registered_ips:
-            if ip not in ip_addresses:
-                # The IP is not requested, unregister it for this tag
-                self.unregister(ip, tag)
-        for ip in ip_addresses:
-            if ip not in registered_ips:
-                # The IP is requested, register it with this tag
-                self.register(ip, tag, timeout)
-        self.batch_end()
+        Returns:
+            dict: The number of tag members registered and unregistered, and
+            the number of uid-messages sent, keyed by "register",
+            "unregister", and "messages".
 
-    def audit_registered_ip(self, ip_tags_pairs, timeout=None):
+        """
+        registered_ips = set(self._registered_ip_for_audit(tag))
+        ip_addresses = set(string_or_list_or_none(ip_addresses))
+        tag = [self.prefix + tag]
+        unregister = ((ip, tag) for ip in registered_ips - ip_addresses)
+        register = ((ip, tag) for ip in ip_addresses - registered_ips)
+        return self._send_audit(register, unregister, timeout, chunk_size)
+
+    def audit_registered_ip(self, ip_tags_pairs, timeout=None, chunk_size=1000):
         """Synchronize the current registered-ip tag list to this exact set of ip-tags
 
         Sets the registered-ip tag list on the device.
@@ -465,6 +788,12 @@ class UserId(object):
         needed. If the list is currently in the requested state, no API call is made after
         retrieving the list.
 
+        If a :class:`RegisteredIpShadow` is set on this instance, the current state is taken
+        from the shadow instead of the device, except when the shadow is due for reconciliation.
+
+        Changes are sent in as many uid-messages as needed to keep each one
+        to at most ``chunk_size`` tag members.
+
         **Support:** PAN-OS 6.0 and higher
 
         Warning:
@@ -473,68 +802,127 @@ class UserId(object):
         Args:
             ip_tags_pairs (dict): dictionary where keys are ip addresses and values or tuples of tags
             timeout (string): The optional timeout value in seconds.
+            chunk_size (int): Maximum number of tag members per uid-message
+
+        Returns:
+            dict: The number of tag members registered and unregistered, and
+            the number of uid-messages sent, keyed by "register",
+            "unregister", and "messages".
 
         """
-        device_list = self.get_registered_ip()
-        requested_list = deepcopy(ip_tags_pairs)
-        self.batch_start()
-        # Handle unregistrations
+        device_list = self._registered_ip_for_audit()
+        prefix = self.prefix
+        requested = {}
+        for ip, tags in ip_tags_pairs.items():
+            if isstring(tags):
+                tags = (tags,)
+            requested[ip] = set(prefix + t for t in tags)
+
+        unregister = []
         for ip, tags in device_list.items():
-            if ip not in requested_list:
+            wanted = requested.get(ip)
+            if wanted is None:
                 # The IP is not requested, unregister it and all its tags
-                self.unregister(ip, tags)
+                unregister.append((ip, tags))
             else:
-                # Convert requested tags from tuple to list
-                requested_list[ip] = list(requested_list[ip])
-                # The IP is requested, audit its tags
-                for tag in tags:
-                    if tag not in requested_list[ip]:
-                        # Tag is not requested, unregister it
-                        self.unregister(ip, tag)
-                    else:
-                        # Tag already exists on device, so don't re-register it
-                        requested_list[ip].remove(tag)
-        # Remove ip's with no tags left to register
-        requested_list = {ip: tags for ip, tags in requested_list.items() if tags}
-        # Handle registrations
-        for ip, tags in requested_list.items():
-            self.register(ip, tags, timeout)
-        self.batch_end()
+                extra = set(tags) - wanted
+                if extra:
+                    unregister.append((ip, extra))
+        register = []
+        for ip, wanted in requested.items():
+            # Tags already on the device don't need to be registered again
+            missing = wanted.difference(device_list.get(ip, ()))
+            if missing:
+                register.append((ip, missing))
 
-    def set_group(self, group, users):
-        """
-        Set a group's membership to the specified users.
+        return self._send_audit(register, unregister, timeout, chunk_size)
 
-        This method can be batched with batch_start() and batch_end().
+    def _send_audit(self, register, unregister, timeout=None, chunk_size=1000):
+        """Send register/unregister changes in uid-messages of bounded size
 
-        Args:
-            group: The group name.
-            users (list): The users to be in this group.
+        The uid-messages are serialized directly instead of being built as
+        ElementTree objects, as audits can involve millions of tag members.
 
-        """
-        root, payload = self._create_uidmessage()
+        Args:
+            register: Iterable of (ip, full tag names) to register
+            unregister: Iterable of (ip, full tag names) to unregister
+            timeout: Timeout for the registered tags
+            chunk_size (int): Maximum number of tag members per uid-message
 
-        # Find the groups section.
-        groups = payload.find("./groups")
-        if groups is None:
-            groups = ET.SubElement(payload, "groups")
+        Returns:
+            dict: Summary of the members and messages sent
 
-        # Find the group.
-        entries = groups.findall("./entry")
-        for entry in entries:
-            if entry.attrib["name"] == group:
-                ge = entry.find("./members")
-                break
-        else:
-            entry = ET.SubElement(groups, "entry", {"name": group})
-            ge = ET.SubElement(entry, "members")
+        """
+        # Any pending batch is discarded, as documented by the audit methods.
+        self._batch = False
+        self._batch_uidmessage = deepcopy(self._uidmessage)
 
-        # Now add in the users to this group.
-        for user in users:
-            ET.SubElement(ge, "entry", {"name": user})
+        chunk_size = max(int(chunk_size), 1)
+        summary = {"register": 0, "unregister": 0, "messages": 0}
+        # Current message: action -> list of (ip, tags) in this message.
+        pending = {"unregister": [], "register": []}
+        state = {"size": 0}
+        # Tags repeat across many ips, so each serialized member is cached.
+        member_xml = {"unregister": {}, "register": {}}
+        member_start = {"unregister": "<member>", "register": "<member>"}
+        if timeout is not None:
+            member_start["register"] = "<member timeout={0}>".format(
+                quoteattr(str(timeout))
+            )
 
-        # Done.
-        self.send(root)
+        def flush():
+            if not state["size"]:
+                return
+            msg = ["<uid-message><version>1.0</version><type>update</type><payload>"]
+            for action in ("unregister", "register"):
+                if not pending[action]:
+                    continue
+                members = member_xml[action]
+                msg.append("<{0}>".format(action))
+                for ip, tags in pending[action]:
+                    msg.append("<entry ip={0}><tag>".format(quoteattr(ip)))
+                    for tag in tags:
+                        member = members.get(tag)
+                        if member is None:
+                            member = members[tag] = "{0}{1}</member>".format(
+                                member_start[action], escape(tag)
+                            )
+                        msg.append(member)
+                    msg.append("</tag></entry>")
+                msg.append("</{0}>".format(action))
+            msg.append("</payload></uid-message>")
+            self._send_cmd("".join(msg).encode("utf-8"), self.device)
+            summary["messages"] += 1
+            if self.shadow is not None:
+                now = time.time()
+                for ip, tags in pending["unregister"]:
+                    for tag in tags:
+                        self.shadow.unregister(ip, tag)
+                for ip, tags in pending["register"]:
+                    for tag in tags:
+                        self.shadow.register(ip, tag, timeout, now)
+            pending["unregister"] = []
+            pending["register"] = []
+            state["size"] = 0
+
+        def add(action, ip, tags):
+            tags = sorted(tags)
+            while tags:
+                room = chunk_size - state["size"]
+                chunk, tags = tags[:room], tags[room:]
+                pending[action].append((ip, chunk))
+                summary[action] += len(chunk)
+                state["size"] += len(chunk)
+                if state["size"] >= chunk_size:
+                    flush()
+
+        for ip, tags in unregister:
+            add("unregister", ip, tags)
+        for ip, tags in register:
+            add("register", ip, tags)
+        flush()
+
+        return summary
 
     def get_groups(self, style=None):
         """
@@ -624,7 +1012,7 @@ class UserId(object):
 
         return ans
 
-    def get_user_tags(self, user=None, prefix=None):
+    def get_user_tags(self, user=None, prefix=None, page_size=500, max_workers=1):
         """
         Get the dynamic user tags.
 
@@ -633,25 +1021,47 @@ class UserId(object):
         Args:
             user: Get only this user's tags, not all users and all tags.
             prefix: Override class tag prefix.
+            page_size (int): Number of entries to request per page.
+            max_workers (int): Number of pages to fetch concurrently.
 
         Returns:
             dict: Dict where the user is the key and the value is a list of tags.
 
+        """
+        return dict(self.iter_user_tags(user, prefix, page_size, max_workers))
+
+    def iter_user_tags(self, user=None, prefix=None, page_size=500, max_workers=1):
+        """
+        Iterate over the dynamic user tags as they are retrieved.
+
+        This is the generator form of :meth:`get_user_tags`.  See
+        :meth:`iter_registered_ip` for how ``max_workers`` is used.
+
+        Note: PAN-OS 9.1+
+
+        Args:
+            user: Get only this user's tags, not all users and all tags.
+            prefix: Override class tag prefix.
+            page_size (int): Number of entries to request per page.
+            max_workers (int): Number of pages to fetch concurrently.
+
+        Yields:
+            tuple: (user, list of tags)
+
         """
         if prefix is None:
             prefix = self.prefix
 
-        limit = 500
-        start = 1
-        start_elm = None
+        limit = 0
         msg = [
             "<show><object><registered-user>",
         ]
         if user is None:
+            limit = int(page_size)
             msg.append(
                 "<all>"
                 + "<limit>{0}</limit>".format(escape(str(limit)))
-                + "<start-point>{0}</start-point>".format(escape(str(start)))
+                + "<start-point>1</start-point>"
                 + "</all>"
             )
         else:
@@ -659,137 +1069,425 @@ class UserId(object):
         msg.append("</registered-user></object></show>")
 
         cmd = ET.fromstring("".join(msg))
-        if user is None:
-            start_elm = cmd.find("./object/registered-user/all/start-point")
+        start_elm = cmd.find("./object/registered-user/all/start-point")
 
-        ans = {}
-        while True:
-            resp = self.device.op(
-                cmd=ET.tostring(cmd, encoding="utf-8"),
-                vsys=self.device.vsys,
-                cmd_xml=False,
-            )
-            entries = resp.findall("./result/entry")
+        def build_cmd(start):
+            if start_elm is not None:
+                start_elm.text = "{0}".format(start)
+            return ET.tostring(cmd, encoding="utf-8")
+
+        for resp, entries in self._iter_pages(build_cmd, limit, max_workers):
             for entry in entries:
-                key = entry.attrib["user"]
                 val = []
-                members = entry.findall("./tag/member")
-                for member in members:
+                for member in entry.iterfind("./tag/member"):
                     tag = member.text
                     if not prefix or tag.startswith(prefix):
                         val.append(tag)
-                ans[key] = val
+                yield entry.attrib["user"], val
 
-            if start_elm is None or limit <= 0 or len(entries) < limit:
-                break
 
-            start += len(entries)
-            start_elm.text = "{0}".format(start)
+class UserIdPublisher(UserIdUpdates):
+    """Publish the same User-ID updates to many devices
 
-        # Done.
-        return ans
+    Has the same update methods as :class:`UserId` (login, logout,
+    register, tag_user, etc, including batching), but each uid-message is
+    serialized once and then sent to every target device concurrently.
+    To read state from a device, such as its registered ip addresses, use
+    the :class:`UserId` of that device.
 
-    def tag_user(self, user, tags, timeout=None, prefix=None):
-        """
-        Tags the user with the specified tags.
+    Every target has its own queue of messages, sent in order by at most
+    one worker at a time.  A worker sends at most ``burst`` messages to a
+    device before moving on to the next device, so a slow or unreachable
+    device only delays its own updates.  A message that fails to send stays
+    at the head of its target's queue and is retried later, with the wait
+    doubling after each failure.  After ``max_retries`` retries in a row
+    fail, the device is given up on: its queued messages, and any sent to
+    it later, are recorded in :attr:`failures`, and it is added to
+    :attr:`failed`.
 
-        This method can be batched with batch_start() and batch_end().
+    Sending is asynchronous: use :meth:`flush` to wait for the queues to
+    drain, and :meth:`close` when done.
 
-        Note: PAN-OS 9.1+
+    Example::
+
+        with UserIdPublisher(firewalls, max_workers=50) as publisher:
+            publisher.batch_start()
+            publisher.login("example\\user", "10.1.1.1")
+            publisher.register("10.1.1.1", "quarantine")
+            publisher.batch_end()
+        print(publisher.failures)
+
+    Args:
+        devices (list): The firewalls or Panoramas to publish to
+        prefix (str): Prefix to use in all IP tag operations for Dynamic Address Groups
+        ignore_dup_errors (bool): Ignore errors about already registered or
+            missing tags. (Default: True)
+        max_workers (int): Maximum number of devices sent to concurrently
+        max_retries (int): Number of failed retries in a row before a device
+            is given up on
+        retry_interval (float): Seconds to wait before the first retry of a
+            failed message; doubles with each retry
+        burst (int): Maximum number of messages a worker sends to a device
+            before moving on to another device
+
+    """
+
+    def __init__(
+        self,
+        devices,
+        prefix="",
+        ignore_dup_errors=True,
+        max_workers=10,
+        max_retries=3,
+        retry_interval=1.0,
+        burst=10,
+    ):
+        if burst < 1:
+            raise ValueError("burst must be at least 1, not {0}".format(burst))
+        super(UserIdPublisher, self).__init__(prefix, ignore_dup_errors)
+        self.devices = list(devices)
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.burst = burst
+        self.failures = {}
+        """Messages that could not be sent: device -> list of (cmd, exception)"""
+        self.failed = []
+        """Devices given up on after ``max_retries`` failed retries"""
+        self._queues = dict((id(d), deque()) for d in self.devices)
+        self._attempts = dict((id(d), 0) for d in self.devices)
+        self._errors = {}
+        # Devices with a send task submitted or a retry scheduled.
+        self._active = set()
+        # Heap of (due time, sequence, device) of the scheduled retries.
+        self._retries = []
+        self._sequence = 0
+        self._closed = False
+        self._stopped = False
+        self._xapis = {}
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._scheduler = threading.Thread(target=self._schedule_retries)
+        self._scheduler.daemon = True
+        self._scheduler.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send(self, uidmessage):
+        """Queue a uidmessage to be sent to every target device
+
+        This method cannot be batched.
 
         Args:
-            user: The user.
-            tags (list): The list of tags to apply.
-            timeout (int): (Optional) The timeout for the given tags.
-            prefix: Override class tag prefix.
+            uidmessage: The UID Message in XML to send to the devices
+
+        Raises:
+            ValueError: The publisher is closed
 
         """
-        if timeout is not None:
-            timeout = int(timeout)
+        if self._batch:
+            return
+        cmd = ET.tostring(uidmessage)
+        with self._cond:
+            if self._closed:
+                raise ValueError("Can't send with a closed UserIdPublisher")
+            for device in self.devices:
+                key = id(device)
+                if key in self._errors:
+                    # Given up on this device.
+                    self.failures[device].append((cmd, self._errors[key]))
+                    continue
+                self._queues[key].append(cmd)
+                if key not in self._active:
+                    self._active.add(key)
+                    self._pool.submit(self._send, device)
 
-        if prefix is None:
-            prefix = self.prefix or ""
+    def pending(self):
+        """Number of messages not yet sent, per device
 
-        root, payload = self._create_uidmessage()
+        Returns:
+            dict: device -> number of queued messages
 
-        # Find the register user tags section.
-        ru = payload.find("./register-user")
-        if ru is None:
-            ru = ET.SubElement(payload, "register-user")
+        """
+        with self._cond:
+            return dict((d, len(self._queues[id(d)])) for d in self.devices)
 
-        # Find the tags section for this specific user.
-        entries = ru.findall("./entry")
-        for entry in entries:
-            if entry.attrib["user"] == user:
-                te = entry.find("./tag")
-                break
-        else:
-            entry = ET.SubElement(
-                ru,
-                "entry",
-                {
-                    "user": user,
-                },
-            )
-            te = ET.SubElement(entry, "tag")
+    def flush(self, timeout=None):
+        """Wait for every device queue to be drained or given up on
 
-        # Now add in the tags with the specified timeout.
-        props = {}
-        if timeout is not None:
-            props["timeout"] = "{0}".format(timeout)
-        for tag in tags:
-            ET.SubElement(te, "member", props).text = prefix + tag
+        Args:
+            timeout (float): Maximum number of seconds to wait
 
-        # Done.
-        self.send(root)
+        Returns:
+            bool: True if all queues were drained, False on timeout
 
-    def untag_user(self, user, tags=None, prefix=None):
         """
-        Removes tags associated with a user.
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._active, timeout)
 
-        This method can be batched with batch_start() and batch_end().
+    def close(self):
+        """Wait for all queued messages to be sent and stop the workers
 
-        Note: PAN-OS 9.1+
+        Nothing can be sent once the publisher is closed.
+
+        """
+        with self._cond:
+            self._closed = True
+        self.flush()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._scheduler.join()
+        self._pool.shutdown(wait=True)
+
+    def _send(self, device):
+        # Send up to a burst of messages, then go to the back of the pool's
+        # queue so that every device gets its turn.
+        key = id(device)
+        queue = self._queues[key]
+        for _ in range(self.burst):
+            with self._cond:
+                if not queue:
+                    self._active.discard(key)
+                    self._cond.notify_all()
+                    return
+                cmd = queue[0]
+            try:
+                xapi = self._xapis.get(key)
+                if xapi is None:
+                    xapi = self._xapis[key] = device.generate_xapi()
+                self._send_cmd(cmd, device, xapi)
+            except Exception as e:
+                self._failed_attempt(device, e)
+                return
+            with self._cond:
+                queue.popleft()
+                self._attempts[key] = 0
+        self._pool.submit(self._send, device)
+
+    def _failed_attempt(self, device, error):
+        key = id(device)
+        with self._cond:
+            self._attempts[key] += 1
+            attempts = self._attempts[key]
+            if attempts > self.max_retries:
+                logger.warning(
+                    "Giving up on User-ID updates to {0}: {1}".format(device.id, error)
+                )
+                self.failed.append(device)
+                self._errors[key] = error
+                queue = self._queues[key]
+                self.failures.setdefault(device, []).extend((x, error) for x in queue)
+                queue.clear()
+                self._active.discard(key)
+            else:
+                logger.debug(
+                    "User-ID update to {0} failed, retrying: {1}".format(
+                        device.id, error
+                    )
+                )
+                delay = self.retry_interval * 2 ** (attempts - 1)
+                self._sequence += 1
+                heapq.heappush(
+                    self._retries, (time.time() + delay, self._sequence, device)
+                )
+            self._cond.notify_all()
+
+    def _schedule_retries(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._retries:
+                    self._cond.wait()
+                    continue
+                due, _, device = self._retries[0]
+                now = time.time()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._retries)
+                self._pool.submit(self._send, device)
+
+
+class RegisteredIpShadow(object):
+    """Local shadow of the registered-ip tags on a device
+
+    Records every ip/tag registration and unregistration successfully sent
+    by a :class:`UserId` instance, expiring members with a timeout when the
+    timeout elapses, so the registered-ip state of the device can be known
+    without retrieving the whole table.
+
+    Since other sources can also register tags on the device, the shadow
+    is periodically reconciled against the device.
+
+    Example::
+
+        fw.userid.shadow = RegisteredIpShadow(reconcile_interval=3600)
+        fw.userid.audit_registered_ip(pairs)  # first audit reconciles
+        fw.userid.audit_registered_ip(pairs)  # local diff, no retrieval
+
+    Args:
+        reconcile_interval (int): Number of seconds after which the shadow is
+            reconciled against the device again.  If None, the shadow is only
+            reconciled the first time it is used, or on explicit calls to
+            :meth:`UserId.reconcile_shadow`.
+
+    """
+
+    def __init__(self, reconcile_interval=None):
+        self.reconcile_interval = reconcile_interval
+        self.last_reconciled = None
+        # Full tag name -> time of the last reconcile of only that tag
+        self._tags_reconciled = {}
+        # ip -> {tag: expiration time or None}
+        self._entries = {}
+        # Heap of (expiration time, ip, tag).  Entries are removed lazily, so
+        # a heap item is only honored if it still matches _entries.
+        self._expirations = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def needs_reconcile(self, now=None, tag=None):
+        """Returns True if the shadow should be reconciled against the device
 
         Args:
-            user: The user.
-            tags (list): (Optional) Remove only these tags instead of all tags.
-            prefix: Override class tag prefix.
+            now (float): The current time, defaults to ``time.time()``.
+            tag (str): Only check this full tag name, which is also current
+                after it was reconciled on its own.
 
         """
-        root, payload = self._create_uidmessage()
+        last = self.last_reconciled
+        if tag is not None:
+            tag_last = self._tags_reconciled.get(tag)
+            if tag_last is not None and (last is None or tag_last > last):
+                last = tag_last
+        if last is None:
+            return True
+        if self.reconcile_interval is None:
+            return False
+        if now is None:
+            now = time.time()
+        return now - last >= self.reconcile_interval
+
+    def register(self, ip, tag, timeout=None, now=None):
+        """Record that a tag was registered on an ip
 
-        if prefix is None:
-            prefix = self.prefix or ""
+        Args:
+            ip (str): The IP address.
+            tag (str): The full tag name, including any prefix.
+            timeout (int): Timeout of this registration, in seconds.
+            now (float): The current time, defaults to ``time.time()``.
 
-        # Find the unregister user tags section.
-        uu = payload.find("./unregister-user")
-        if uu is None:
-            uu = ET.SubElement(payload, "unregister-user")
+        """
+        expiration = None
+        if timeout is not None and int(timeout) > 0:
+            if now is None:
+                now = time.time()
+            expiration = now + int(timeout)
+            heapq.heappush(self._expirations, (expiration, ip, tag))
+        self._entries.setdefault(ip, {})[tag] = expiration
+
+    def unregister(self, ip, tag):
+        """Record that a tag was unregistered from an ip"""
+        tags = self._entries.get(ip)
+        if tags is None:
+            return
+        tags.pop(tag, None)
+        if not tags:
+            del self._entries[ip]
+
+    def expire(self, now=None):
+        """Drop every member whose timeout has elapsed"""
+        if now is None:
+            now = time.time()
+        heap = self._expirations
+        while heap and heap[0][0] <= now:
+            expiration, ip, tag = heapq.heappop(heap)
+            if self._entries.get(ip, {}).get(tag) == expiration:
+                self.unregister(ip, tag)
 
-        # Find the tags section for this specific user.
-        entries = uu.findall("./entry")
-        for entry in entries:
-            if entry.attrib["user"] == user:
-                break
+    def update_from_uidmessage(self, uidmessage, now=None):
+        """Apply the register and unregister entries of a sent uid-message"""
+        if now is None:
+            now = time.time()
+        for entry in uidmessage.iterfind("./payload/register/entry"):
+            ip = entry.get("ip")
+            for member in entry.iterfind("./tag/member"):
+                self.register(ip, member.text, member.get("timeout"), now)
+        for entry in uidmessage.iterfind("./payload/unregister/entry"):
+            ip = entry.get("ip")
+            for member in entry.iterfind("./tag/member"):
+                self.unregister(ip, member.text)
+
+    def reconcile(self, registered, tag=None, now=None):
+        """Make the shadow match the registered-ip state of the device
+
+        Expiration times already known for ip/tag pairs that are still
+        present on the device are kept.
+
+        Args:
+            registered (dict): ip addresses as keys with tags as values, as
+                returned by :meth:`UserId.get_registered_ip`.
+            tag (str): If given, only reconcile this full tag name, and
+                ``registered`` is the state of this tag only.
+            now (float): The current time, defaults to ``time.time()``.
+
+        """
+        if now is None:
+            now = time.time()
+        old = self._entries
+        if tag is None:
+            self._entries = {}
+            for ip, tags in registered.items():
+                known = old.get(ip, {})
+                self._entries[ip] = dict((t, known.get(t)) for t in tags)
+            self.last_reconciled = now
+            self._tags_reconciled = {}
         else:
-            entry = ET.SubElement(
-                uu,
-                "entry",
-                {
-                    "user": user,
-                },
-            )
+            self._tags_reconciled[tag] = now
+            for ip in [x for x, tags in old.items() if tag in tags]:
+                if ip not in registered:
+                    self.unregister(ip, tag)
+            for ip in registered:
+                self._entries.setdefault(ip, {}).setdefault(tag, None)
+        self._expirations = [
+            (expiration, ip, t)
+            for ip, tags in self._entries.items()
+            for t, expiration in tags.items()
+            if expiration is not None
+        ]
+        heapq.heapify(self._expirations)
 
-        # Do tag removal.
-        te = entry.find("./tag")
-        if tags is not None:
-            if te is None:
-                te = ET.SubElement(entry, "tag")
-            for tag in tags:
-                ET.SubElement(te, "member").text = prefix + tag
-        elif te is not None:
-            entry.remove(te)
+    def registered_ip(self, ip=None, tags=None, prefix="", now=None):
+        """Return the registered/tagged addresses in the shadow
 
-        # Done.
-        self.send(root)
+        The arguments and return value mirror :meth:`UserId.get_registered_ip`.
+
+        Args:
+            ip (:obj:`list` or :obj:`str`): IP address(es) to get tags for
+            tags (:obj:`list` or :obj:`str`): Tag(s) to get
+            prefix (str): Tag prefix
+            now (float): The current time, defaults to ``time.time()``.
+
+        Returns:
+            dict: ip addresses as keys with tags as values
+
+        """
+        self.expire(now)
+        ip = set(string_or_list_or_none(ip))
+        tags = set(prefix + t for t in string_or_list_or_none(tags))
+        ans = {}
+        for c_ip, c_tags in self._entries.items():
+            if ip and c_ip not in ip:
+                continue
+            c_tags = [
+                t
+                for t in c_tags
+                if (not prefix or t.startswith(prefix)) and (not tags or t in tags)
+            ]
+            if c_tags:
+                ans[c_ip] = c_tags
+        return ans
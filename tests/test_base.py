@@ -15,16 +15,22 @@ try:
     from unittest import mock
 except ImportError:
     import mock
+
+import json
+import os
 import random
+import tempfile
 import unittest
 import uuid
 import xml.etree.ElementTree as ET
 
 import pan.xapi
+
 import panos.base as Base
 import panos.errors as Err
 import panos.firewall
 import panos.network
+import panos.panorama
 
 OBJECT_NAME = "MyObjectName"
 VSYS = "vsys1"
@@ -1727,5 +1733,344 @@ class TestVsysOperationsCreateImport(unittest.TestCase):
         self.assertEqual(parsed.text, evil_name)
 
 
+FULL_FIREWALL_CONFIG = """<config version="10.1.0">
+<devices><entry name="localhost.localdomain">
+  <deviceconfig><system><hostname>fw1</hostname></system></deviceconfig>
+  <network>
+    <interface><ethernet>
+      <entry name="ethernet1/1"><layer3>
+        <units><entry name="ethernet1/1.5"><tag>5</tag></entry></units>
+      </layer3></entry>
+      <entry name="ethernet1/2"><layer3/></entry>
+    </ethernet></interface>
+    <virtual-router><entry name="default">
+      <interface><member>ethernet1/1</member></interface>
+      <routing-table><ip><static-route><entry name="default-route">
+        <destination>0.0.0.0/0</destination>
+      </entry></static-route></ip></routing-table>
+    </entry></virtual-router>
+  </network>
+  <vsys>
+    <entry name="vsys1">
+      <address>
+        <entry name="web"><ip-netmask>10.1.1.1</ip-netmask></entry>
+        <entry name="db"><ip-netmask>10.1.1.2</ip-netmask></entry>
+      </address>
+      <rulebase><security><rules>
+        <entry name="r1"><action>allow</action></entry>
+        <entry name="r2"><action>deny</action></entry>
+      </rules></security></rulebase>
+    </entry>
+    <entry name="vsys2">
+      <import><network><interface>
+        <member>ethernet1/2</member>
+      </interface></network></import>
+      <address><entry name="v2-host"><ip-netmask>10.2.2.2</ip-netmask></entry></address>
+    </entry>
+  </vsys>
+</entry></devices>
+</config>"""
+
+
+class TestRefreshFullConfig(unittest.TestCase):
+    def setUp(self):
+        self.fw = panos.firewall.Firewall("127.0.0.1", "admin", "admin", "secret")
+        self.fw._version_info = (10, 1, 0)
+
+    def summary(self, node):
+        return [(type(x).__name__, x.uid, self.summary(x)) for x in node.children]
+
+    def test_builds_whole_tree_from_one_call(self):
+        resp = "<response><result>{0}</result></response>".format(FULL_FIREWALL_CONFIG)
+        self.fw._xapi_private = mock.Mock()
+        self.fw.xapi.get.return_value = ET.fromstring(resp)
+        self.fw.add(panos.network.Zone("stale"))
+
+        self.fw.refresh_full_config()
+
+        self.fw.xapi.get.assert_called_once_with("/config", retry_on_peer=True)
+        ans = self.summary(self.fw)
+        self.assertEqual(
+            ans,
+            [
+                ("Vsys", "vsys1", []),
+                (
+                    "Vsys",
+                    "vsys2",
+                    [
+                        ("AddressObject", "v2-host", []),
+                        ("EthernetInterface", "ethernet1/2", []),
+                    ],
+                ),
+                ("SystemSettings", "", []),
+                ("AddressObject", "web", []),
+                ("AddressObject", "db", []),
+                (
+                    "Rulebase",
+                    "",
+                    [("SecurityRule", "r1", []), ("SecurityRule", "r2", [])],
+                ),
+                (
+                    "EthernetInterface",
+                    "ethernet1/1",
+                    [("Layer3Subinterface", "ethernet1/1.5", [])],
+                ),
+                ("EthernetInterface", "ethernet1/2", []),
+                ("VirtualRouter", "default", [("StaticRoute", "default-route", [])]),
+            ],
+        )
+        self.assertEqual(self.fw.find("web").value, "10.1.1.1")
+        self.assertEqual(self.fw.find("default").interface, ["ethernet1/1"])
+
+    def test_running_config(self):
+        resp = "<response><result>{0}</result></response>".format(FULL_FIREWALL_CONFIG)
+        self.fw._xapi_private = mock.Mock()
+        self.fw.xapi.show.return_value = ET.fromstring(resp)
+
+        self.fw.refresh_full_config(running_config=True)
+
+        self.fw.xapi.get.assert_not_called()
+        self.assertEqual(self.fw.find("r2", recursive=True).action, "deny")
+
+    def test_parallel_parse_gives_same_tree(self):
+        config = ET.fromstring(FULL_FIREWALL_CONFIG)
+        self.fw.refresh_full_config(xml=config)
+        expected = self.summary(self.fw)
+
+        self.fw.refresh_full_config(xml=config, max_workers=4)
+
+        self.assertEqual(self.summary(self.fw), expected)
+
+    def incremental_device(self, pending="no"):
+        self.audit_version = 1
+        self.config = FULL_FIREWALL_CONFIG
+
+        def op(cmd, **kwargs):
+            if cmd == "check pending-changes":
+                result = pending
+            else:
+                result = "<entry><version>{0}</version></entry>".format(
+                    self.audit_version
+                )
+            return ET.fromstring(
+                "<response><result>{0}</result></response>".format(result)
+            )
+
+        self.fw._xapi_private = mock.Mock()
+        self.fw.xapi.op.side_effect = op
+        self.fw.xapi.get.side_effect = lambda *args, **kwargs: ET.fromstring(
+            "<response><result>{0}</result></response>".format(self.config)
+        )
+
+    def test_incremental_without_changes(self):
+        self.incremental_device()
+        children = self.fw.refresh_incremental()
+
+        self.assertEqual(self.fw.refresh_incremental(), [])
+
+        self.assertEqual(self.fw.xapi.get.call_count, 1)
+        self.assertEqual(self.fw.children, children)
+
+    def test_incremental_rebuilds_changed_types(self):
+        self.incremental_device()
+        self.fw.refresh_incremental()
+        rulebase = self.fw.find("", panos.policies.Rulebase)
+        self.audit_version = 2
+        self.config = FULL_FIREWALL_CONFIG.replace("10.1.1.1", "10.9.9.9")
+
+        rebuilt = self.fw.refresh_incremental()
+
+        # The XML of the vsys holds the addresses, so they are rebuilt too.
+        self.assertEqual([x.uid for x in rebuilt], ["vsys1", "vsys2", "web", "db"])
+        self.assertEqual(self.fw.find("web").value, "10.9.9.9")
+        self.assertIs(self.fw.find("", panos.policies.Rulebase), rulebase)
+        self.assertEqual(self.fw.xapi.get.call_count, 2)
+
+    def test_incremental_after_full_refresh(self):
+        self.incremental_device()
+        self.fw.refresh_full_config()
+
+        self.assertEqual(self.fw.refresh_incremental(), [])
+        self.assertEqual(self.fw.xapi.get.call_count, 2)
+
+    def test_incremental_with_pending_changes(self):
+        self.incremental_device(pending="yes")
+        self.fw.refresh_incremental()
+
+        self.assertEqual(self.fw.refresh_incremental(), [])
+
+        self.assertEqual(self.fw.xapi.get.call_count, 2)
+        self.assertEqual(self.fw.xapi.op.call_count, 2)
+
+    def test_panorama(self):
+        config = ET.fromstring(
+            """<config>
+            <mgt-config><devices><entry name="0001"/><entry name="0002"/></devices></mgt-config>
+            <shared><address><entry name="shared-a"><fqdn>a.example.com</fqdn></entry></address></shared>
+            <devices><entry name="localhost.localdomain">
+              <device-group><entry name="dg1">
+                <devices><entry name="0001"/></devices>
+                <address><entry name="dg-a"><ip-netmask>2.2.2.2</ip-netmask></entry></address>
+                <pre-rulebase><security><rules>
+                  <entry name="allow-web"><action>allow</action></entry>
+                </rules></security></pre-rulebase>
+              </entry></device-group>
+              <template><entry name="t1">
+                <config><devices><entry name="localhost.localdomain">
+                  <vsys><entry name="vsys1"><zone><entry name="trust"/></zone></entry></vsys>
+                </entry></devices></config>
+              </entry></template>
+            </entry></devices>
+            </config>"""
+        )
+        pano = panos.panorama.Panorama("127.0.0.1", "admin", "admin", "secret")
+        pano._version_info = (10, 1, 0)
+
+        pano.refresh_full_config(xml=config)
+
+        self.assertEqual(
+            self.summary(pano),
+            [
+                ("AddressObject", "shared-a", []),
+                ("Firewall", "0001", []),
+                ("Firewall", "0002", []),
+                (
+                    "DeviceGroup",
+                    "dg1",
+                    [
+                        ("Firewall", "0001", []),
+                        ("AddressObject", "dg-a", []),
+                        ("PreRulebase", "", [("SecurityRule", "allow-web", [])]),
+                    ],
+                ),
+                (
+                    "Template",
+                    "t1",
+                    [("Vsys", "vsys1", []), ("Zone", "trust", [])],
+                ),
+            ],
+        )
+
+    def test_requires_config_element(self):
+        with self.assertRaises(ValueError):
+            self.fw.refresh_full_config(xml=ET.fromstring("<devices/>"))
+
+    def write_config(self, text):
+        fd, path = tempfile.mkstemp(suffix=".xml")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_from_config_file(self):
+        path = self.write_config(
+            '<response status="success"><result>{0}</result></response>'.format(
+                FULL_FIREWALL_CONFIG
+            )
+        )
+
+        fw = panos.firewall.Firewall.from_config_file(path, serial="0001")
+
+        self.assertEqual(fw.hostname, "fw1")
+        self.assertEqual(fw.serial, "0001")
+        self.assertEqual(fw.version, "10.1.0")
+        self.assertEqual(fw._version_info, (10, 1, 0))
+        self.assertEqual(fw.find("r2", recursive=True).action, "deny")
+        self.assertEqual(len(fw.findall(panos.network.EthernetInterface)), 2)
+
+    def test_from_config_file_with_version(self):
+        path = self.write_config("<config><shared/></config>")
+
+        pano = panos.panorama.Panorama.from_config_file(path, "9.1.3-h1")
+
+        self.assertEqual(pano._version_info, (9, 1, 3))
+        self.assertEqual(pano.children, [])
+
+    def test_from_config_file_without_version(self):
+        path = self.write_config("<config><shared/></config>")
+
+        with self.assertRaises(ValueError):
+            panos.panorama.Panorama.from_config_file(path)
+
+    def test_from_config_file_without_config(self):
+        path = self.write_config("<response><result/></response>")
+
+        with self.assertRaises(ValueError):
+            panos.firewall.Firewall.from_config_file(path, "10.1.0")
+
+
+class TestParseJobResults(unittest.TestCase):
+    def setUp(self):
+        self.fw = Base.PanDevice("127.0.0.1", "admin", "admin", "secret")
+
+    def job(self, devices="", details=""):
+        return ET.fromstring(
+            "<response><result><job><tenq>2026/01/01 00:00:00</tenq>"
+            "<tfin>2026/01/01 00:01:00</tfin><id>7</id><user>admin</user>"
+            "<status>FIN</status><result>OK</result>{0}{1}</job></result>"
+            "</response>".format(devices, details)
+        )
+
+    def test_job(self):
+        xml = self.job(
+            details="<details><line>Configuration committed</line></details>"
+        )
+
+        ans = self.fw._parse_job_results(xml, get_devices=False)
+
+        self.assertEqual(ans["success"], True)
+        self.assertEqual(ans["jobid"], "7")
+        self.assertEqual(ans["messages"], ["Configuration committed"])
+        self.assertIsNone(ans["warnings"])
+        self.assertIs(ans["xml"], xml)
+
+    def test_commit_all_job(self):
+        xml = self.job(
+            "<devices>"
+            "<entry><serial-no>0001</serial-no><devicename>fw1</devicename>"
+            "<result>OK</result><tstart>now</tstart></entry>"
+            "<entry><serial-no>0002</serial-no><devicename>fw2</devicename>"
+            "<result>FAIL</result><tstart>now</tstart><details><msg><errors>"
+            "<line>Validation error</line></errors></msg></details></entry>"
+            "</devices>"
+        )
+
+        ans = self.fw._parse_job_results(xml, keep_xml=False)
+
+        self.assertEqual(ans["success"], False)
+        self.assertEqual(list(ans["devices"]), ["0001", "0002"])
+        self.assertEqual(ans["devices"]["0001"]["success"], True)
+        self.assertEqual(ans["devices"]["0002"]["messages"], "Validation error")
+        self.assertIsNone(ans["xml"])
+
+    def test_commit_all_job_results_are_json_serializable(self):
+        xml = self.job(
+            "<devices><entry><serial-no>0001</serial-no><devicename>fw1</devicename>"
+            "<result>OK</result><tstart>now</tstart></entry></devices>"
+        )
+
+        ans = self.fw._parse_job_results(xml, keep_xml=False)
+
+        self.assertIsInstance(ans["devices"], dict)
+        data = json.loads(json.dumps(ans))
+        self.assertEqual(data["devices"]["0001"]["name"], "fw1")
+
+    def test_commit_all_job_with_one_device(self):
+        xml = self.job(
+            "<devices><entry><serial-no>0001</serial-no><devicename>fw1</devicename>"
+            "<result>OK</result><tstart>now</tstart></entry></devices>"
+        )
+
+        ans = self.fw._parse_job_results(xml)
+
+        self.assertEqual(ans["success"], True)
+        self.assertEqual(ans["devices"]["0001"]["name"], "fw1")
+
+    def test_no_job(self):
+        xml = ET.fromstring("<response><result/></response>")
+
+        self.assertRaises(Err.PanDeviceError, self.fw._parse_job_results, xml)
+
+
 if __name__ == "__main__":
     unittest.main()
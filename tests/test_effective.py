@@ -0,0 +1,218 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from panos.effective import EffectiveObjects, EffectiveTemplates, HierarchyCache
+from panos.network import EthernetInterface, Zone
+from panos.objects import AddressGroup, AddressObject, ServiceObject
+from panos.panorama import (
+    DeviceGroup,
+    Panorama,
+    Template,
+    TemplateStack,
+    TemplateVariable,
+)
+from panos.policies import PreRulebase, SecurityRule
+
+
+def _panorama():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano.add(AddressObject("web", "10.0.0.1"))
+    pano.add(AddressObject("dns", "10.0.0.53"))
+    pano.add(ServiceObject("web", "tcp", destination_port="80"))
+    for name, parent in (("region", None), ("branch", "region"), ("lab", None)):
+        dg = pano.add(DeviceGroup(name))
+        dg.opstate.dg_hierarchy.parent = parent
+    pano.find("region").add(AddressObject("web", "10.1.0.1"))
+    pano.find("branch").add(AddressGroup("dns", static_value=["web"]))
+    return pano
+
+
+def test_hierarchy_cache():
+    cache = HierarchyCache({"a": None, "b": "a", "c": "b", "d": "a"})
+
+    assert cache.parent("c") == "b"
+    assert cache.ancestors("c") == ("b", "a")
+    assert sorted(cache.children("a")) == ["b", "d"]
+    assert sorted(cache.descendants("a")) == ["b", "c", "d"]
+    assert cache.children(None) == ["a"]
+
+    cache.set_parent("b", "d")
+    assert cache.ancestors("c") == ("b", "d", "a")
+
+    cache.remove("b")
+    assert cache.parent("c") == "d"
+    assert "b" not in cache.parents
+
+
+def test_hierarchy_cache_adding_parent_of_known_group():
+    cache = HierarchyCache({"b": "a"})
+    assert cache.ancestors("b") == ("a",)
+
+    cache.set_parent("a", "x")
+
+    assert cache.ancestors("b") == ("a", "x")
+
+
+def test_hierarchy_cache_with_loop():
+    cache = HierarchyCache({"a": "b", "b": "a"})
+
+    assert cache.ancestors("a") == ("b",)
+
+
+def test_hierarchy_cache_fetch():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano.opstate.dg_hierarchy.fetch = mock.Mock(return_value={"a": None, "b": "a"})
+
+    cache = HierarchyCache.fetch(pano)
+    dg = pano.add(DeviceGroup("b"))
+    cache.apply(pano)
+
+    assert cache.ancestors("b") == ("a",)
+    assert dg.opstate.dg_hierarchy.parent == "a"
+
+
+def test_effective_lookup():
+    pano = _panorama()
+    objects = EffectiveObjects(pano)
+
+    assert objects.lookup("branch", "address", "web").value == "10.1.0.1"
+    assert objects.lookup("lab", "address", "web").value == "10.0.0.1"
+    assert objects.lookup(None, "address", "web").value == "10.0.0.1"
+    assert isinstance(objects.lookup("branch", "address", "dns"), AddressGroup)
+    assert objects.lookup("branch", "service", "web").destination_port == "80"
+    assert objects.lookup("branch", "address", "missing") is None
+    # Device groups without objects of their own share the parent namespace.
+    assert objects.namespace("lab", "address") is objects.namespace(None, "address")
+
+
+def test_effective_ancestor_precedence():
+    pano = _panorama()
+    objects = EffectiveObjects(pano, ancestor_precedence=True)
+
+    assert objects.lookup("branch", "address", "web").value == "10.0.0.1"
+    assert isinstance(objects.lookup("branch", "address", "dns"), AddressObject)
+
+
+def test_effective_resolve():
+    pano = _panorama()
+    rule = pano.find("branch").add(PreRulebase()).add(SecurityRule("r1"))
+    objects = EffectiveObjects(pano)
+
+    assert objects.resolve(rule, "address", "web").value == "10.1.0.1"
+
+
+def test_effective_update():
+    pano = _panorama()
+    objects = EffectiveObjects(pano)
+    lab = objects.namespace("lab", "address")
+    assert objects.lookup("branch", "address", "web").value == "10.1.0.1"
+
+    region = pano.find("region")
+    region.remove(region.find("web"))
+    region.add(AddressObject("web", "10.2.0.1"))
+    objects.update(region)
+
+    assert objects.lookup("branch", "address", "web").value == "10.2.0.1"
+    assert objects.namespace("lab", "address") is lab
+
+
+def test_effective_update_new_device_group():
+    pano = _panorama()
+    objects = EffectiveObjects(pano)
+    dg = pano.add(DeviceGroup("store"))
+    dg.opstate.dg_hierarchy.parent = "branch"
+    dg.add(AddressObject("dns", "10.3.0.53"))
+
+    objects.update("store")
+
+    assert objects.lookup("store", "address", "web").value == "10.1.0.1"
+    assert objects.lookup("store", "address", "dns").value == "10.3.0.53"
+
+
+def test_effective_move():
+    pano = _panorama()
+    objects = EffectiveObjects(pano)
+    assert objects.lookup("branch", "address", "web").value == "10.1.0.1"
+
+    objects.move("branch", "lab")
+
+    assert objects.lookup("branch", "address", "web").value == "10.0.0.1"
+
+
+def _templates():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    base = pano.add(Template("base"))
+    base.add(TemplateVariable("$ip", "10.0.0.1/24"))
+    base.add(TemplateVariable("$gw", "10.0.0.254"))
+    base.add(EthernetInterface("ethernet1/1", mode="layer3", ip=["$ip"]))
+    base.add(EthernetInterface("ethernet1/2", mode="layer3", comment="$gw"))
+    base.add(Zone("trust", mode="layer3", interface=["ethernet1/2"]))
+    site = pano.add(Template("site"))
+    site.add(TemplateVariable("$ip", "10.1.0.1/24"))
+    site.add(EthernetInterface("ethernet1/1", comment="site", mtu=1400))
+    stack = pano.add(TemplateStack("stack", templates=["site", "base"]))
+    stack.add(EthernetInterface("ethernet1/3", ip=["$wan"]))
+    return pano
+
+
+def test_template_stack_config():
+    pano = _templates()
+    templates = EffectiveTemplates(pano)
+
+    config = templates.config("stack")
+
+    assert config.name == "stack"
+    assert [x.uid for x in config.children] == [
+        "ethernet1/3",
+        "ethernet1/1",
+        "ethernet1/2",
+        "trust",
+    ]
+    eth1 = config.children[1]
+    assert (eth1.mode, eth1.ip, eth1.comment, eth1.mtu) == (
+        "layer3",
+        ["10.1.0.1/24"],
+        "site",
+        1400,
+    )
+    assert config.children[2].comment == "10.0.0.254"
+    assert config.children[3].interface == ["ethernet1/2"]
+    assert templates.variables("stack") == {"$ip": "10.1.0.1/24", "$gw": "10.0.0.254"}
+    assert templates.missing_variables("stack") == set(["$wan"])
+    assert templates.config("stack") is config
+
+
+def test_template_stack_variable_overrides():
+    pano = _templates()
+    templates = EffectiveTemplates(pano)
+
+    config = templates.config("stack", {"$wan": "192.0.2.1/24", "$ip": "10.9.0.1/24"})
+
+    assert config.children[0].ip == ["192.0.2.1/24"]
+    assert config.children[1].ip == ["10.9.0.1/24"]
+    assert templates.missing_variables("stack", {"$wan": "192.0.2.1/24"}) == set()
+    assert templates.config("stack") is not config
+
+
+def test_template_stack_update():
+    pano = _templates()
+    templates = EffectiveTemplates(pano)
+    config = templates.config("stack")
+
+    site = pano.find("site", Template)
+    site.find("$ip").value = "10.2.0.1/24"
+    templates.update(site)
+
+    assert templates.config("stack") is not config
+    assert templates.config("stack").children[1].ip == ["10.2.0.1/24"]
+
+    pano.find("stack", TemplateStack).templates = ["base"]
+    templates.update("stack")
+    site.find("$ip").value = "10.3.0.1/24"
+    config = templates.config("stack")
+    templates.update(site)
+
+    assert templates.config("stack") is config
+    assert config.children[1].ip == ["10.0.0.1/24"]
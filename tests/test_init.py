@@ -320,5 +320,15 @@ class TestChunkInstancesForDeleteSimilar(unittest.TestCase):
         self.assertEqual(len(items), sum(len(x) for x in chunks))
 
 
+class TestGetLogger(unittest.TestCase):
+    def test_handler_added_once(self):
+        name = "panos.test_init.getlogger"
+        for _ in range(3):
+            logger = panos.getlogger(name)
+
+        self.assertEqual(1, len(logger.handlers))
+        logger.debug1("message")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from panos.base import PanDevice
+from panos.firewall import Firewall
+from panos.inventory import Inventory
+from panos.panorama import Panorama
+
+SYSTEM_INFO = """<response status="success"><result><system>
+<hostname>fw1</hostname><model>PA-3260</model><serial>0001</serial>
+<sw-version>10.1.3</sw-version><app-version>8500-7000</app-version>
+<multi-vsys>on</multi-vsys>
+</system></result></response>"""
+
+
+@pytest.fixture
+def tmpdir_path():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+def _firewall():
+    fw = Firewall("10.0.0.1", api_key="secret")
+    fw._set_version_and_version_info("10.1.3")
+    fw.platform = "PA-3260"
+    fw.serial = "0001"
+    fw.content_version = "8500-7000"
+    fw.multi_vsys = True
+    return fw
+
+
+def test_save_and_load(tmpdir_path):
+    path = os.path.join(tmpdir_path, "inventory.json")
+    inventory = Inventory(path)
+    inventory.update(_firewall())
+    inventory.save()
+
+    ans = Inventory(path)
+
+    entry = ans.get("10.0.0.1")
+    assert (entry["type"], entry["serial"], entry["version"]) == (
+        "firewall",
+        "0001",
+        "10.1.3",
+    )
+    assert ans.get(serial="0001") == entry
+
+
+def test_create_from_inventory():
+    inventory = Inventory()
+    inventory.update(_firewall())
+
+    with mock.patch.object(PanDevice, "show_system_info") as show_system_info:
+        fw = inventory.create("10.0.0.1", api_key="secret")
+
+    show_system_info.assert_not_called()
+    assert isinstance(fw, Firewall)
+    assert (fw.serial, fw.platform, fw.multi_vsys) == ("0001", "PA-3260", True)
+    assert fw._version_info == (10, 1, 3)
+
+
+def test_create_unknown_device():
+    inventory = Inventory()
+
+    with mock.patch("panos.base.PanDevice.generate_xapi") as generate_xapi:
+        generate_xapi.return_value.op.return_value = ET.fromstring(SYSTEM_INFO)
+        fw = inventory.create("10.0.0.1", api_key="secret")
+
+    assert generate_xapi.return_value.op.call_count == 1
+    assert (fw.serial, fw.version, fw.content_version) == (
+        "0001",
+        "10.1.3",
+        "8500-7000",
+    )
+    assert inventory.get("10.0.0.1")["platform"] == "PA-3260"
+
+
+def test_expired_entry():
+    inventory = Inventory(ttl=60)
+    inventory.update(_firewall())
+
+    inventory._entries[("hostname", "10.0.0.1")]["updated"] -= 61
+
+    assert inventory.get("10.0.0.1") is None
+    assert inventory.apply(Firewall("10.0.0.1")) is False
+
+
+def test_mismatch_is_refreshed():
+    inventory = Inventory()
+    inventory.update(_firewall())
+    fw = Firewall("10.0.0.1", api_key="secret", serial="0002")
+
+    with mock.patch.object(Firewall, "refresh_system_info") as refresh:
+        assert inventory.sync(fw) is False
+
+    refresh.assert_called_once_with()
+    assert inventory.get(serial="0001") is None
+
+
+def test_panorama_and_proxied_firewall():
+    inventory = Inventory()
+    pano = Panorama("10.0.0.2", api_key="secret")
+    pano._set_version_and_version_info("10.2.0")
+    pano.serial = "9999"
+    inventory.update(pano)
+    inventory.update(_firewall())
+    fw = Firewall(serial="0001")
+
+    assert inventory.apply(fw) is True
+    assert inventory.get("10.0.0.2")["type"] == "panorama"
+    assert fw.version == "10.1.3"
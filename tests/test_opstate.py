@@ -8,6 +8,8 @@ except ImportError:
 
 from panos.firewall import Firewall
 from panos.policies import HitCount
+from panos.policies import HitCountSampler
+from panos.policies import HitCountSeries
 from panos.policies import Rulebase
 from panos.policies import SecurityRule
 from panos.policies import AuditCommentLog
@@ -248,6 +250,102 @@ def test_security_rule_hit_count_refresh():
     _hit_count_eq(expected, o.opstate.hit_count)
 
 
+def _hit_count_response(*args):
+    inner = "".join(ET.tostring(x, encoding="utf-8").decode("utf-8") for x in args)
+    return ET.fromstring(HIT_COUNT_PREFIX + inner + HIT_COUNT_SUFFIX)
+
+
+def test_rulebase_hit_count_refresh_in_batches():
+    fw, rb = _hit_count_fw_setup()
+    names = ["r{0}".format(x) for x in range(5)]
+    for name in names:
+        rb.add(SecurityRule(name))
+    fw.op = mock.Mock(
+        side_effect=[
+            _hit_count_response(*[_hit_count_elm(x, hit_count=1) for x in names[:2]]),
+            _hit_count_response(*[_hit_count_elm(x, hit_count=2) for x in names[2:4]]),
+            _hit_count_response(_hit_count_elm(names[4], hit_count=3)),
+        ]
+    )
+
+    ans = rb.opstate.hit_count.refresh("security", batch_size=2)
+
+    assert fw.op.call_count == 3
+    members = [
+        [m.text for m in ET.fromstring(x[0][0]).iter("member")]
+        for x in fw.op.call_args_list
+    ]
+    assert members == [names[:2], names[2:4], names[4:]]
+    assert [ans[x].hit_count for x in names] == [1, 1, 2, 2, 3]
+    assert rb.children[4].opstate.hit_count.hit_count == 3
+
+
+def test_rulebase_hit_count_refresh_with_rule_objects():
+    elm = _hit_count_elm("foo", hit_count=7)
+    fw, rb = _hit_count_fw_setup(elm)
+    o = SecurityRule("foo")
+    rb.add(o)
+    rb.add(SecurityRule("bar"))
+
+    ans = rb.opstate.hit_count.refresh("security", rules=[o])
+
+    assert list(ans) == ["foo"]
+    assert o.opstate.hit_count.hit_count == 7
+    members = [m.text for m in ET.fromstring(fw.op.call_args[0][0]).iter("member")]
+    assert members == ["foo"]
+
+
+def test_hit_count_series():
+    series = HitCountSeries()
+    series.append(100, 1000, 5)
+    series.append(160, 1600, 5)
+    series.append(220, 1900, 5)
+    # Counter reset.
+    series.append(280, 300, 250)
+
+    assert len(series) == 4
+    assert list(series.deltas) == [0, 600, 300, 300]
+    assert series.hits() == 1200
+    assert series.hits(since=160) == 600
+    assert series.rate() == 1200 / 180.0
+    assert series.rate(window=60) == 5.0
+    assert HitCountSeries().rate() is None
+
+
+def test_hit_count_sampler():
+    fw, rb = _hit_count_fw_setup()
+    rb.add(SecurityRule("foo"))
+    rb.add(SecurityRule("bar"))
+    fw.op = mock.Mock(
+        side_effect=[
+            _hit_count_response(
+                _hit_count_elm("foo", hit_count=10), _hit_count_elm("bar", hit_count=0)
+            ),
+            _hit_count_response(
+                _hit_count_elm("foo", hit_count=70), _hit_count_elm("bar", hit_count=6)
+            ),
+        ]
+    )
+    sampler = HitCountSampler([rb], interval=60)
+
+    sampler.sample(1000)
+    sampler.sample(1060)
+
+    assert sampler.rates() == {"foo": 1.0, "bar": 0.1}
+    assert sampler.series[(rb, "security", "foo")].hits() == 60
+
+
+def test_hit_count_sampler_run():
+    fw, rb = _hit_count_fw_setup(_hit_count_elm("foo", hit_count=1))
+    rb.add(SecurityRule("foo"))
+    sampler = HitCountSampler([rb], interval=0)
+
+    sampler.run(samples=3)
+
+    assert fw.op.call_count == 3
+    assert len(sampler.series[(rb, "security", "foo")]) == 3
+
+
 def test_current_audit_comment():
     expected = "Hello, world"
 
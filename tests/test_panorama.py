@@ -1,12 +1,15 @@
 import xml.etree.ElementTree as ET
 
+import pytest
+
 try:
     from unittest import mock
 except ImportError:
     import mock
 
-from panos.panorama import DeviceGroup
-from panos.panorama import Panorama
+import panos.errors as err
+from panos.firewall import Firewall
+from panos.panorama import DeviceGroup, Panorama, PanoramaCommitAll
 
 
 def _device_group_hierarchy():
@@ -93,3 +96,347 @@ def test_device_group_hierarchy_refresh():
     dg.opstate.dg_hierarchy.refresh()
 
     assert dg.opstate.dg_hierarchy.parent == "instruments"
+
+
+def _managed_device(serial, connected, vsys, multi_vsys="no"):
+    vsys_xml = "".join(
+        '<entry name="{0}"><display-name>{1}</display-name></entry>'.format(*x)
+        for x in vsys
+    )
+    return """
+<entry name="{0}">
+    <serial>{0}</serial>
+    <hostname>fw{0}</hostname>
+    <ip-address>10.0.0.{1}</ip-address>
+    <ipv6-address>unknown</ipv6-address>
+    <connected>{2}</connected>
+    <unsupported-version>no</unsupported-version>
+    <sw-version>10.1.{1}</sw-version>
+    <multi-vsys>{3}</multi-vsys>
+    <vsys>{4}</vsys>
+</entry>""".format(
+        serial, int(serial), connected, multi_vsys, vsys_xml
+    )
+
+
+def _managed_devices():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano._version_info = (10, 1, 0)
+    devices = "".join(
+        [
+            _managed_device("001", "yes", [("vsys1", "vsys1")]),
+            _managed_device("002", "no", [("vsys1", "vsys1")]),
+            _managed_device(
+                "003", "yes", [("vsys1", "one"), ("vsys2", "two")], multi_vsys="yes"
+            ),
+            _managed_device("004", "yes", [("vsys1", "vsys1")]),
+        ]
+    )
+    devicegroups = """
+<entry name="dg1"><devices>
+    <entry name="001"><shared-policy-status>In Sync</shared-policy-status></entry>
+    <entry name="002"><shared-policy-status>Out of Sync</shared-policy-status></entry>
+</devices></entry>"""
+    config = """
+<entry name="dg1"><devices><entry name="001"/><entry name="002"/></devices></entry>
+<entry name="dg2"><devices>
+    <entry name="003"><vsys><entry name="vsys2"/></vsys></entry>
+    <entry name="009"/>
+</devices></entry>"""
+
+    def op(cmd):
+        if cmd.startswith("show devices"):
+            xml = "<devices>{0}</devices>".format(devices)
+        else:
+            xml = "<devicegroups>{0}</devicegroups>".format(devicegroups)
+        return ET.fromstring("<response><result>{0}</result></response>".format(xml))
+
+    pano.op = mock.Mock(side_effect=op)
+    pano._xapi_private = mock.Mock()
+    pano.xapi.get.return_value = ET.fromstring(
+        "<response><result><device-group>{0}</device-group></result></response>".format(
+            config
+        )
+    )
+    return pano
+
+
+def _firewall_summary(fw):
+    return (fw.serial, fw.vsys, fw.state.shared_policy_synced)
+
+
+def test_refresh_devices():
+    pano = _managed_devices()
+
+    ans = pano.refresh_devices(add=True)
+
+    assert [type(x).__name__ for x in ans] == [
+        "Firewall",
+        "Firewall",
+        "DeviceGroup",
+        "DeviceGroup",
+    ]
+    assert [_firewall_summary(x) for x in ans[:2]] == [
+        ("003", "vsys1", None),
+        ("004", "vsys1", None),
+    ]
+    dg1, dg2 = ans[2:]
+    assert [_firewall_summary(x) for x in dg1.children] == [
+        ("001", "vsys1", True),
+        ("002", "vsys1", False),
+    ]
+    assert [_firewall_summary(x) for x in dg2.children] == [
+        ("003", "vsys2", None),
+        ("009", "vsys1", None),
+    ]
+    fw = dg2.children[0]
+    assert (fw.vsys_name, fw.version, fw.multi_vsys) == ("two", "10.1.3", True)
+    assert fw.children[0].hostname == "fw003"
+    assert pano.children == ans[2:] + ans[:2]
+
+
+def test_refresh_devices_requested_vsys():
+    pano = _managed_devices()
+
+    ans = pano.refresh_devices([Firewall(serial="003", vsys="vsys2")])
+
+    assert [type(x).__name__ for x in ans] == ["DeviceGroup", "DeviceGroup"]
+    assert ans[0].children == []
+    assert [_firewall_summary(x) for x in ans[1].children] == [("003", "vsys2", None)]
+
+
+def test_refresh_devices_without_device_groups():
+    pano = _managed_devices()
+
+    ans = pano.refresh_devices(
+        only_connected=True, expand_vsys=False, include_device_groups=False
+    )
+
+    assert [(x.serial, x.vsys, x.state.connected) for x in ans] == [
+        ("001", None, True),
+        ("002", None, False),
+        ("003", None, True),
+        ("004", None, True),
+    ]
+    pano.op.assert_called_once_with("show devices connected")
+    pano.xapi.get.assert_not_called()
+
+
+class _CommitAllJobs(object):
+    """Commit-all jobs of a fake Panorama.
+
+    Each device finishes after as many polls as given in ``slow``; devices in
+    ``failing`` fail that many times.  A push to devices in ``unchanged``
+    starts no job, as there is nothing to commit.
+
+    """
+
+    def __init__(self, slow=None, failing=None, unchanged=()):
+        self.slow = slow or {}
+        self.failing = dict(failing or {})
+        self.unchanged = set(unchanged)
+        self.jobs = {}
+        self.polls = {}
+
+    def commit(self, cmd, **kwargs):
+        jobid = str(len(self.jobs) + 1)
+        elm = ET.fromstring(cmd)
+        serials = [x.get("name") for x in elm.findall(".//devices/entry")]
+        serials.extend(x.text for x in elm.findall(".//device/member"))
+        if self.unchanged.intersection(serials):
+            return ET.fromstring(
+                '<response status="success"><msg>There are no changes to commit.'
+                "</msg></response>"
+            )
+        self.jobs[jobid] = serials
+        self.polls[jobid] = 0
+        return ET.fromstring(
+            "<response><result><job>{0}</job></result></response>".format(jobid)
+        )
+
+    def op(self, cmd, **kwargs):
+        jobid = cmd.split('"')[1]
+        self.polls[jobid] += 1
+        entries = []
+        done = True
+        for serial in self.jobs[jobid]:
+            if self.polls[jobid] <= self.slow.get(serial, 0):
+                result = "PEND"
+                done = False
+            elif self.failing.get(serial):
+                result = "FAIL"
+            else:
+                result = "OK"
+            entries.append(
+                "<entry><serial-no>{0}</serial-no><devicename>fw{0}</devicename>"
+                "<result>{1}</result><tstart>now</tstart></entry>".format(
+                    serial, result
+                )
+            )
+        if done:
+            for serial in self.jobs[jobid]:
+                if self.failing.get(serial):
+                    self.failing[serial] -= 1
+        return ET.fromstring(
+            "<response><result><job><id>{0}</id><status>FIN</status>"
+            "<result>OK</result><devices>{1}</devices></job></result>"
+            "</response>".format(jobid, "".join(entries))
+        )
+
+
+def _commit_all_panorama(jobs):
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano._xapi_private = mock.Mock()
+    pano.xapi.commit.side_effect = jobs.commit
+    pano.xapi.op.side_effect = jobs.op
+    return pano
+
+
+def test_commit_all_batches():
+    jobs = _CommitAllJobs(slow={"001": 3})
+    pano = _commit_all_panorama(jobs)
+    cmd = PanoramaCommitAll("device group", "dg1")
+
+    ans = pano.commit_all_batches(
+        cmd, ["001", "002", "003", "004", "005"], batch_size=2, max_jobs=2, interval=0
+    )
+
+    assert [(x["serial"], x["jobid"], x["success"]) for x in ans] == [
+        ("002", "1", True),
+        ("003", "2", True),
+        ("004", "2", True),
+        ("005", "3", True),
+        ("001", "1", True),
+    ]
+    assert jobs.jobs == {"1": ["001", "002"], "2": ["003", "004"], "3": ["005"]}
+    assert cmd.devices is None
+
+
+def test_commit_all_batches_retries_failed_devices():
+    jobs = _CommitAllJobs(failing={"002": 1, "003": 5})
+    pano = _commit_all_panorama(jobs)
+    cmd = PanoramaCommitAll("template stack", "stack1")
+
+    ans = list(pano.commit_all_batches(cmd, ["001", "002", "003"], interval=0))
+
+    assert [(x["serial"], x["attempt"], x["result"], x["retry"]) for x in ans] == [
+        ("001", 1, "OK", False),
+        ("002", 1, "FAIL", True),
+        ("003", 1, "FAIL", True),
+        ("002", 2, "OK", False),
+        ("003", 2, "FAIL", False),
+    ]
+    assert jobs.jobs["2"] == ["002", "003"]
+
+
+def test_commit_all_batches_reports_batches_not_needing_a_commit():
+    jobs = _CommitAllJobs(unchanged={"003"})
+    pano = _commit_all_panorama(jobs)
+    cmd = PanoramaCommitAll("device group", "dg1")
+
+    ans = list(
+        pano.commit_all_batches(
+            cmd, ["001", "002", "003", "004"], batch_size=2, interval=0
+        )
+    )
+
+    assert [(x["serial"], x["jobid"], x["result"]) for x in ans] == [
+        ("003", None, None),
+        ("004", None, None),
+        ("001", "1", "OK"),
+        ("002", "1", "OK"),
+    ]
+    assert ans[0]["success"] is True
+    assert ans[0]["retry"] is False
+    assert set(ans[0]) == set(ans[2])
+    assert list(jobs.jobs.values()) == [["001", "002"]]
+
+
+def test_commit_all_batches_waves():
+    jobs = _CommitAllJobs(failing={"001": 1})
+    pano = _commit_all_panorama(jobs)
+    cmd = PanoramaCommitAll("device group", "dg1", devices=["unused"])
+
+    ans = list(
+        pano.commit_all_batches(
+            cmd, waves=[["001"], ["002", "003"]], retries=0, halt_on_failure=True
+        )
+    )
+
+    assert [(x["serial"], x["success"]) for x in ans] == [("001", False)]
+    assert list(jobs.jobs.values()) == [["001"]]
+
+
+def test_commit_all_batches_requires_devices():
+    pano = _commit_all_panorama(_CommitAllJobs())
+
+    with pytest.raises(ValueError):
+        list(pano.commit_all_batches(PanoramaCommitAll("device group", "dg1")))
+    with pytest.raises(ValueError):
+        list(pano.commit_all_batches(PanoramaCommitAll("log collector group", "x")))
+
+
+def _proxy_panorama():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    xapis = []
+
+    def generate_xapi():
+        xapi = mock.Mock()
+
+        def call(*args, **kwargs):
+            if xapi.serial == "bad":
+                raise err.PanDeviceXapiError("Unreachable")
+            return ET.fromstring(
+                "<response><result>{0}</result></response>".format(xapi.serial)
+            )
+
+        xapi.op.side_effect = call
+        xapi.set.side_effect = call
+        xapis.append(xapi)
+        return xapi
+
+    pano.generate_xapi = generate_xapi
+    return pano, xapis
+
+
+def test_op_devices():
+    pano, xapis = _proxy_panorama()
+    pano.add(Firewall(serial="001"))
+    pano.add(DeviceGroup("dg1")).add(Firewall(serial="002"))
+    pano.add(Firewall(serial="001"))
+
+    ans = pano.op_devices("show system info", max_workers=1)
+
+    assert [(k, v.findtext("./result")) for k, v in ans.items()] == [
+        ("001", "001"),
+        ("002", "002"),
+    ]
+    assert len(xapis) == 1
+    assert xapis[0].op.call_args[0] == (
+        b"<show><system><info /></system></show>",
+        None,
+        False,
+    )
+
+
+def test_op_devices_failure():
+    pano, xapis = _proxy_panorama()
+
+    ans = pano.op_devices("show system info", ["001", "bad", Firewall(serial="003")])
+
+    assert list(ans) == ["001", "bad", "003"]
+    assert isinstance(ans["bad"], err.PanDeviceXapiError)
+    assert ans["003"].findtext("./result") == "003"
+
+
+def test_config_devices():
+    pano, xapis = _proxy_panorama()
+
+    ans = pano.config_devices("set", "/config/x", ["001"], element="<y/>")
+
+    assert ans["001"].findtext("./result") == "001"
+    xapis[0].set.assert_called_once_with(
+        xpath="/config/x", element="<y/>", retry_on_peer=False
+    )
+    with pytest.raises(ValueError):
+        pano.config_devices("move", "/config/x", ["001"])
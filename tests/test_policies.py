@@ -0,0 +1,101 @@
+import random
+import xml.etree.ElementTree as ET
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from panos.firewall import Firewall
+from panos.policies import NatRule, Rulebase, SecurityRule, plan_moves
+
+
+def _apply(current, moves):
+    order = list(current)
+    for name, location, ref in moves:
+        order.remove(name)
+        if location == "top":
+            order.insert(0, name)
+        else:
+            order.insert(order.index(ref) + 1, name)
+    return order
+
+
+@pytest.mark.parametrize(
+    "current, desired, count",
+    [
+        ("abcde", "abcde", 0),
+        ("abcde", "eabcd", 1),
+        ("abcde", "bcdea", 1),
+        ("abcde", "edcba", 4),
+        ("abcde", "acbed", 2),
+    ],
+)
+def test_plan_moves(current, desired, count):
+    moves = plan_moves(list(current), list(desired))
+
+    assert len(moves) == count
+    assert _apply(current, moves) == list(desired)
+
+
+def test_plan_moves_few_moves_for_large_rulebase():
+    random.seed(4)
+    current = ["r{0}".format(x) for x in range(5000)]
+    desired = list(current)
+    for _ in range(30):
+        desired.insert(random.randrange(5000), desired.pop(random.randrange(5000)))
+
+    moves = plan_moves(current, desired)
+
+    assert len(moves) <= 30
+    assert _apply(current, moves) == desired
+
+
+def _rulebase():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw._version_info = (10, 1, 0)
+    fw._xapi_private = mock.Mock()
+    rb = fw.add(Rulebase())
+    for name in "abcd":
+        rb.add(SecurityRule(name))
+    rb.add(NatRule("nat1"))
+    return fw, rb
+
+
+def test_rulebase_reorder():
+    fw, rb = _rulebase()
+
+    moves = rb.reorder(["b", "c", "a", "d"])
+
+    assert [(x[0].uid, x[1], x[2]) for x in moves] == [("a", "after", "c")]
+    assert [x.uid for x in rb.children] == ["b", "c", "a", "d", "nat1"]
+    fw.xapi.move.assert_not_called()
+    assert fw.xapi.multi_config.call_count == 1
+    elm = ET.fromstring(fw.xapi.multi_config.call_args[1]["element"])
+    assert [x.attrib for x in elm] == [
+        {
+            "id": "1",
+            "xpath": rb.children[2].xpath(),
+            "where": "after",
+            "dst": "c",
+        }
+    ]
+
+
+def test_rulebase_reorder_without_update():
+    fw, rb = _rulebase()
+
+    moves = rb.reorder(["d", "a", "b", "c"], update=False)
+
+    assert [(x[0].uid, x[1], x[2]) for x in moves] == [("d", "top", None)]
+    assert [x.uid for x in rb.children] == ["d", "a", "b", "c", "nat1"]
+    fw.xapi.multi_config.assert_not_called()
+
+
+def test_rulebase_reorder_requires_all_rules():
+    fw, rb = _rulebase()
+
+    with pytest.raises(ValueError):
+        rb.reorder(["a", "b", "c"])
@@ -0,0 +1,563 @@
+from unittest import mock
+
+import pytest
+
+from panos.device import Vsys
+from panos.firewall import Firewall
+from panos.objects import (
+    AddressGroup,
+    AddressObject,
+    ApplicationGroup,
+    ApplicationObject,
+    ServiceGroup,
+    ServiceObject,
+)
+from panos.panorama import DeviceGroup, Panorama
+from panos.policies import NatRule, PostRulebase, PreRulebase, Rulebase, SecurityRule
+from panos.policymatch import (
+    AddressIndex,
+    AddressSet,
+    CompiledSecurityRule,
+    NatPolicyMatcher,
+    SecurityPolicyMatcher,
+    ip_to_int,
+    parse_address,
+    parse_ports,
+)
+
+
+def _names(ans):
+    return [x["name"] for x in ans]
+
+
+@pytest.mark.parametrize(
+    "value, inside, outside",
+    [
+        ("10.0.0.0/8", ["10.0.0.0", "10.255.255.255"], ["11.0.0.0", "9.255.255.255"]),
+        ("10.1.1.1", ["10.1.1.1"], ["10.1.1.2"]),
+        ("10.0.0.5-10.0.0.9", ["10.0.0.5", "10.0.0.9"], ["10.0.0.4", "10.0.0.10"]),
+        ("10.0.0.1/0.0.255.0", ["10.0.0.1", "10.0.7.1"], ["10.0.0.2", "10.1.0.1"]),
+        ("2001:db8::/32", ["2001:db8::1"], ["2001:db9::", "10.0.0.1"]),
+    ],
+)
+def test_parse_address(value, inside, outside):
+    ans = parse_address(value)
+
+    for ip in inside:
+        assert ip_to_int(ip) in ans
+    for ip in outside:
+        assert ip_to_int(ip) not in ans
+
+
+def test_parse_address_fqdn_is_unresolved():
+    assert parse_address("www.example.com", "fqdn") is None
+    assert parse_address("www.example.com") is None
+
+
+def test_ipv4_and_ipv6_do_not_overlap():
+    ans = parse_address("0.0.0.0/0")
+
+    assert ip_to_int("::1") not in ans
+    assert ip_to_int("1.2.3.4") in ans
+
+
+def test_parse_ports_merges_intervals():
+    assert parse_ports("443,80,81-90,85-100,dynamic") == [(80, 100), (443, 443)]
+
+
+def test_address_set_union():
+    ans = AddressSet.union(
+        [parse_address("10.0.0.0/25"), parse_address("10.0.0.128/25")]
+    )
+
+    assert ans.intervals == parse_address("10.0.0.0/24").intervals
+
+
+def _firewall():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw._version_info = (10, 1, 0)
+    fw.add(AddressObject("web", "10.1.1.0/24"))
+    fw.add(AddressObject("db", "10.2.2.10"))
+    fw.add(AddressObject("ext", "www.example.com", type="fqdn"))
+    fw.add(AddressGroup("servers", static_value=["web", "db"]))
+    fw.add(AddressGroup("loop1", static_value=["loop2", "db"]))
+    fw.add(AddressGroup("loop2", static_value=["loop1"]))
+    fw.add(ServiceObject("tcp-8443", "tcp", destination_port="8443"))
+    fw.add(ServiceObject("dns", "udp", destination_port="53"))
+    fw.add(ServiceGroup("svc-grp", ["tcp-8443", "dns"]))
+    fw.add(ApplicationObject("custom-app", default_port=["tcp/9000-9010"]))
+    fw.add(ApplicationGroup("apps", ["ssl", "web-browsing"]))
+    return fw
+
+
+def _matcher(*rules):
+    fw = _firewall()
+    rb = fw.add(Rulebase())
+    for rule in rules:
+        rb.add(rule)
+    return SecurityPolicyMatcher.from_tree(fw)
+
+
+def test_first_match_wins():
+    m = _matcher(
+        SecurityRule(
+            "block-db",
+            fromzone=["trust"],
+            tozone=["dmz"],
+            destination=["db"],
+            action="deny",
+        ),
+        SecurityRule(
+            "allow-servers",
+            fromzone=["trust"],
+            tozone=["dmz"],
+            destination=["servers"],
+            action="allow",
+        ),
+    )
+
+    ans = m.test_security_policy_match(
+        "192.168.1.1", "10.2.2.10", 6, port=22, from_zone="trust", to_zone="dmz"
+    )
+    assert ans == [{"name": "block-db", "index": 1, "action": "deny"}]
+
+    ans = m.test_security_policy_match(
+        "192.168.1.1", "10.1.1.7", 6, port=22, from_zone="trust", to_zone="dmz"
+    )
+    assert ans == [{"name": "allow-servers", "index": 2, "action": "allow"}]
+
+
+def test_show_all_stops_at_first_allow():
+    m = _matcher(
+        SecurityRule("r1", action="deny"),
+        SecurityRule("r2", action="drop"),
+        SecurityRule("r3", action="allow"),
+        SecurityRule("r4", action="allow"),
+    )
+
+    ans = m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, show_all=True)
+
+    assert _names(ans) == ["r1", "r2", "r3"]
+
+
+def test_disabled_rule_keeps_index():
+    m = _matcher(
+        SecurityRule("r1", disabled=True, action="deny"),
+        SecurityRule("r2", action="allow"),
+    )
+
+    ans = m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6)
+
+    assert ans == [{"name": "r2", "index": 2, "action": "allow"}]
+
+
+def test_default_rules():
+    m = _matcher(SecurityRule("r1", fromzone=["a"], tozone=["b"], action="allow"))
+
+    ans = m.test_security_policy_match(
+        "1.1.1.1", "2.2.2.2", 6, from_zone="a", to_zone="a"
+    )
+    assert ans == [{"name": "intrazone-default", "index": 2, "action": "allow"}]
+
+    ans = m.test_security_policy_match(
+        "1.1.1.1", "2.2.2.2", 6, from_zone="b", to_zone="a"
+    )
+    assert ans == [{"name": "interzone-default", "index": 3, "action": "deny"}]
+
+    assert m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, from_zone="b") == []
+
+
+def test_rule_type():
+    m = _matcher(
+        SecurityRule("intra", type="intrazone", action="allow"),
+        SecurityRule("inter", type="interzone", action="deny"),
+    )
+
+    ans = m.test_security_policy_match(
+        "1.1.1.1", "2.2.2.2", 6, from_zone="a", to_zone="a"
+    )
+    assert _names(ans) == ["intra"]
+
+    ans = m.test_security_policy_match(
+        "1.1.1.1", "2.2.2.2", 6, from_zone="a", to_zone="b"
+    )
+    assert _names(ans) == ["inter"]
+
+
+def test_negate_source():
+    m = _matcher(SecurityRule("r1", source=["web"], negate_source=True))
+
+    assert _names(m.test_security_policy_match("10.9.9.9", "2.2.2.2", 6)) == ["r1"]
+    assert m.test_security_policy_match("10.1.1.9", "2.2.2.2", 6) == []
+
+
+def test_address_group_loop_and_unresolved():
+    m = _matcher(SecurityRule("r1", destination=["loop1", "ext"]))
+
+    assert _names(m.test_security_policy_match("1.1.1.1", "10.2.2.10", 6)) == ["r1"]
+    assert m.test_security_policy_match("1.1.1.1", "10.2.2.11", 6) == []
+    assert m.unresolved == set(["ext"])
+
+
+def test_services():
+    m = _matcher(
+        SecurityRule("http", service=["service-http"]),
+        SecurityRule("grp", service=["svc-grp"]),
+    )
+
+    assert _names(m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, port=8080)) == [
+        "http"
+    ]
+    assert _names(m.test_security_policy_match("1.1.1.1", "2.2.2.2", 17, port=53)) == [
+        "grp"
+    ]
+    assert m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, port=53) == []
+    assert _names(m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6)) == ["http"]
+
+
+def test_application_default():
+    m = _matcher(
+        SecurityRule(
+            "custom",
+            application=["custom-app"],
+            service=["application-default"],
+        ),
+        SecurityRule("group", application=["apps"], service="application-default"),
+    )
+
+    assert _names(
+        m.test_security_policy_match(
+            "1.1.1.1", "2.2.2.2", 6, application="custom-app", port=9005
+        )
+    ) == ["custom"]
+    assert (
+        m.test_security_policy_match(
+            "1.1.1.1", "2.2.2.2", 6, application="custom-app", port=80
+        )
+        == []
+    )
+    # Default ports of "ssl" are unknown offline, so the port can't rule it out.
+    assert _names(
+        m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, application="ssl", port=1)
+    ) == ["group"]
+
+
+def test_users():
+    m = _matcher(
+        SecurityRule("alice", source_user=["alice"]),
+        SecurityRule("known", source_user=["known-user"]),
+        SecurityRule("unknown", source_user=["unknown"]),
+    )
+
+    assert _names(
+        m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, user="alice")
+    ) == ["alice"]
+    assert _names(
+        m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, user="bob")
+    ) == ["known"]
+    assert _names(m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6)) == ["unknown"]
+
+
+def test_match_many_agrees_with_single():
+    m = _matcher(
+        SecurityRule("r1", fromzone=["a"], application=["ssl"], action="deny"),
+        SecurityRule("r2", fromzone=["a"], tozone=["b"], action="allow"),
+        SecurityRule("r3", source=["web"], action="allow"),
+    )
+    flows = [
+        dict(source="10.1.1.1", destination="8.8.8.8", protocol=6, from_zone="a"),
+        dict(
+            source="1.1.1.1",
+            destination="8.8.8.8",
+            protocol=6,
+            application="ssl",
+            from_zone="a",
+            to_zone="b",
+        ),
+        dict(
+            source="10.1.1.1",
+            destination="8.8.8.8",
+            protocol=6,
+            from_zone="c",
+            to_zone="d",
+        ),
+    ]
+
+    ans = m.match_many(flows, show_all=True)
+
+    assert ans == [m.test_security_policy_match(show_all=True, **x) for x in flows]
+    assert [_names(x) for x in ans] == [["r1", "r2"], ["r1", "r2"], ["r3"]]
+
+
+def test_match_many_groups_flows_by_criteria():
+    m = _matcher(
+        SecurityRule("r1", source=["web"], service=["tcp-8443"], action="deny"),
+        SecurityRule("r2", fromzone=["a"], action="allow"),
+    )
+    flows = [
+        dict(source=x, destination="8.8.8.8", protocol=6, port=8443, from_zone="a")
+        for x in ("10.1.1.1", "1.1.1.1", "10.1.1.2", "1.1.1.1")
+    ]
+    calls = []
+    original = CompiledSecurityRule.matches_criteria
+
+    def matches_criteria(rule, *args, **kwargs):
+        calls.append(rule.name)
+        return original(rule, *args, **kwargs)
+
+    with mock.patch.object(CompiledSecurityRule, "matches_criteria", matches_criteria):
+        ans = m.match_many(flows)
+
+    assert [_names(x) for x in ans] == [["r1"], ["r2"], ["r1"], ["r2"]]
+    assert calls == ["r1", "r2"]
+    ans[1][0]["name"] = "changed"
+    assert _names(ans[3]) == ["r2"]
+
+
+def test_vsys_scopes():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(AddressObject("host", "10.0.0.1"))
+    vsys = fw.add(Vsys("vsys2"))
+    vsys.add(AddressObject("host", "10.0.0.2"))
+    rb = vsys.add(Rulebase())
+    rb.add(SecurityRule("r1", destination=["host"]))
+
+    m = SecurityPolicyMatcher.from_tree(vsys)
+
+    assert _names(m.test_security_policy_match("1.1.1.1", "10.0.0.2", 6)) == ["r1"]
+    assert m.test_security_policy_match("1.1.1.1", "10.0.0.1", 6) == []
+
+
+def test_device_group_rule_order():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano.add(PreRulebase()).add(SecurityRule("shared-pre"))
+    pano.add(PostRulebase()).add(SecurityRule("shared-post"))
+    parent = pano.add(DeviceGroup("parent"))
+    parent.add(PreRulebase()).add(SecurityRule("parent-pre"))
+    parent.add(PostRulebase()).add(SecurityRule("parent-post"))
+    child = pano.add(DeviceGroup("child"))
+    child.opstate.dg_hierarchy.parent = "parent"
+    child.add(PreRulebase()).add(SecurityRule("child-pre"))
+    child.add(PostRulebase()).add(SecurityRule("child-post"))
+
+    m = SecurityPolicyMatcher.from_tree(child)
+    ans = m.test_security_policy_match("1.1.1.1", "2.2.2.2", 6, show_all=True)
+
+    assert _names(ans) == [
+        "shared-pre",
+        "parent-pre",
+        "child-pre",
+        "child-post",
+        "parent-post",
+        "shared-post",
+    ]
+    assert [x["index"] for x in ans] == [1, 2, 3, 4, 5, 6]
+
+
+def _index_tree():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano.add(AddressObject("shared-net", "10.0.0.0/8"))
+    pano.add(AddressObject("web", "192.168.0.1"))
+    pano.add(AddressObject("v6", "2001:db8::/64"))
+    pano.add(AddressGroup("shared-grp", static_value=["web"]))
+    dg = pano.add(DeviceGroup("dg"))
+    dg.add(AddressObject("web", "10.1.1.1"))
+    dg.add(AddressObject("range", "10.1.1.0-10.1.1.9", type="ip-range"))
+    dg.add(AddressObject("wild", "10.0.0.1/0.255.0.0", type="ip-wildcard"))
+    dg.add(AddressGroup("inner", static_value=["range"]))
+    dg.add(AddressGroup("outer", static_value=["inner", "v6"]))
+    return dg
+
+
+def test_address_index_containing():
+    index = AddressIndex.from_tree(_index_tree())
+
+    assert index.containing("10.1.1.1") == [
+        "inner",
+        "outer",
+        "range",
+        "shared-grp",
+        "shared-net",
+        "web",
+    ]
+    assert index.containing("10.1.1.10") == ["shared-net"]
+    assert index.containing("10.7.0.1") == ["shared-net", "wild"]
+    assert index.containing("192.168.0.1") == []
+    assert index.containing("2001:db8::5") == ["outer", "v6"]
+    assert index.containing(ip_to_int("11.0.0.0")) == []
+
+
+def test_address_index_containing_many_agrees_with_containing():
+    index = AddressIndex.from_tree(_index_tree())
+    addresses = [
+        "10.1.1.9",
+        "0.0.0.0",
+        "2001:db8::1",
+        "10.7.0.1",
+        "10.1.1.0",
+        ip_to_int("10.1.1.5"),
+        "255.255.255.255",
+    ]
+
+    ans = index.containing_many(addresses)
+
+    assert ans == [index.containing(x) for x in addresses]
+
+
+def test_address_index_overlapping():
+    index = AddressIndex.from_tree(_index_tree())
+
+    assert index.overlapping("10.1.1.8/29") == [
+        "inner",
+        "outer",
+        "range",
+        "shared-net",
+    ]
+    assert index.overlapping("2001:db8::/32") == ["outer", "v6"]
+    assert index.overlapping("172.16.0.0/12") == []
+
+
+def test_address_index_group_loop():
+    index = AddressIndex.from_tree(_firewall())
+
+    assert index.containing("10.2.2.10") == ["db", "loop1", "loop2", "servers"]
+    assert index.unresolved == set(["ext"])
+
+
+def _nat_matcher():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(AddressObject("inside", "10.0.0.0/8"))
+    fw.add(AddressObject("servers", "192.168.10.0/24"))
+    fw.add(AddressObject("public-servers", "203.0.113.0/24"))
+    fw.add(AddressObject("pool", "198.51.100.10-198.51.100.13", type="ip-range"))
+    fw.add(AddressObject("web-public", "203.0.113.80"))
+    fw.add(AddressObject("web-private", "192.168.10.80"))
+    fw.add(ServiceObject("tcp-443", "tcp", destination_port="443"))
+    rb = fw.add(Rulebase())
+    rb.add(
+        NatRule(
+            "dnat-web",
+            fromzone=["untrust"],
+            tozone=["untrust"],
+            destination=["web-public"],
+            service="tcp-443",
+            destination_translated_address="web-private",
+            destination_translated_port=8443,
+        )
+    )
+    rb.add(
+        NatRule(
+            "static",
+            fromzone=["dmz"],
+            tozone=["untrust"],
+            source=["servers"],
+            source_translation_type="static-ip",
+            source_translation_static_translated_address="public-servers",
+            source_translation_static_bi_directional=True,
+        )
+    )
+    rb.add(NatRule("off", disabled=True, fromzone=["trust"]))
+    rb.add(
+        NatRule(
+            "dipp",
+            fromzone=["trust"],
+            tozone=["untrust"],
+            source=["inside"],
+            source_translation_type="dynamic-ip-and-port",
+            source_translation_address_type="translated-address",
+            source_translation_translated_addresses=["pool"],
+        )
+    )
+    rb.add(
+        NatRule(
+            "iface",
+            fromzone=["guest"],
+            to_interface="ethernet1/1",
+            source_translation_type="dynamic-ip-and-port",
+            source_translation_address_type="interface-address",
+            source_translation_interface="ethernet1/1",
+            source_translation_ip_address="198.51.100.1/24",
+        )
+    )
+    return NatPolicyMatcher.from_tree(fw)
+
+
+def test_nat_dynamic_ip_and_port():
+    m = _nat_matcher()
+
+    ans = m.test_nat_policy_match(
+        "10.1.2.3", "8.8.8.8", 6, port=443, from_zone="trust", to_zone="untrust"
+    )
+
+    assert ans["name"] == "dipp"
+    assert ans["index"] == 4
+    assert ans["destination_translation"] is None
+    src = ans["source_translation"]
+    assert src["type"] == "dynamic-ip-and-port"
+    assert src["pool"] == ["198.51.100.10-198.51.100.13"]
+    assert src["pool_size"] == 4
+    assert "address" not in src
+
+
+def test_nat_interface_address():
+    m = _nat_matcher()
+
+    ans = m.test_nat_policy_match(
+        "172.16.0.5", "8.8.8.8", 17, from_zone="guest", to_interface="ethernet1/1"
+    )
+    assert ans["name"] == "iface"
+    assert ans["source_translation"]["interface"] == "ethernet1/1"
+    assert ans["source_translation"]["interface_ip"] == "198.51.100.1/24"
+
+    ans = m.test_nat_policy_match(
+        "172.16.0.5", "8.8.8.8", 17, from_zone="guest", to_interface="ethernet1/2"
+    )
+    assert ans is None
+
+
+def test_nat_static_source():
+    m = _nat_matcher()
+
+    ans = m.test_nat_policy_match(
+        "192.168.10.25", "8.8.8.8", 6, from_zone="dmz", to_zone="untrust"
+    )
+
+    assert ans["name"] == "static"
+    assert ans["source_translation"]["address"] == "203.0.113.25"
+    assert ans["source_translation"]["bi_directional"]
+
+
+def test_nat_destination_translation():
+    m = _nat_matcher()
+
+    ans = m.test_nat_policy_match(
+        "1.2.3.4", "203.0.113.80", 6, port=443, from_zone="untrust", to_zone="untrust"
+    )
+    assert ans["name"] == "dnat-web"
+    assert ans["source_translation"] is None
+    assert ans["destination_translation"]["address"] == "192.168.10.80"
+    assert ans["destination_translation"]["port"] == 8443
+
+    ans = m.test_nat_policy_match(
+        "1.2.3.4", "203.0.113.80", 6, port=80, from_zone="untrust", to_zone="untrust"
+    )
+    assert ans is None
+
+
+def test_nat_match_many():
+    m = _nat_matcher()
+    flows = [
+        dict(source="10.0.0.1", destination="8.8.8.8", protocol=6, from_zone="trust"),
+        dict(source="11.0.0.1", destination="8.8.8.8", protocol=6, from_zone="trust"),
+        dict(
+            source="172.16.0.1",
+            destination="8.8.8.8",
+            protocol=6,
+            from_zone="guest",
+            to_interface="ethernet1/1",
+        ),
+    ]
+
+    ans = m.match_many(flows)
+
+    assert [x and x["name"] for x in ans] == ["dipp", None, "iface"]
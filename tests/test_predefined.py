@@ -12,6 +12,7 @@ from panos.objects import ApplicationContainer
 from panos.objects import ApplicationObject
 from panos.objects import ServiceObject
 from panos.objects import Tag
+from panos.predefined import Predefined
 
 PREDEFINED_CONFIG = {
     ApplicationContainer: {
@@ -269,3 +270,127 @@ def test_refreshall_invokes_all_refresh_methods():
 
     for spec in PREDEFINED_CONFIG.values():
         assert len(getattr(fw.predefined, spec["var"])) == 0
+
+
+def _cached_fw(cache_dir, *args):
+    fw = _fw(*args)
+    fw.platform = "PA-VM"
+    fw.version = "10.1.0"
+    fw.content_version = "8000-1234"
+    fw.predefined.cache_dir = str(cache_dir)
+    fw.xapi.get.side_effect = lambda xpath, **kwargs: (
+        fw.xapi.get.return_value if "service" in xpath else object_not_found()
+    )
+    return fw
+
+
+def test_refreshall_cache_shared_and_persisted(tmp_path):
+    objs = PREDEFINED_TEST_DATA[2][2:]
+    shared = Predefined._shared_catalogs
+    Predefined._shared_catalogs = {}
+    try:
+        fw1 = _cached_fw(tmp_path, *objs)
+        fw1.predefined.refreshall()
+        assert fw1.xapi.get.call_count == 3
+        assert len(list(tmp_path.iterdir())) == 1
+
+        # Same content version in the same process: no API calls.
+        fw2 = _cached_fw(tmp_path, *objs)
+        fw2.predefined.refreshall()
+        assert not fw2.xapi.get.called
+        assert fw2.predefined.service_objects["foo"] is (
+            fw1.predefined.service_objects["foo"]
+        )
+        assert fw2.predefined.service_objects is not fw1.predefined.service_objects
+
+        # New process: loaded from disk.
+        Predefined._shared_catalogs = {}
+        fw3 = _cached_fw(tmp_path, *objs)
+        fw3.predefined.refreshall()
+        assert not fw3.xapi.get.called
+        for x in objs:
+            assert fw3.predefined.service_objects[x.uid].equal(x)
+
+        # Different content version: retrieved from the device again.
+        fw4 = _cached_fw(tmp_path, *objs)
+        fw4.content_version = "8001-1240"
+        fw4.predefined.refreshall()
+        assert fw4.xapi.get.call_count == 3
+        assert len(list(tmp_path.iterdir())) == 2
+    finally:
+        Predefined._shared_catalogs = shared
+
+
+def test_query_applications():
+    fw = _fw()
+    apps = [
+        ApplicationObject(
+            name="web",
+            category="general-internet",
+            risk=4,
+            default_type="port",
+            default_port=["tcp/80,443"],
+            tag=["t1"],
+        ),
+        ApplicationObject(
+            name="tunnel",
+            category="networking",
+            risk=5,
+            default_type="port",
+            default_port=["tcp/1000-2000", "udp/dynamic"],
+            tunnel_other_application=True,
+            tunnel_applications=["web", "ssl"],
+        ),
+        ApplicationObject(name="low", category="networking", risk=1),
+    ]
+    for x in apps:
+        fw.predefined.application_objects[x.uid] = x
+    pd = fw.predefined
+
+    def names(**kwargs):
+        return [x.uid for x in pd.query_applications(**kwargs)]
+
+    assert names(category="networking") == ["low", "tunnel"]
+    assert names(category="networking", risk__gte=4) == ["tunnel"]
+    assert names(risk=[1, 4]) == ["low", "web"]
+    assert names(tunnel_applications="web") == ["tunnel"]
+    assert names(tunnel_other_application=True) == ["tunnel"]
+    assert names(port="tcp/443") == ["web"]
+    assert names(port="tcp/1500") == ["tunnel"]
+    assert names(port="udp/1500") == []
+    assert names() == ["low", "tunnel", "web"]
+    with pytest.raises(ValueError):
+        names(description="foo")
+
+    # The index follows changes to the applications.
+    extra = ApplicationObject(name="extra", category="networking", risk=5)
+    pd.application_objects[extra.uid] = extra
+    assert names(category="networking", risk__gt=4) == ["extra", "tunnel"]
+
+
+def test_applications_bulk_refreshes_missing_names():
+    objs = [ApplicationObject(name="app{0}".format(x), risk=1) for x in range(250)]
+    fw = _fw(*objs)
+    known = ApplicationObject(name="known")
+    fw.predefined.application_objects[known.uid] = known
+
+    ans = fw.predefined.applications([x.uid for x in objs] + ["known"])
+
+    assert len(ans) == 251
+    assert fw.xapi.get.call_count == 3
+    xpaths = [x[0][0] for x in fw.xapi.get.call_args_list]
+    assert [len(x.split(" | ")) for x in xpaths] == [100, 100, 50]
+    assert all("'known'" not in x for x in xpaths)
+    assert "entry[@name='app0']" in xpaths[0]
+
+
+def test_services_and_tags_bulk_refresh():
+    fw = _fw()
+
+    fw.predefined.services(["a", "b", "c"])
+    fw.predefined.tags(["a", "b"])
+
+    assert fw.xapi.get.call_count == 2
+    xpaths = [x[0][0] for x in fw.xapi.get.call_args_list]
+    assert len(xpaths[0].split(" | ")) == 3
+    assert len(xpaths[1].split(" | ")) == 2
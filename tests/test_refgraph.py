@@ -0,0 +1,164 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import pytest
+
+from panos.errors import PanObjectError
+from panos.firewall import Firewall
+from panos.network import EthernetInterface, Layer3Subinterface, VirtualRouter, Zone
+from panos.objects import AddressGroup, AddressObject, Tag
+from panos.panorama import DeviceGroup, Panorama
+from panos.policies import PreRulebase, Rulebase, SecurityRule
+from panos.refgraph import ReferenceGraph
+
+
+def _firewall():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(Tag("prod"))
+    fw.add(Tag("unused-tag"))
+    fw.add(AddressObject("web", "10.1.1.1", tag=["prod"]))
+    fw.add(AddressObject("db", "10.1.1.2"))
+    fw.add(AddressObject("unused", "10.1.1.3"))
+    fw.add(AddressGroup("servers", static_value=["web", "db"]))
+    eth = fw.add(EthernetInterface("ethernet1/1", mode="layer3"))
+    sub = eth.add(Layer3Subinterface("ethernet1/1.5", 5))
+    fw.add(Zone("trust", mode="layer3", interface=["ethernet1/1", "ethernet1/1.5"]))
+    fw.add(VirtualRouter("default", interface=["ethernet1/1.5"]))
+    rb = fw.add(Rulebase())
+    rb.add(SecurityRule("r1", fromzone=["trust"], destination=["servers"]))
+    rb.add(SecurityRule("r2", source=["web"], destination=["any"]))
+    return fw, eth, sub
+
+
+def test_referrers():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+
+    web = fw.find("web", AddressObject)
+    assert sorted(x.uid for x in graph.referrers(web)) == ["r2", "servers"]
+    assert [x.uid for x in graph.referrers(fw.find("prod", Tag))] == ["web"]
+    assert [x.uid for x in graph.referrers(eth)] == ["trust"]
+    assert sorted(x.uid for x in graph.referrers(sub)) == ["default", "trust"]
+    assert [x.uid for x in graph.referrers(fw.find("trust", Zone))] == ["r1"]
+
+
+def test_references():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+
+    ans = graph.references(fw.find("servers", AddressGroup))
+
+    assert sorted(x.uid for x in ans) == ["db", "web"]
+
+
+def test_unreferenced():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+
+    assert [x.uid for x in graph.unreferenced(AddressObject)] == ["unused"]
+    assert [x.uid for x in graph.unreferenced(Tag)] == ["unused-tag"]
+    assert [x.uid for x in graph.unreferenced(AddressGroup)] == []
+
+
+def test_incremental_update():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+    group = fw.find("servers", AddressGroup)
+    db = fw.find("db", AddressObject)
+
+    group.static_value = ["web"]
+    graph.update(group)
+    assert sorted(x.uid for x in graph.unreferenced(AddressObject)) == ["db", "unused"]
+
+    rule = fw.findall(Rulebase)[0].find("r1", SecurityRule)
+    rule.parent.remove(rule)
+    graph.remove(rule)
+    assert [x.uid for x in graph.unreferenced(AddressGroup)] == ["servers"]
+
+    new = fw.findall(Rulebase)[0].add(SecurityRule("r3", destination=["db"]))
+    graph.add(new)
+    assert graph.referrers(db) == [new]
+
+
+def test_remove_references():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+    web = fw.find("web", AddressObject)
+
+    rule = fw.findall(Rulebase)[0].find("r2", SecurityRule)
+    rule.source = ["web", "db"]
+    graph.update(rule)
+
+    changed = graph.remove_references(web)
+
+    assert sorted(x.uid for x in changed) == ["r2", "servers"]
+    assert fw.find("servers", AddressGroup).static_value == ["db"]
+    assert rule.source == ["db"]
+    assert graph.referrers(web) == []
+
+
+def test_remove_references_refuses_to_empty_rule_member():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+    web = fw.find("web", AddressObject)
+
+    with pytest.raises(PanObjectError, match=r"r2 \(source\)"):
+        graph.remove_references(web)
+
+    assert fw.findall(Rulebase)[0].find("r2", SecurityRule).source == ["web"]
+    assert fw.find("servers", AddressGroup).static_value == ["web", "db"]
+    assert sorted(x.uid for x in graph.referrers(web)) == ["r2", "servers"]
+
+
+def test_device_group_scopes():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    shared = pano.add(AddressObject("web", "10.0.0.1"))
+    parent = pano.add(DeviceGroup("parent"))
+    parent_web = parent.add(AddressObject("web", "10.0.0.2"))
+    child = pano.add(DeviceGroup("child"))
+    child.opstate.dg_hierarchy.parent = "parent"
+    other = pano.add(DeviceGroup("other"))
+    child_rule = child.add(PreRulebase()).add(SecurityRule("c", source=["web"]))
+    other_rule = other.add(PreRulebase()).add(SecurityRule("o", source=["web"]))
+
+    graph = ReferenceGraph(pano)
+
+    assert graph.referrers(parent_web) == [child_rule]
+    assert graph.referrers(shared) == [other_rule]
+
+
+def test_full_delete_with_graph():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+    zone = fw.find("trust", Zone)
+    vr = fw.find("default", VirtualRouter)
+    fw.findall = mock.Mock(side_effect=AssertionError("tree was scanned"))
+
+    with mock.patch.object(Layer3Subinterface, "set_zone") as set_zone:
+        with mock.patch.object(
+            Layer3Subinterface, "set_virtual_router"
+        ) as set_vr, mock.patch.object(Layer3Subinterface, "delete"):
+            with mock.patch.object(Zone, "update"), mock.patch.object(
+                VirtualRouter, "update"
+            ):
+                with mock.patch.object(Layer3Subinterface, "set_vlan"):
+                    sub.full_delete(graph=graph)
+
+    assert set_zone.called and set_vr.called
+    assert zone.interface == ["ethernet1/1"]
+    assert vr.interface == []
+    assert graph.referrers(sub) == []
+
+
+def test_full_delete_with_graph_and_refresh():
+    fw, eth, sub = _firewall()
+    graph = ReferenceGraph(fw)
+
+    with mock.patch.object(Layer3Subinterface, "set_zone") as set_zone:
+        with pytest.raises(ValueError):
+            sub.full_delete(refresh=True, graph=graph)
+
+    assert not set_zone.called
+    assert sorted(x.uid for x in graph.referrers(sub)) == ["default", "trust"]
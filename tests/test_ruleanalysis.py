@@ -0,0 +1,194 @@
+from panos.firewall import Firewall
+from panos.objects import AddressGroup, AddressObject, ServiceObject
+from panos.panorama import DeviceGroup, Panorama
+from panos.policies import NatRule, PostRulebase, PreRulebase, Rulebase, SecurityRule
+from panos.ruleanalysis import MERGEABLE, REDUNDANT, SHADOWED, RuleAnalyzer
+
+
+def _analyze(*rules):
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(AddressObject("net10", "10.0.0.0/8"))
+    fw.add(AddressObject("host1", "10.1.1.1"))
+    fw.add(AddressObject("host2", "10.1.1.2"))
+    fw.add(AddressObject("ext", "www.example.com", type="fqdn"))
+    fw.add(AddressGroup("hosts", static_value=["host1", "host2"]))
+    fw.add(ServiceObject("tcp-80", "tcp", destination_port="80"))
+    fw.add(ServiceObject("tcp-web", "tcp", destination_port="80,443"))
+    rb = fw.add(Rulebase())
+    for rule in rules:
+        rb.add(rule)
+    return [
+        (x.kind, x.rule.uid, [y.uid for y in x.related], x.dimension)
+        for x in RuleAnalyzer.from_tree(fw).analyze()
+    ]
+
+
+def test_shadowed_rule():
+    ans = _analyze(
+        SecurityRule("broad", destination=["net10"], action="deny"),
+        SecurityRule("narrow", destination=["hosts"], action="allow"),
+    )
+
+    assert ans == [(SHADOWED, "narrow", ["broad"], None)]
+
+
+def test_redundant_with_earlier_rule():
+    ans = _analyze(
+        SecurityRule("broad", fromzone=["a", "b"], service=["tcp-web"], action="allow"),
+        SecurityRule("narrow", fromzone=["a"], service=["tcp-80"], action="allow"),
+    )
+
+    assert ans == [(REDUNDANT, "narrow", ["broad"], None)]
+
+
+def test_redundant_with_later_rule():
+    ans = _analyze(
+        SecurityRule("narrow", destination=["host1"], action="allow"),
+        SecurityRule("other", destination=["host2"], action="deny"),
+        SecurityRule("broad", destination=["net10"], action="allow"),
+    )
+
+    assert ans == [(REDUNDANT, "narrow", ["broad"], None)]
+
+
+def test_identical_rules_keep_one():
+    ans = _analyze(
+        SecurityRule("a", destination=["host1"], action="allow"),
+        SecurityRule("other", destination=["host2"], action="deny"),
+        SecurityRule("b", destination=["host1"], action="allow"),
+    )
+
+    assert ans == [(REDUNDANT, "b", ["a"], None)]
+
+
+def test_not_redundant_with_conflict_in_between():
+    ans = _analyze(
+        SecurityRule("narrow", destination=["host1"], action="allow"),
+        SecurityRule("block", destination=["hosts"], action="deny"),
+        SecurityRule("broad", destination=["net10"], action="allow"),
+    )
+
+    assert ans == []
+
+
+def test_different_users_and_zones_are_not_covered():
+    ans = _analyze(
+        SecurityRule("r1", fromzone=["a"], source_user=["alice"], action="deny"),
+        SecurityRule("r2", fromzone=["a", "b"], source_user=["bob"], action="allow"),
+        SecurityRule("r3", source_user=["known-user"], action="deny"),
+        SecurityRule("r4", source_user=["carol"], action="allow"),
+    )
+
+    assert ans == [
+        (REDUNDANT, "r1", ["r3"], None),
+        (SHADOWED, "r4", ["r3"], None),
+    ]
+
+
+def test_negated_source():
+    ans = _analyze(
+        SecurityRule("r1", source=["host1"], negate_source=True, action="deny"),
+        SecurityRule("r2", source=["hosts"], negate_source=True, action="allow"),
+        SecurityRule("r3", source=["net10"], negate_source=True, action="allow"),
+    )
+
+    assert ans == [(SHADOWED, "r2", ["r1"], None), (SHADOWED, "r3", ["r1"], None)]
+
+
+def test_unresolved_rules_are_not_reported():
+    ans = _analyze(
+        SecurityRule("broad", action="deny"),
+        SecurityRule("fqdn", destination=["ext"], action="allow"),
+        SecurityRule("any", action="allow"),
+    )
+
+    assert ans == [(SHADOWED, "any", ["broad"], None)]
+
+
+def test_mergeable_rules():
+    ans = _analyze(
+        SecurityRule("h1", fromzone=["a"], destination=["host1"], action="allow"),
+        SecurityRule("h2", fromzone=["a"], destination=["host2"], action="allow"),
+        SecurityRule("b1", fromzone=["b"], destination=["host1"], action="deny"),
+        SecurityRule("h3", fromzone=["a"], destination=["10.9.9.9"], action="allow"),
+    )
+
+    assert ans == [(MERGEABLE, "h1", ["h2", "h3"], "destination")]
+
+
+def test_mergeable_blocked_by_conflict():
+    ans = _analyze(
+        SecurityRule("h1", destination=["host1"], action="allow"),
+        SecurityRule("block", destination=["hosts"], source=["net10"], action="deny"),
+        SecurityRule("h2", destination=["host2"], action="allow"),
+    )
+
+    assert ans == []
+
+
+def test_nat_rules():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(AddressObject("net10", "10.0.0.0/8"))
+    fw.add(AddressObject("host1", "10.1.1.1"))
+    rb = fw.add(Rulebase())
+    rb.add(NatRule("snat", fromzone=["a"], tozone=["b"], source=["net10"]))
+    rb.add(
+        NatRule(
+            "dnat",
+            fromzone=["a"],
+            tozone=["b"],
+            source=["host1"],
+            destination_translated_address="192.168.1.1",
+        )
+    )
+
+    ans = RuleAnalyzer.from_tree(fw, NatRule).analyze()
+
+    assert [(x.kind, x.rule.uid) for x in ans] == [(SHADOWED, "dnat")]
+
+
+def test_device_group_hierarchy():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano.add(PostRulebase()).add(SecurityRule("shared-deny", action="deny"))
+    parent = pano.add(DeviceGroup("parent"))
+    parent.add(PreRulebase()).add(SecurityRule("parent-allow", action="allow"))
+    child = pano.add(DeviceGroup("child"))
+    child.opstate.dg_hierarchy.parent = "parent"
+    child.add(PostRulebase()).add(
+        SecurityRule("child-post", fromzone=["a"], action="deny")
+    )
+
+    ans = RuleAnalyzer.from_tree(child).analyze()
+
+    assert [(x.kind, x.rule.uid, x.related[0].uid) for x in ans] == [
+        (SHADOWED, "child-post", "parent-allow"),
+        (SHADOWED, "shared-deny", "parent-allow"),
+    ]
+
+
+def test_order_by_rate():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw.add(AddressObject("host1", "10.1.1.1"))
+    fw.add(AddressObject("host2", "10.1.1.2"))
+    rb = fw.add(Rulebase())
+    rb.add(SecurityRule("cold", destination=["host1"], action="allow"))
+    rb.add(SecurityRule("off", disabled=True))
+    rb.add(SecurityRule("block", destination=["host1"], action="deny"))
+    rb.add(SecurityRule("warm", destination=["host2"], action="allow"))
+    rb.add(SecurityRule("hot", destination=["host1"], action="allow"))
+
+    ans = RuleAnalyzer.from_tree(fw).order_by_rate({"hot": 10, "warm": 5})
+
+    assert len(ans) == 1
+    assert ans[0][0] is rb
+    # "hot" can't move above "block", which handles its traffic differently.
+    assert [x.uid for x in ans[0][1]] == ["warm", "cold", "off", "block", "hot"]
+
+
+def test_unresolved_negated_rule_does_not_shadow():
+    ans = _analyze(
+        SecurityRule("not-ext", source=["ext"], negate_source=True, action="deny"),
+        SecurityRule("not-host", source=["host1"], negate_source=True, action="allow"),
+    )
+
+    assert ans == []
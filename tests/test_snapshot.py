@@ -0,0 +1,131 @@
+import io
+
+import pytest
+
+from panos import snapshot
+from panos.device import NTPServerPrimary, SystemSettings
+from panos.firewall import Firewall
+from panos.network import EthernetInterface, Layer3Subinterface
+from panos.objects import AddressObject
+from panos.panorama import DeviceGroup, Panorama
+from panos.policies import PreRulebase, Rulebase, SecurityRule
+
+
+def _firewall():
+    fw = Firewall("127.0.0.1", "admin", "admin", "secret")
+    fw._set_version_and_version_info("10.1.0")
+    system = fw.add(SystemSettings(hostname="fw1"))
+    system.add(NTPServerPrimary("pool.ntp.org"))
+    fw.add(AddressObject("web", "10.1.1.1", description="web server"))
+    eth = fw.add(EthernetInterface("ethernet1/1", mode="layer3"))
+    eth.add(Layer3Subinterface("ethernet1/1.5", 5, ip=["10.5.5.1/24"]))
+    rb = fw.add(Rulebase())
+    rb.add(SecurityRule("r1", source=["web"], action="allow"))
+    rb.add(SecurityRule("r2", disabled=True, action="deny"))
+    return fw
+
+
+def _xml(node):
+    return [(type(x), x.element_str()) for x in node.children]
+
+
+def test_round_trip():
+    fw = _firewall()
+    data = snapshot.dumps(fw)
+
+    new = Firewall("127.0.0.1", "admin", "admin", "secret")
+    new.add(AddressObject("stale"))
+    children = snapshot.loads(data, new)
+
+    assert children == new.children
+    assert _xml(new) == _xml(fw)
+    rule = new.find("r1", recursive=True)
+    assert rule.source == ["web"]
+    assert rule.parent.parent is new
+    assert new.find("ethernet1/1").children[0].ip == ["10.5.5.1/24"]
+    assert new.findall(SystemSettings)[0].children[0].address == "pool.ntp.org"
+    assert new.version == "10.1.0"
+
+
+def test_loaded_objects_are_independent():
+    fw = _firewall()
+    new = Firewall()
+    snapshot.loads(snapshot.dumps(fw), new)
+
+    rules = new.find("", Rulebase).children
+    rules[0].action = "deny"
+    rules[0].source.append("other")
+
+    assert rules[1].action == "deny"
+    assert rules[1].source == ["any"]
+    assert fw.find("r1", recursive=True).action == "allow"
+    assert rules[0].opstate.hit_count.obj is rules[0]
+
+
+def test_does_not_change_known_version():
+    fw = _firewall()
+    new = Firewall()
+    new._set_version_and_version_info("11.0.0")
+
+    snapshot.loads(snapshot.dumps(fw), new)
+
+    assert new.version == "11.0.0"
+
+
+def test_file_and_metadata():
+    fw = _firewall()
+    f = io.BytesIO()
+    snapshot.dump(fw, f, metadata={"config_version": 42})
+
+    f.seek(0)
+    assert snapshot.load_metadata(f) == {"config_version": 42}
+    f.seek(0)
+    new = Firewall()
+    snapshot.load(f, new)
+    assert _xml(new) == _xml(fw)
+
+
+def test_file_and_bytes_are_the_same_format():
+    fw = _firewall()
+    f = io.BytesIO()
+    snapshot.dump(fw, f, metadata={"config_version": 42})
+
+    new = Firewall()
+    snapshot.loads(f.getvalue(), new)
+    assert _xml(new) == _xml(fw)
+
+    f = io.BytesIO(snapshot.dumps(fw, metadata={"config_version": 42}))
+    assert snapshot.load_metadata(f) == {"config_version": 42}
+    f.seek(0)
+    new = Firewall()
+    snapshot.load(f, new)
+    assert _xml(new) == _xml(fw)
+
+
+def test_panorama():
+    pano = Panorama("127.0.0.1", "admin", "admin", "secret")
+    pano._set_version_and_version_info("10.2.0")
+    pano.add(Firewall(serial="0001", vsys="vsys2"))
+    dg = pano.add(DeviceGroup("dg1", tag=["prod"]))
+    member = dg.add(Firewall(serial="0001", vsys="vsys2"))
+    member._set_version_and_version_info("10.1.3")
+    dg.add(PreRulebase()).add(SecurityRule("allow-web", action="allow"))
+
+    new = Panorama("127.0.0.1")
+    snapshot.loads(snapshot.dumps(pano), new)
+
+    fw = new.find("dg1").children[0]
+    assert (fw.serial, fw.vsys, fw.version) == ("0001", "vsys2", "10.1.3")
+    assert fw._api_password is None
+    assert new.find("dg1").tag == ["prod"]
+    assert new.find("allow-web", recursive=True).action == "allow"
+
+
+def test_unsupported_format():
+    f = io.BytesIO(snapshot.dumps(_firewall()))
+    header = snapshot.pickle.load(f)
+    header["format"] = 99
+    data = snapshot.pickle.dumps(header) + f.read()
+
+    with pytest.raises(ValueError):
+        snapshot.loads(data, Firewall())
@@ -19,8 +19,10 @@ import sys
 import unittest
 import xml.etree.ElementTree as ET
 
+import panos.errors
 import panos.firewall
 import panos.panorama
+import panos.userid
 
 
 class TestUserId(unittest.TestCase):
@@ -157,6 +159,336 @@ class TestUserId(unittest.TestCase):
         self.assertEqual(names[0].text, evil)
         self.assertIsNone(parsed.find(".//evil"))
 
+    def _registered_ip_page(self, start, count):
+        entries = "".join(
+            '<entry ip="10.0.{0}.{1}"><tag><member>t{2}</member></tag></entry>'.format(
+                (start + x) // 256, (start + x) % 256, (start + x) % 3
+            )
+            for x in range(count)
+        )
+        return ET.fromstring(
+            "<response status='success'><result>{0}</result></response>".format(entries)
+        )
+
+    def _paged_registered_ip(self, total, cap=None):
+        def op(cmd=None, vsys=None, cmd_xml=False):
+            parsed = ET.fromstring(cmd)
+            limit = int(parsed.findtext("./object/registered-ip/limit"))
+            start = int(parsed.findtext("./object/registered-ip/start-point"))
+            count = max(0, min(limit, cap or limit, total - start + 1))
+            return self._registered_ip_page(start - 1, count)
+
+        return op
+
+    def test_iter_registered_ip_pages_with_page_size(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw._set_version_and_version_info("10.1.0")
+        fw.op = mock.Mock(side_effect=self._paged_registered_ip(25))
+
+        ans = list(fw.userid.iter_registered_ip(page_size=10))
+
+        self.assertEqual(len(ans), 25)
+        self.assertEqual(ans[0], ("10.0.0.0", ["t0"]))
+        self.assertEqual(fw.op.call_count, 4)
+        starts = [
+            ET.fromstring(x[1]["cmd"]).findtext("./object/registered-ip/start-point")
+            for x in fw.op.call_args_list
+        ]
+        self.assertEqual(starts, ["1", "11", "21", "26"])
+
+    def test_iter_registered_ip_serial_with_capped_pages(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw._set_version_and_version_info("10.1.0")
+        fw.op = mock.Mock(side_effect=self._paged_registered_ip(250, cap=40))
+
+        ans = list(fw.userid.iter_registered_ip(page_size=100))
+
+        self.assertEqual(len(ans), 250)
+        self.assertEqual(len(set(x[0] for x in ans)), 250)
+        starts = [
+            ET.fromstring(x[1]["cmd"]).findtext("./object/registered-ip/start-point")
+            for x in fw.op.call_args_list
+        ]
+        self.assertEqual(starts, ["1", "41", "81", "121", "161", "201", "241", "251"])
+
+    def test_get_registered_ip_parallel_matches_serial(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw._set_version_and_version_info("10.1.0")
+        fw.op = mock.Mock(side_effect=self._paged_registered_ip(1234))
+        xapi = mock.Mock()
+        xapi.op.side_effect = self._paged_registered_ip(1234)
+        fw.generate_xapi = mock.Mock(return_value=xapi)
+
+        serial = fw.userid.get_registered_ip(page_size=100, tags=["t1", "t2"])
+        parallel = list(
+            fw.userid.iter_registered_ip(
+                page_size=100, max_workers=4, tags=["t1", "t2"]
+            )
+        )
+
+        self.assertEqual(dict(parallel), serial)
+        self.assertEqual([x[0] for x in parallel], list(serial.keys()))
+        self.assertEqual(fw.op.call_count, 14)
+        self.assertTrue(xapi.op.call_count >= 13)
+
+    def test_iter_registered_ip_parallel_with_capped_pages(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw._set_version_and_version_info("10.1.0")
+        fw.op = mock.Mock(side_effect=self._paged_registered_ip(250, cap=40))
+        xapi = mock.Mock()
+        xapi.op.side_effect = self._paged_registered_ip(250, cap=40)
+        fw.generate_xapi = mock.Mock(return_value=xapi)
+
+        ans = list(fw.userid.iter_registered_ip(page_size=100, max_workers=4))
+
+        self.assertEqual(len(ans), 250)
+        self.assertEqual(ans[-1][0], "10.0.0.249")
+        self.assertEqual(len(set(x[0] for x in ans)), 250)
+        starts = [
+            ET.fromstring(x[1]["cmd"]).findtext("./object/registered-ip/start-point")
+            for x in fw.op.call_args_list
+        ]
+        self.assertEqual(starts, ["41", "81", "121", "161", "201", "241", "251"])
+
+    def test_iter_user_tags_pages(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        full = ET.fromstring(
+            "<response status='success'><result>"
+            "<entry user='u1'><tag><member>a</member></tag></entry>"
+            "<entry user='u2'><tag><member>b</member></tag></entry>"
+            "</result></response>"
+        )
+        short = ET.fromstring(
+            "<response status='success'><result>"
+            "<entry user='u3'><tag><member>c</member></tag></entry>"
+            "</result></response>"
+        )
+        empty = ET.fromstring("<response status='success'><result/></response>")
+        fw.op = mock.Mock(side_effect=[full, short, empty])
+
+        ans = list(fw.userid.iter_user_tags(page_size=2))
+
+        self.assertEqual(ans, [("u1", ["a"]), ("u2", ["b"]), ("u3", ["c"])])
+        starts = [
+            ET.fromstring(x[1]["cmd"]).findtext(
+                "./object/registered-user/all/start-point"
+            )
+            for x in fw.op.call_args_list
+        ]
+        self.assertEqual(starts, ["1", "3", "4"])
+
+    def test_shadow_expires_members_with_timeout(self):
+        shadow = panos.userid.RegisteredIpShadow()
+        shadow.register("10.1.1.1", "a", timeout=10, now=100)
+        shadow.register("10.1.1.1", "b", now=100)
+        shadow.register("10.1.1.2", "a", timeout=5, now=100)
+        # Re-registering extends the timeout.
+        shadow.register("10.1.1.2", "a", timeout=50, now=101)
+
+        self.assertEqual(
+            shadow.registered_ip(now=109),
+            {"10.1.1.1": ["a", "b"], "10.1.1.2": ["a"]},
+        )
+        self.assertEqual(
+            shadow.registered_ip(now=120), {"10.1.1.1": ["b"], "10.1.1.2": ["a"]}
+        )
+        self.assertEqual(shadow.registered_ip(now=200), {"10.1.1.1": ["b"]})
+
+    def test_audit_registered_ip_uses_shadow(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw.xapi
+        fw._xapi_private.user_id = mock.Mock()
+        fw.userid.shadow = panos.userid.RegisteredIpShadow(reconcile_interval=3600)
+        fw.userid.get_registered_ip = mock.Mock(return_value={"10.1.1.1": ["old"]})
+
+        fw.userid.audit_registered_ip({"10.1.1.1": ("new",), "10.1.1.2": ("x",)})
+        fw.userid.audit_registered_ip({"10.1.1.1": ("new",), "10.1.1.2": ("x",)})
+
+        fw.userid.get_registered_ip.assert_called_once_with()
+        self.assertEqual(fw._xapi_private.user_id.call_count, 1)
+        self.assertEqual(
+            fw.userid.shadow.registered_ip(),
+            {"10.1.1.1": ["new"], "10.1.1.2": ["x"]},
+        )
+
+    def test_audit_registered_ip_for_tag_reconciles_single_tag(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw.xapi
+        fw._xapi_private.user_id = mock.Mock()
+        fw.userid.shadow = panos.userid.RegisteredIpShadow()
+        fw.userid.shadow.register("10.1.1.9", "other")
+        fw.userid.get_registered_ip = mock.Mock(return_value={"10.1.1.1": ["t"]})
+
+        fw.userid.audit_registered_ip_for_tag("t", ["10.1.1.2"])
+
+        fw.userid.get_registered_ip.assert_called_once_with(tags="t", prefix="")
+        self.assertTrue(fw.userid.shadow.needs_reconcile())
+        self.assertEqual(
+            fw.userid.shadow.registered_ip(),
+            {"10.1.1.2": ["t"], "10.1.1.9": ["other"]},
+        )
+
+    def test_audit_registered_ip_for_tag_reuses_reconciled_tag(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw.xapi
+        fw._xapi_private.user_id = mock.Mock()
+        fw.userid.shadow = panos.userid.RegisteredIpShadow(reconcile_interval=3600)
+        fw.userid.get_registered_ip = mock.Mock(return_value={"10.1.1.1": ["t"]})
+
+        fw.userid.audit_registered_ip_for_tag("t", ["10.1.1.2"])
+        fw.userid.audit_registered_ip_for_tag("t", ["10.1.1.3"])
+
+        fw.userid.get_registered_ip.assert_called_once_with(tags="t", prefix="")
+        self.assertEqual(fw.userid.shadow.registered_ip(), {"10.1.1.3": ["t"]})
+        self.assertTrue(fw.userid.shadow.needs_reconcile())
+        self.assertTrue(fw.userid.shadow.needs_reconcile(tag="other"))
+
+    def test_audit_registered_ip_chunks_messages(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw.xapi
+        fw._xapi_private.user_id = mock.Mock()
+        fw.userid.prefix = "p-"
+        current = {"10.0.0.{0}".format(x): ["p-a", "p-old"] for x in range(5)}
+        fw.userid.get_registered_ip = mock.Mock(return_value=current)
+        requested = {"10.0.0.{0}".format(x): ("a", "b") for x in range(1, 8)}
+
+        ans = fw.userid.audit_registered_ip(requested, timeout=60, chunk_size=4)
+
+        self.assertEqual(ans, {"register": 10, "unregister": 6, "messages": 4})
+        sent = [
+            ET.fromstring(x[1]["cmd"]) for x in fw._xapi_private.user_id.call_args_list
+        ]
+        self.assertEqual(len(sent), 4)
+        for msg in sent:
+            self.assertTrue(len(msg.findall(".//member")) <= 4)
+        unreg = set(
+            (e.get("ip"), m.text)
+            for msg in sent
+            for e in msg.findall("./payload/unregister/entry")
+            for m in e.findall("./tag/member")
+        )
+        reg = set(
+            (e.get("ip"), m.text)
+            for msg in sent
+            for e in msg.findall("./payload/register/entry")
+            for m in e.findall("./tag/member")
+        )
+        self.assertEqual(
+            unreg,
+            set([("10.0.0.0", "p-a"), ("10.0.0.0", "p-old")])
+            | set(("10.0.0.{0}".format(x), "p-old") for x in range(1, 5)),
+        )
+        self.assertEqual(
+            reg,
+            set(("10.0.0.{0}".format(x), "p-b") for x in range(1, 5))
+            | set(("10.0.0.{0}".format(x), "p-a") for x in range(5, 8))
+            | set(("10.0.0.{0}".format(x), "p-b") for x in range(5, 8)),
+        )
+        for msg in sent:
+            for m in msg.findall("./payload/register/entry/tag/member"):
+                self.assertEqual(m.get("timeout"), "60")
+
+    def test_audit_registered_ip_for_tag_no_changes(self):
+        fw = panos.firewall.Firewall(
+            "fw1", "user", "passwd", "authkey", serial="Serial", vsys="vsys1"
+        )
+        fw.xapi
+        fw._xapi_private.user_id = mock.Mock()
+        fw.userid.get_registered_ip = mock.Mock(
+            return_value={"10.1.1.1": ["t"], "10.1.1.2": ["t"]}
+        )
+
+        ans = fw.userid.audit_registered_ip_for_tag("t", ["10.1.1.2", "10.1.1.1"])
+
+        self.assertEqual(ans, {"register": 0, "unregister": 0, "messages": 0})
+        self.assertFalse(fw._xapi_private.user_id.called)
+
+    def test_publisher_fans_out_and_tracks_failures(self):
+        fws = []
+        for x in range(3):
+            fw = panos.firewall.Firewall(
+                "fw{0}".format(x), "user", "passwd", "authkey", vsys="vsys1"
+            )
+            fw.generate_xapi = mock.Mock(return_value=mock.Mock())
+            fws.append(fw)
+        bad = fws[1].generate_xapi.return_value
+        bad.user_id.side_effect = panos.errors.PanURLError("URLError: timed out")
+
+        with panos.userid.UserIdPublisher(fws, retry_interval=0) as publisher:
+            publisher.login("user1", "10.1.1.1")
+            publisher.batch_start()
+            publisher.register("10.1.1.1", "t1")
+            publisher.logout("user2", "10.1.1.2")
+            publisher.batch_end()
+
+        for fw in (fws[0], fws[2]):
+            calls = fw.generate_xapi.return_value.user_id.call_args_list
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(calls[0][1]["vsys"], "vsys1")
+            second = ET.fromstring(calls[1][1]["cmd"])
+            self.assertIsNotNone(second.find("./payload/register"))
+            self.assertIsNotNone(second.find("./payload/logout"))
+        # The first message and its 3 retries fail, then fw1 is given up on.
+        self.assertEqual(bad.user_id.call_count, 4)
+        self.assertEqual(publisher.failed, [fws[1]])
+        self.assertEqual(list(publisher.failures.keys()), [fws[1]])
+        self.assertEqual(len(publisher.failures[fws[1]]), 2)
+        self.assertEqual(publisher.pending(), {fws[0]: 0, fws[1]: 0, fws[2]: 0})
+
+    def test_publisher_messages_to_failed_device_go_to_failures(self):
+        fw = panos.firewall.Firewall("fw0", "user", "passwd", "authkey")
+        fw.generate_xapi = mock.Mock(return_value=mock.Mock())
+        error = panos.errors.PanURLError("URLError: timed out")
+        fw.generate_xapi.return_value.user_id.side_effect = error
+
+        with panos.userid.UserIdPublisher(
+            [fw], max_retries=1, retry_interval=0
+        ) as publisher:
+            publisher.login("user1", "10.1.1.1")
+            publisher.flush()
+            publisher.login("user2", "10.1.1.2")
+
+        self.assertEqual(fw.generate_xapi.return_value.user_id.call_count, 2)
+        self.assertEqual(len(publisher.failures[fw]), 2)
+        self.assertIs(publisher.failures[fw][1][1], error)
+
+    def test_publisher_only_has_update_methods(self):
+        fw = panos.firewall.Firewall("fw0", "user", "passwd", "authkey")
+        with panos.userid.UserIdPublisher([fw]) as publisher:
+            self.assertIsInstance(publisher, panos.userid.UserIdUpdates)
+            self.assertNotIsInstance(publisher, panos.userid.UserId)
+            self.assertFalse(hasattr(publisher, "get_registered_ip"))
+
+    def test_publisher_rejects_empty_burst(self):
+        self.assertRaises(ValueError, panos.userid.UserIdPublisher, [], burst=0)
+
+    def test_publisher_send_after_close(self):
+        fw = panos.firewall.Firewall("fw0", "user", "passwd", "authkey")
+        fw.generate_xapi = mock.Mock(return_value=mock.Mock())
+        publisher = panos.userid.UserIdPublisher([fw])
+        publisher.close()
+
+        self.assertRaises(ValueError, publisher.login, "user1", "10.1.1.1")
+        self.assertFalse(fw.generate_xapi.called)
+
 
 if __name__ == "__main__":
     unittest.main()